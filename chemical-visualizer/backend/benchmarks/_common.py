@@ -0,0 +1,91 @@
+"""Shared helpers for the backend benchmark scripts."""
+import os
+import resource
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+EQUIPMENT_TYPES = ["Pump", "Compressor", "Valve", "HeatExchanger", "Reactor", "Condenser"]
+
+# One header row plus data rows fill an Excel sheet's 1,048,576 rows
+XLSX_MAX_ROWS = 1_048_575
+
+
+def setup_django():
+    """Make the backend importable and configure Django settings"""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+
+
+def synthetic_frame(rows, start=0, seed=0):
+    """Equipment rows shaped like sample_equipment_data.csv"""
+    rng = np.random.default_rng(seed + start)
+    types = np.array(EQUIPMENT_TYPES)[rng.integers(0, len(EQUIPMENT_TYPES), rows)]
+    ids = np.arange(start + 1, start + rows + 1).astype(str)
+    return pd.DataFrame({
+        "Equipment Name": np.char.add(np.char.add(types, "-"), ids),
+        "Type": types,
+        "Flowrate": rng.normal(120, 30, rows).round(1),
+        "Pressure": rng.normal(6, 1.5, rows).round(2),
+        "Temperature": rng.normal(115, 15, rows).round(1),
+    })
+
+
+def write_synthetic_csv(path, rows, block=1_000_000):
+    """Write a synthetic equipment CSV block by block, reusing it if present"""
+    path = Path(path)
+    if path.exists():
+        return path
+    written = 0
+    with open(path, "w", newline="") as f:
+        while written < rows:
+            n = min(block, rows - written)
+            synthetic_frame(n, start=written).to_csv(f, header=(written == 0), index=False)
+            written += n
+    return path
+
+
+def write_synthetic_xlsx(path, rows, block=100_000):
+    """Write a synthetic equipment .xlsx with openpyxl's streaming writer, reusing it if present"""
+    from openpyxl import Workbook
+
+    path = Path(path)
+    if path.exists():
+        return path
+    if rows > XLSX_MAX_ROWS:
+        raise ValueError(f"an Excel sheet holds at most {XLSX_MAX_ROWS:,} data rows")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    written = 0
+    while written < rows:
+        n = min(block, rows - written)
+        df = synthetic_frame(n, start=written)
+        if not written:
+            sheet.append(list(df.columns))
+        for row in df.itertuples(index=False):
+            sheet.append(list(row))
+        written += n
+    workbook.save(path)
+    return path
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    # ru_maxrss survives exec() on Linux, so a child would inherit the
+    # parent's peak; VmHWM belongs to the current address space only.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,213 @@
+"""
+Load test the WSGI and ASGI deployments side by side while clients upload slowly.
+
+    wsgi  gunicorn core.wsgi with --workers sync workers (the current setup)
+    asgi  uvicorn core.asgi with --workers processes (async views)
+
+For --duration seconds, --slow-uploads clients keep POSTing a CSV to
+/api/upload/ at --upload-rate bytes/s, like desktop clients on a plant
+VPN, while --clients clients request /api/history/ and /api/report/<id>/
+back to back. Each server gets its own database and storage; throughput
+and latency of the fast requests show how much the slow ones hold up the
+workers. Needs gunicorn and uvicorn installed.
+
+    python benchmarks/asgi_load.py --workers 2 --slow-uploads 4 --clients 8
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from _common import BACKEND_DIR, write_synthetic_csv
+
+SERVERS = {
+    "wsgi": lambda port, workers: [
+        sys.executable, "-m", "gunicorn", "core.wsgi:application",
+        "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--timeout", "600",
+    ],
+    "asgi": lambda port, workers: [
+        sys.executable, "-m", "uvicorn", "core.asgi:application",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--no-access-log",
+    ],
+}
+BOUNDARY = "LoadTestBoundary"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare(scratch, csv_path):
+    """Migrate a fresh database, create a user with a dataset; returns (env, token, dataset id)"""
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{scratch}/load.sqlite3",
+        DATASET_STORE_DIR=f"{scratch}/datasets",
+        REPORT_CACHE_DIR=f"{scratch}/reports",
+        CHART_CACHE_DIR=f"{scratch}/charts",
+        UPLOAD_JOB_DIR=f"{scratch}/uploads",
+        REQUEST_LOG_LEVEL="WARNING",
+    )
+    script = (
+        "import sys; sys.path.insert(0, 'benchmarks'); from _common import setup_django; setup_django()\n"
+        "from django.core.management import call_command; call_command('migrate', verbosity=0)\n"
+        "from django.contrib.auth.models import User\n"
+        "from equipment_api.authentication import issue_token\n"
+        "from equipment_api.datasets import ingest_upload\n"
+        "user = User.objects.create_user('load', password='load')\n"
+        f"f = open({str(csv_path)!r}, 'rb')\n"
+        "dataset = ingest_upload(f, 'seed.csv', owner=user)\n"
+        "print(issue_token(user).key, dataset.id)\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+    token, dataset_id = proc.stdout.split()[-2:]
+    return env, token, int(dataset_id)
+
+
+def wait_until_up(port, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("server did not start")
+
+
+def multipart_body(csv_path):
+    head = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="slow.csv"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode()
+    return head + Path(csv_path).read_bytes() + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def slow_upload(port, token, body, rate, stop, done):
+    """POST the body in 4 KiB pieces at `rate` bytes/s until `stop` is set"""
+    piece = 4096
+    while not stop.is_set():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+        try:
+            conn.putrequest("POST", "/api/upload/")
+            conn.putheader("Authorization", f"Token {token}")
+            conn.putheader("Content-Type", f"multipart/form-data; boundary={BOUNDARY}")
+            conn.putheader("Content-Length", str(len(body)))
+            conn.endheaders()
+            for i in range(0, len(body), piece):
+                conn.send(body[i:i + piece])
+                time.sleep(piece / rate)
+            if conn.getresponse().status == 200:
+                done.append(1)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+
+def fast_client(port, token, paths, stop, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    i = 0
+    while not stop.is_set():
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers={"Authorization": f"Token {token}"})
+            response = conn.getresponse()
+            response.read()
+        except OSError:
+            errors.append(path)
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+            continue
+        if response.status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(response.status)
+    conn.close()
+
+
+def run(mode, args, csv_path, body):
+    with tempfile.TemporaryDirectory(dir=args.workdir) as scratch:
+        env, token, dataset_id = prepare(scratch, csv_path)
+        port = free_port()
+        server = subprocess.Popen(SERVERS[mode](port, args.workers), cwd=BACKEND_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(port, server)
+            paths = ["/api/history/?limit=10", f"/api/report/{dataset_id}/"]
+            # render the report once so every run measures the cached path
+            warmup = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+            warmup.request("GET", paths[1], headers={"Authorization": f"Token {token}"})
+            warmup.getresponse().read()
+            warmup.close()
+
+            stop = threading.Event()
+            latencies, errors, uploads = [], [], []
+            threads = [
+                threading.Thread(target=slow_upload, args=(port, token, body, args.upload_rate, stop, uploads))
+                for _ in range(args.slow_uploads)
+            ]
+            # give the slow uploads a head start so they hold the workers
+            for thread in threads:
+                thread.start()
+            time.sleep(1)
+            fast = [
+                threading.Thread(target=fast_client, args=(port, token, paths, stop, latencies, errors))
+                for _ in range(args.clients)
+            ]
+            for thread in fast:
+                thread.start()
+            time.sleep(args.duration)
+            stop.set()
+            for thread in fast + threads:
+                thread.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies.sort()
+    if latencies:
+        print(f"{mode:>5}  {len(latencies) / args.duration:8.1f} req/s  "
+              f"p50 {statistics.median(latencies) * 1000:8.1f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:8.1f} ms  "
+              f"{len(errors)} errors  {len(uploads)} slow uploads completed")
+    else:
+        print(f"{mode:>5}  no fast request completed in {args.duration}s  {len(errors)} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument("--workers", type=int, default=2, help="server worker processes")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent fast clients")
+    parser.add_argument("--slow-uploads", type=int, default=4, help="concurrent slow uploads")
+    parser.add_argument("--upload-rate", type=int, default=256 * 1024, help="bytes/s per slow upload")
+    parser.add_argument("--upload-rows", type=int, default=20_000, help="rows in the uploaded CSV")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    csv_path = write_synthetic_csv(Path(args.workdir) / f"equipment_{args.upload_rows}.csv", args.upload_rows)
+    body = multipart_body(csv_path)
+    print(f"{args.workers} workers, {args.clients} fast clients, {args.slow_uploads} uploads of "
+          f"{len(body) / 1e6:.1f} MB at {args.upload_rate / 1024:.0f} KiB/s, {args.duration:g}s")
+    for mode in args.modes:
+        run(mode, args, csv_path, body)
+
+
+if __name__ == "__main__":
+    main()
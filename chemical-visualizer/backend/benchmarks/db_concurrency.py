@@ -0,0 +1,152 @@
+"""
+Run many parallel uploads against each database profile (see core/database.py).
+
+--workers processes, like gunicorn workers, each upload --uploads distinct
+CSVs from --threads threads at once through Django's test client, so
+every upload writes a Dataset, its EquipmentRow rows and the rollups.
+Reports uploads/s, latency and failures, "database is locked" counted
+separately.
+
+SQLite profiles run against a fresh file per profile, the sqlite profile
+with SQLITE_WAL on. The postgres profile needs --postgres-url, a
+database it may migrate and write to.
+
+    python benchmarks/db_concurrency.py --profiles none sqlite
+    python benchmarks/db_concurrency.py --profiles postgres --postgres-url postgres://...
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from _common import BACKEND_DIR, setup_django, synthetic_frame
+
+
+def prepare(env):
+    """Migrate and create an uploading user; returns their token"""
+    script = (
+        "import sys; sys.path.insert(0, 'benchmarks'); from _common import setup_django; setup_django()\n"
+        "from django.core.management import call_command; call_command('migrate', verbosity=0)\n"
+        "from django.contrib.auth.models import User\n"
+        "from equipment_api.authentication import issue_token\n"
+        f"print(issue_token(User.objects.create_user('concurrency-{uuid.uuid4().hex[:8]}')).key)\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode:
+        raise SystemExit(proc.stderr.strip().splitlines()[-1])
+    return proc.stdout.split()[-1]
+
+
+def worker(token, index, threads, uploads, rows):
+    """One process's share of the uploads; prints a JSON line of outcomes"""
+    setup_django()
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    latencies, locked, errors = [], [], []
+
+    def run(thread):
+        client = Client(HTTP_AUTHORIZATION=f"Token {token}")
+        for i in range(uploads):
+            # distinct content per upload, so none is answered from the dedupe cache
+            start_row = ((index * threads + thread) * uploads + i) * rows
+            data = synthetic_frame(rows, start=start_row).to_csv(index=False).encode()
+            start = time.perf_counter()
+            try:
+                response = client.post("/api/upload/", {"file": SimpleUploadedFile("c.csv", data)})
+            except Exception as exc:
+                (locked if "database is locked" in str(exc) else errors).append(repr(exc)[:200])
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(f"{response.status_code} {response.content[:200]!r}")
+        connection.close()
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    print(json.dumps({"latencies": latencies, "locked": locked, "errors": errors}))
+
+
+def run_profile(profile, database_url, args):
+    with tempfile.TemporaryDirectory(dir=args.workdir) as scratch:
+        env = dict(
+            os.environ,
+            DATABASE_URL=database_url or f"sqlite:///{scratch}/concurrency.sqlite3",
+            DATABASE_PROFILE=profile,
+            SQLITE_WAL=str(profile == "sqlite"),
+            DATASET_STORE_DIR=f"{scratch}/datasets",
+            REQUEST_LOG_LEVEL="WARNING",
+        )
+        token = prepare(env)
+        start = time.perf_counter()
+        procs = [
+            subprocess.Popen(
+                [sys.executable, __file__, "--worker", token, str(i),
+                 "--threads", str(args.threads), "--uploads", str(args.uploads), "--rows", str(args.rows)],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            )
+            for i in range(args.workers)
+        ]
+        outcomes = []
+        for proc in procs:
+            stdout, stderr = proc.communicate()
+            if proc.returncode:
+                raise SystemExit(f"{profile}: worker failed: {stderr.strip().splitlines()[-1]}")
+            outcomes.append(json.loads(stdout.strip().splitlines()[-1]))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(t for o in outcomes for t in o["latencies"])
+    locked = [e for o in outcomes for e in o["locked"]]
+    errors = [e for o in outcomes for e in o["errors"]]
+    total = args.workers * args.threads * args.uploads
+    line = f"{profile:>9}  {len(latencies):4}/{total} ok  {len(latencies) / elapsed:6.1f} uploads/s"
+    if latencies:
+        line += (f"  p50 {statistics.median(latencies) * 1000:7.0f} ms"
+                 f"  p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.0f} ms")
+    print(f"{line}  {len(locked)} locked  {len(errors)} other errors")
+    for error in (locked + errors)[:3]:
+        print(f"           {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profiles", nargs="+", choices=("none", "sqlite", "postgres"),
+                        default=["none", "sqlite"])
+    parser.add_argument("--postgres-url", help="database for the postgres profile")
+    parser.add_argument("--workers", type=int, default=4, help="processes uploading at once")
+    parser.add_argument("--threads", type=int, default=4, help="concurrent uploads per process")
+    parser.add_argument("--uploads", type=int, default=5, help="uploads per thread")
+    parser.add_argument("--rows", type=int, default=2000, help="rows per uploaded CSV")
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        token, index = args.worker
+        worker(token, int(index), args.threads, args.uploads, args.rows)
+        return
+
+    print(f"{args.workers} processes x {args.threads} threads x {args.uploads} uploads of {args.rows:,} rows")
+    for profile in args.profiles:
+        if profile == "postgres" and not args.postgres_url:
+            print(f"{profile:>9}  skipped: pass --postgres-url")
+            continue
+        run_profile(profile, args.postgres_url if profile == "postgres" else None, args)
+
+
+if __name__ == "__main__":
+    main()
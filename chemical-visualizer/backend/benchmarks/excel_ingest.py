@@ -0,0 +1,74 @@
+"""
+Compare .xlsx parse time and peak RSS of the Excel ingestion paths.
+
+    legacy    pd.read_excel on the whole sheet (openpyxl engine)
+    openpyxl  openpyxl read-only rows streamed into the accumulator
+    calamine  python-calamine rows streamed into the accumulator
+
+Each mode runs in its own process so peak RSS is not shared.
+
+    python benchmarks/excel_ingest.py --rows 200000
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _common import peak_rss_mb, setup_django, write_synthetic_xlsx
+
+MODES = ("legacy", "openpyxl", "calamine")
+
+
+def measure(path, mode):
+    setup_django()
+    from equipment_api.ingest import iter_excel_chunks, read_excel_frame, summarize_frames
+
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        if mode == "legacy":
+            frames = [read_excel_frame(f)]
+        else:
+            frames = iter_excel_chunks(f, engine=mode)
+        summary = summarize_frames(frames)
+    elapsed = time.perf_counter() - start
+    print(f"{summary['total_equipment']} {elapsed:.3f} {peak_rss_mb():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    path = write_synthetic_xlsx(Path(args.workdir) / f"equipment_{args.rows}.xlsx", args.rows)
+    print(f"{args.rows:,} rows, best of {args.repeat}")
+    baseline = None
+    for mode in MODES:
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--measure", str(path), mode],
+                capture_output=True, text=True,
+            )
+            if proc.returncode:
+                break
+            runs.append([float(x) for x in proc.stdout.split()[1:]])
+        if not runs:
+            print(f"{mode:>9}  unavailable: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        elapsed = min(r[0] for r in runs)
+        rss = min(r[1] for r in runs)
+        baseline = baseline or elapsed
+        print(f"{mode:>9}  {elapsed:7.3f}s  x{baseline / elapsed:5.2f}  peak RSS {rss:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
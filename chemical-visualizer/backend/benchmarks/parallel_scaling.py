@@ -0,0 +1,70 @@
+"""
+Measure how byte-range parallel aggregation scales with worker count.
+
+Times the sequential streaming path, then aggregate_csv_parallel with
+1, 2, 4, ... workers up to the CPU count (pool start-up included).
+
+    python benchmarks/parallel_scaling.py --rows 5000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from _common import setup_django, write_synthetic_csv
+
+
+def default_workers():
+    cpus = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return counts
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers())
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+
+    setup_django()
+    from equipment_api.ingest import iter_csv_chunks, summarize_frames
+    from equipment_api.parallel import aggregate_csv_parallel
+
+    path = write_synthetic_csv(Path(args.workdir) / f"equipment_{args.rows}.csv", args.rows)
+    print(f"{args.rows:,} rows on {os.cpu_count()} CPUs, best of {args.repeat}")
+
+    def sequential():
+        with open(path, "rb") as f:
+            return summarize_frames(iter_csv_chunks(f))
+
+    baseline, expected = best_of(args.repeat, sequential)
+    print(f"  sequential  {baseline:7.2f}s")
+
+    for workers in args.workers:
+        elapsed, summary = best_of(args.repeat, lambda: aggregate_csv_parallel(path, workers=workers).to_summary())
+        # Partial sums are added in a different order, so allow for rounding
+        averages = ("avg_flowrate", "avg_pressure", "avg_temperature")
+        if (summary["type_distribution"] != expected["type_distribution"]
+                or any(abs(summary[k] - expected[k]) > 0.011 for k in averages)):
+            raise SystemExit(f"summary mismatch with {workers} workers: {summary}")
+        print(f"  {workers:>2} workers  {elapsed:7.2f}s  speedup x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare CSV parse time and peak RSS of the summary parsing paths.
+
+    legacy   pd.read_csv on the whole file with type inference
+    c        chunked pandas C parser, pruned columns and pinned dtypes
+    pyarrow  pyarrow streaming reader, pruned columns and pinned dtypes
+
+Each mode runs in its own process so peak RSS is not shared.
+
+    python benchmarks/parse_fastpath.py --rows 1000000
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _common import peak_rss_mb, setup_django, write_synthetic_csv
+
+MODES = ("legacy", "c", "pyarrow")
+
+
+def measure(path, mode):
+    setup_django()
+    import pandas as pd
+    from equipment_api.ingest import iter_csv_chunks, summarize_frames
+
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        if mode == "legacy":
+            frames = [pd.read_csv(f)]
+        else:
+            frames = iter_csv_chunks(f, engine=mode)
+        summary = summarize_frames(frames)
+    elapsed = time.perf_counter() - start
+    print(f"{summary['total_equipment']} {elapsed:.3f} {peak_rss_mb():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    path = write_synthetic_csv(Path(args.workdir) / f"equipment_{args.rows}.csv", args.rows)
+    print(f"{args.rows:,} rows, best of {args.repeat}")
+    for mode in MODES:
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--measure", str(path), mode],
+                capture_output=True, text=True,
+            )
+            if proc.returncode:
+                break
+            runs.append([float(x) for x in proc.stdout.split()[1:]])
+        if not runs:
+            print(f"{mode:>8}  unavailable: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        elapsed = min(r[0] for r in runs)
+        rss = min(r[1] for r in runs)
+        print(f"{mode:>8}  {elapsed:7.3f}s  peak RSS {rss:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Check that streaming CSV ingestion keeps peak memory flat.
+
+Summarizes a large synthetic file in a child process, storing its rows
+as upload does, sampling peak RSS as chunks are consumed and again after
+the anomaly stage has run over the stored rows. Fails if the peak keeps
+growing after the first 10% of rows (i.e. memory scales with file size).
+The upload view's own path is covered by UploadMemoryTests.
+
+    python benchmarks/streaming_memory.py --rows 10000000
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from _common import peak_rss_mb, setup_django, write_synthetic_csv
+
+CHECKPOINTS = (0.1, 0.5, 1.0)
+
+
+def measure(path, rows, engine, workdir):
+    setup_django()
+    from equipment_api.analysis import detect_anomalies
+    from equipment_api.ingest import ROW_COLUMNS, SummaryAccumulator, iter_csv_chunks
+    from equipment_api.rowstore import RowStore, SegmentWriter
+
+    accumulator = SummaryAccumulator()
+    rows_dir = Path(tempfile.mkdtemp(dir=workdir))
+    writer = SegmentWriter(rows_dir / "part-00000")
+    samples = []
+    pending = list(CHECKPOINTS)
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            for df in iter_csv_chunks(f, engine=engine or None, columns=ROW_COLUMNS):
+                accumulator.update(df)
+                writer.write(df)
+                while pending and accumulator.total >= pending[0] * rows:
+                    samples.append(peak_rss_mb())
+                    pending.pop(0)
+        writer.close()
+        detect_anomalies(RowStore(rows_dir))
+        samples.append(peak_rss_mb())
+    finally:
+        shutil.rmtree(rows_dir, ignore_errors=True)
+    elapsed = time.perf_counter() - start
+    summary = accumulator.to_summary()
+    print(summary["total_equipment"], f"{elapsed:.2f}", *(f"{s:.1f}" for s in samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--engine", choices=("c", "pyarrow"), default="")
+    parser.add_argument("--max-growth-mb", type=float, default=32.0)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.rows, args.engine, args.workdir)
+        return
+
+    path = write_synthetic_csv(Path(args.workdir) / f"equipment_{args.rows}.csv", args.rows)
+    cmd = [sys.executable, __file__, "--measure", str(path), "--rows", str(args.rows), "--workdir", args.workdir]
+    if args.engine:
+        cmd += ["--engine", args.engine]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.split()
+    total, elapsed = int(out[0]), float(out[1])
+    samples = [float(x) for x in out[2:]]
+
+    print(f"{total:,} rows in {elapsed:.2f}s")
+    for fraction, rss in zip(CHECKPOINTS, samples):
+        print(f"  peak RSS after {fraction:>4.0%} of rows: {rss:8.1f} MB")
+    print(f"  peak RSS after anomalies:    {samples[-1]:8.1f} MB")
+
+    growth = samples[-1] - samples[0]
+    print(f"RSS growth: {growth:.1f} MB (limit {args.max_growth_mb:.0f} MB)")
+    if growth > args.max_growth_mb:
+        sys.exit("FAIL: peak memory grows with file size")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
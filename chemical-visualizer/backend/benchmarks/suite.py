@@ -0,0 +1,343 @@
+"""
+Benchmark the upload, history and report paths and save the results as JSON.
+
+    upload   POST /api/upload/ through Django's test client, CSV and XLSX
+    history  GET /api/history/ against a Dataset table of --datasets rows
+             spread over HISTORY_OWNERS users, with the response cache off
+             so every request runs its query
+    history_cache
+             the same table behind the response cache: a cold request
+             after a data change, a warm cache hit and a warm 304
+    report   generate_equipment_report() with a cold and a warm chart cache
+
+Every measurement runs in its own process against a fresh SQLite database
+and storage directories, so timings and peak RSS are not shared. Results
+are tagged with the git commit; pass --compare with an earlier results
+file to print the change per benchmark and fail on slowdowns.
+
+    python benchmarks/suite.py --sizes 10000 1000000 --output before.json
+    python benchmarks/suite.py --sizes 10000 1000000 --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from _common import (
+    BACKEND_DIR, XLSX_MAX_ROWS, peak_rss_mb, setup_django, synthetic_frame,
+    write_synthetic_csv, write_synthetic_xlsx,
+)
+
+CASES = ("upload", "history", "history_cache", "report")
+FORMATS = ("csv", "xlsx")
+WRITERS = {"csv": write_synthetic_csv, "xlsx": write_synthetic_xlsx}
+
+# Environment of a case's measuring process beyond its scratch storage
+CASE_ENV = {
+    # Otherwise every repeat after the first is a cache hit
+    "history": {"RESPONSE_CACHE_BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+}
+# History requests timed against the large Dataset table
+HISTORY_QUERIES = {
+    "first_page": lambda mid: {"limit": 100},
+    "deep_page": lambda mid: {"limit": 100, "cursor": mid},
+    "projected": lambda mid: {"limit": 100, "fields": "id,total_equipment"},
+    "time_range": lambda mid: {"limit": 100, "uploaded_after": "2000-01-01"},
+}
+HISTORY_REPEAT = 20
+# Users the history datasets are spread over; the benchmark user is one of them
+HISTORY_OWNERS = 1000
+BOUNDARY = "BenchmarkBoundary"
+
+
+def api_client():
+    """Migrated database, a user and a test client authenticating with their token"""
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from rest_framework.authtoken.models import Token
+
+    setup_test_environment()
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("bench", password="bench")
+    token = Token.objects.create(user=user)
+    client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+    client.bench_user = user
+    return client
+
+
+def multipart_body(path, out):
+    """Write a multipart/form-data body holding `path` as the "file" field"""
+    out.write(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{path.name}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n".encode()
+    )
+    with open(path, "rb") as f:
+        shutil.copyfileobj(f, out)
+    out.write(f"\r\n--{BOUNDARY}--\r\n".encode())
+
+
+def measure_upload(path):
+    client = api_client()
+    path = Path(path)
+    # The body is streamed from disk as wsgi.input, like a real server
+    # would; the test client's own encoder holds the whole file in memory.
+    with tempfile.TemporaryFile() as body:
+        multipart_body(path, body)
+        length = body.tell()
+        body.seek(0)
+        start = time.perf_counter()
+        response = client.generic("POST", "/api/upload/", **{
+            "wsgi.input": body,
+            "CONTENT_LENGTH": str(length),
+            "CONTENT_TYPE": f"multipart/form-data; boundary={BOUNDARY}",
+        })
+        elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise SystemExit(f"upload failed: {response.status_code} {response.content[:200]!r}")
+    return [{"seconds": elapsed, "equipment": response.json()["total_equipment"]}]
+
+
+def history_client(datasets):
+    """API client of one of HISTORY_OWNERS users sharing `datasets` rows, and a cursor into theirs"""
+    from django.contrib.auth.models import User
+    from equipment_api.ingest import accumulate_frames
+    from equipment_api.models import Dataset
+
+    client = api_client()
+    User.objects.bulk_create(User(username=f"user{i}") for i in range(1, HISTORY_OWNERS))
+    owners = list(User.objects.order_by("id").values_list("id", flat=True))
+    summary = accumulate_frames([synthetic_frame(10_000)]).to_summary()
+    for start in range(0, datasets, 5000):
+        Dataset.objects.bulk_create(
+            Dataset(owner_id=owners[i % len(owners)], summary=summary)
+            for i in range(start, min(start + 5000, datasets))
+        )
+    own = Dataset.objects.filter(owner_id=client.bench_user.id).order_by("id").values_list("id", flat=True)
+    return client, own[len(own) // 2]
+
+
+def median_seconds(variant, request, status=200):
+    """Median time of HISTORY_REPEAT calls of `request`, each answered with `status`"""
+    times = []
+    for _ in range(HISTORY_REPEAT):
+        start = time.perf_counter()
+        response = request()
+        times.append(time.perf_counter() - start)
+        if response.status_code != status:
+            raise SystemExit(f"history {variant} failed: {response.status_code}")
+    return {"variant": variant, "seconds": statistics.median(times)}
+
+
+def measure_history(datasets):
+    """Each query through the database; run with the response cache off"""
+    client, mid = history_client(datasets)
+    return [
+        median_seconds(variant, lambda: client.get("/api/history/", params(mid)))
+        for variant, params in HISTORY_QUERIES.items()
+    ]
+
+
+def measure_history_cache(datasets):
+    from equipment_api.response_cache import bump_data_version
+
+    client, _ = history_client(datasets)
+    page = {"limit": 100}
+    # Rebuilt and stored after every change, then a repeat and a refresh
+    # revalidating its ETag
+    results = [median_seconds("cold", lambda: (
+        bump_data_version(client.bench_user.id), client.get("/api/history/", page),
+    )[1])]
+    etag = client.get("/api/history/", page)["ETag"]
+    results.append(median_seconds("warm", lambda: client.get("/api/history/", page)))
+    results.append(median_seconds(
+        "not_modified", lambda: client.get("/api/history/", page, HTTP_IF_NONE_MATCH=etag), 304,
+    ))
+    return results
+
+
+def measure_report(rows, workdir):
+    from equipment_api.datasets import ingest_upload
+    from equipment_api.pdf_generator import generate_equipment_report
+
+    api_client()
+    path = write_synthetic_csv(Path(workdir) / f"equipment_{rows}.csv", rows)
+    with open(path, "rb") as f:
+        dataset = ingest_upload(f, path.name, path=str(path))
+
+    results = []
+    for variant in ("cold", "warm"):
+        start = time.perf_counter()
+        pdf = generate_equipment_report(dataset.summary, dataset.id)
+        results.append({
+            "variant": variant,
+            "seconds": time.perf_counter() - start,
+            "bytes": len(pdf.getvalue()),
+        })
+    return results
+
+
+def measure(case, rows, fmt, workdir):
+    setup_django()
+    if case == "upload":
+        results = measure_upload(Path(workdir) / f"equipment_{rows}.{fmt}")
+    elif case == "history":
+        results = measure_history(rows)
+    elif case == "history_cache":
+        results = measure_history_cache(rows)
+    else:
+        results = measure_report(rows, workdir)
+    peak = peak_rss_mb()
+    for result in results:
+        result["peak_rss_mb"] = peak
+    print(json.dumps(results))
+
+
+def run_child(case, rows, fmt, workdir):
+    """Run one measurement in a fresh process with its own database and storage"""
+    with tempfile.TemporaryDirectory(dir=workdir) as scratch:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{scratch}/bench.sqlite3",
+            DATASET_STORE_DIR=f"{scratch}/datasets",
+            REPORT_CACHE_DIR=f"{scratch}/reports",
+            CHART_CACHE_DIR=f"{scratch}/charts",
+            RESPONSE_CACHE_LOCATION=f"{scratch}/responses",
+            **CASE_ENV.get(case, {}),
+        )
+        proc = subprocess.run(
+            [sys.executable, __file__, "--measure", case, str(rows), fmt, "--workdir", workdir],
+            capture_output=True, text=True, env=env,
+        )
+    if proc.returncode:
+        raise SystemExit(f"{case} {fmt} {rows}: {proc.stderr.strip().splitlines()[-1]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def result_key(result):
+    return (result["case"], result.get("variant", ""), result.get("format", ""), result["rows"])
+
+
+def describe(key):
+    case, variant, fmt, rows = key
+    return " ".join(part for part in (case, variant, fmt, f"{rows:,}") if part)
+
+
+def compare(results, baseline_path, threshold):
+    """Print each benchmark's change against a baseline; True if any slowed past threshold"""
+    with open(baseline_path) as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"] if "seconds" in r}
+    regressed = False
+    print(f"\nagainst {baseline_path}")
+    for result in results:
+        before = baseline.get(result_key(result))
+        if before is None or "seconds" not in result:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        flag = "  SLOWER" if ratio > threshold else ""
+        regressed |= bool(flag)
+        print(f"  {describe(result_key(result)):<36} x{ratio:5.2f} time  "
+              f"{result['peak_rss_mb'] - before['peak_rss_mb']:+8.1f} MB{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000],
+                        help="rows per uploaded file")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--datasets", type=int, default=100_000,
+                        help="Dataset rows for the history benchmark")
+    parser.add_argument("--report-rows", type=int, default=10_000,
+                        help="rows of the dataset the report is generated for")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--output", help="results file (default bench-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="time ratio above which --compare reports a regression")
+    parser.add_argument("--measure", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        case, rows, fmt = args.measure
+        measure(case, int(rows), fmt, args.workdir)
+        return
+
+    runs = []
+    if "upload" in args.cases:
+        for fmt in args.formats:
+            for rows in args.sizes:
+                runs.append(("upload", rows, fmt))
+    for case in ("history", "history_cache"):
+        if case in args.cases:
+            runs.append((case, args.datasets, ""))
+    if "report" in args.cases:
+        runs.append(("report", args.report_rows, ""))
+
+    results = []
+    for case, rows, fmt in runs:
+        if fmt == "xlsx" and rows > XLSX_MAX_ROWS:
+            results.append({"case": case, "format": fmt, "rows": rows,
+                            "skipped": f"an Excel sheet holds at most {XLSX_MAX_ROWS:,} data rows"})
+            print(f"  {describe((case, '', fmt, rows)):<36} skipped")
+            continue
+        if fmt:
+            WRITERS[fmt](Path(args.workdir) / f"equipment_{rows}.{fmt}", rows)
+
+        best = {}
+        for _ in range(args.repeat):
+            for measured in run_child(case, rows, fmt, args.workdir):
+                key = measured.get("variant", "")
+                if key not in best or measured["seconds"] < best[key]["seconds"]:
+                    best[key] = measured
+        for measured in best.values():
+            result = {"case": case, **({"format": fmt} if fmt else {}), "rows": rows, **measured}
+            results.append(result)
+            print(f"  {describe(result_key(result)):<36} {result['seconds']:9.4f}s  "
+                  f"peak RSS {result['peak_rss_mb']:7.1f} MB")
+
+    commit = git_commit()
+    output = Path(args.output or f"bench-{(commit or 'unknown')[:12]}.json")
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+            "results": results,
+        }, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Load test token authentication: queries and latency per authenticated request.
+
+    drf     rest_framework's TokenAuthentication (Token + User join per request)
+    cached  equipment_api's CachedTokenAuthentication
+
+--users clients, each with its own token, send --requests GET /api/history/
+calls round-robin from --concurrency threads. With more users than
+TOKEN_CACHE_MAX_ENTRIES the LRU cache starts missing, which shows up as
+token queries per request above zero.
+
+    python benchmarks/token_auth.py --users 200 --requests 5000 --concurrency 8
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import setup_django
+
+MODES = ("drf", "cached")
+
+
+class QueryCounter:
+    """execute_wrapper counting all queries and those against the token table"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.token_queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.queries += 1
+            self.token_queries += 'authtoken_token' in sql
+        return execute(sql, params, many, context)
+
+
+def setup(users):
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+    from equipment_api.authentication import issue_token
+
+    setup_test_environment()
+    call_command("migrate", verbosity=0)
+    User.objects.bulk_create(User(username=f"load{i}") for i in range(users))
+    return [issue_token(user).key for user in User.objects.order_by("id")]
+
+
+def run(mode, keys, requests, concurrency):
+    from django.db import connection
+    from django.test import Client
+    from equipment_api.authentication import CachedTokenAuthentication, token_cache
+    from equipment_api.views import HistoryView
+    from rest_framework.authentication import TokenAuthentication
+
+    HistoryView.authentication_classes = [
+        TokenAuthentication if mode == "drf" else CachedTokenAuthentication
+    ]
+    token_cache().clear()
+    counter = QueryCounter()
+    latencies = []
+    failures = []
+
+    def worker(offset):
+        client = Client()
+        with connection.execute_wrapper(counter):
+            for i in range(offset, requests, concurrency):
+                start = time.perf_counter()
+                response = client.get("/api/history/", {"limit": 10},
+                                      HTTP_AUTHORIZATION=f"Token {keys[i % len(keys)]}")
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+        connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    if failures:
+        raise SystemExit(f"{mode}: {len(failures)} failed requests, e.g. {failures[0]}")
+
+    latencies.sort()
+    print(f"{mode:>7}  {requests / elapsed:8.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:6.2f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f} ms  "
+          f"{counter.queries / requests:5.2f} queries/req  "
+          f"{counter.token_queries / requests:5.2f} token queries/req")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ["DATABASE_URL"] = f"sqlite:///{scratch}/load.sqlite3"
+        os.environ.setdefault("REQUEST_LOG_LEVEL", "WARNING")
+        setup_django()
+        keys = setup(args.users)
+        print(f"{args.users} users, {args.requests} requests, {args.concurrency} threads")
+        for mode in args.modes:
+            run(mode, keys, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
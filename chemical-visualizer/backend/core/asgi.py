@@ -0,0 +1,7 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Serve upload, history and report from their async views
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+application = get_asgi_application()
@@ -0,0 +1,61 @@
+"""
+Database performance profiles, applied on top of the DATABASE_URL config.
+
+    sqlite    a busy timeout and IMMEDIATE transactions on every new
+              connection: writers wait for the lock in turn instead of
+              failing with "database is locked". With SQLITE_WAL also the
+              WAL journal and synchronous=NORMAL, so readers no longer
+              block the writer; WAL is a property of the database file
+              and stays on once set, hence opt-in
+    postgres  Django's psycopg 3 connection pool in each worker process,
+              checking a connection's health before handing it out
+    none      the config as dj_database_url builds it
+    auto      sqlite or postgres, whichever matches the engine
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+PROFILES = ('auto', 'none', 'sqlite', 'postgres')
+
+
+def sqlite_profile(config, busy_timeout, wal=False):
+    options = config.setdefault('OPTIONS', {})
+    # Executed by Django on each connection it opens. synchronous=NORMAL
+    # is only durable enough with the WAL journal.
+    pragmas = ['PRAGMA journal_mode=WAL;', 'PRAGMA synchronous=NORMAL;'] if wal else []
+    pragmas.append(f'PRAGMA busy_timeout={int(busy_timeout * 1000)};')
+    options.setdefault('init_command', ''.join(pragmas))
+    # Take the write lock at BEGIN: a deferred transaction that reads and
+    # then writes cannot wait for the lock and fails at once when another
+    # connection holds it
+    options.setdefault('transaction_mode', 'IMMEDIATE')
+    return config
+
+
+def postgres_profile(config, min_size, max_size, timeout):
+    config.setdefault('OPTIONS', {})['pool'] = {
+        'min_size': min_size,
+        'max_size': max_size,
+        # seconds a request waits for a free connection before failing
+        'timeout': timeout,
+    }
+    # The pool keeps connections open; Django must hand them back after
+    # each request rather than hold them itself
+    config['CONN_MAX_AGE'] = 0
+    # With a pool, Django has psycopg_pool check each connection on checkout
+    config['CONN_HEALTH_CHECKS'] = True
+    return config
+
+
+def apply_profile(config, profile, *, sqlite_busy_timeout, sqlite_wal=False, pool_min_size, pool_max_size,
+                  pool_timeout):
+    """`config` (one DATABASES entry) tuned for `profile`, one of PROFILES"""
+    engine = config.get('ENGINE', '')
+    if profile == 'auto':
+        profile = 'sqlite' if engine.endswith('sqlite3') else 'postgres' if engine.endswith('postgresql') else 'none'
+    if profile == 'sqlite' and engine.endswith('sqlite3'):
+        return sqlite_profile(config, sqlite_busy_timeout, sqlite_wal)
+    if profile == 'postgres' and engine.endswith('postgresql'):
+        return postgres_profile(config, pool_min_size, pool_max_size, pool_timeout)
+    if profile == 'none':
+        return config
+    raise ImproperlyConfigured(f"DATABASE_PROFILE={profile!r} does not apply to {engine or 'this database'}")
@@ -1,7 +1,10 @@
 import os
+import tempfile
 import dj_database_url
 from pathlib import Path
 
+from .database import apply_profile
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-123456')
@@ -26,12 +29,14 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'equipment_api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 }
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware too
+    'equipment_api.timing.RequestTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -44,6 +49,7 @@ MIDDLEWARE = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['Link', 'Server-Timing', 'X-Profile']
 
 ROOT_URLCONF = 'core.urls'
 
@@ -65,16 +71,173 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
+# Performance profile for the database (see core/database.py): auto,
+# sqlite (busy timeout, optionally WAL), postgres (connection pool) or none
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'auto')
+# Seconds an SQLite writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '20'))
+# Switch SQLite databases to the WAL journal. Permanent for the file (and
+# leaves -wal/-shm files beside it), so off for the development database
+SQLITE_WAL = os.environ.get('SQLITE_WAL', 'False') == 'True'
+# Connections each worker process's Postgres pool keeps open / may open
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+# Seconds a request waits for a pooled connection
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
 DATABASES = {
-    'default': dj_database_url.config(
-        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600
+    'default': apply_profile(
+        dj_database_url.config(
+            default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+            conn_max_age=600
+        ),
+        DATABASE_PROFILE,
+        sqlite_busy_timeout=SQLITE_BUSY_TIMEOUT,
+        sqlite_wal=SQLITE_WAL,
+        pool_min_size=DB_POOL_MIN_SIZE,
+        pool_max_size=DB_POOL_MAX_SIZE,
+        pool_timeout=DB_POOL_TIMEOUT,
     )
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Summaries keyed by upload content hash; point SUMMARY_CACHE_BACKEND at
+    # a shared backend (e.g. Redis) when running several workers.
+    'summaries': {
+        'BACKEND': os.environ.get('SUMMARY_CACHE_BACKEND', 'equipment_api.cache.LRUCache'),
+        'LOCATION': os.environ.get('SUMMARY_CACHE_LOCATION', 'equipment-summaries'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('SUMMARY_CACHE_MAX_ENTRIES', '1024')),
+        },
+    },
+    # Auth token -> user for CachedTokenAuthentication. Per process, so a
+    # token revoked on another worker is honoured for up to TOKEN_CACHE_TTL
+    # seconds; a shared backend makes revocation immediate everywhere.
+    'tokens': {
+        'BACKEND': os.environ.get('TOKEN_CACHE_BACKEND', 'equipment_api.cache.LRUCache'),
+        'LOCATION': os.environ.get('TOKEN_CACHE_LOCATION', 'api-tokens'),
+        'TIMEOUT': int(os.environ.get('TOKEN_CACHE_TTL', '300')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+    # Rendered read responses (see equipment_api/response_cache.py). On disk
+    # so every worker on the host sees a version bump at once; use a shared
+    # backend (e.g. Redis) when running on several hosts, or DummyCache to
+    # turn response caching and ETags off. Outside the source tree by
+    # default; point RESPONSE_CACHE_LOCATION at a persistent directory.
+    'responses': {
+        'BACKEND': os.environ.get(
+            'RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'chemical-visualizer-responses')),
+        'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TTL', '3600')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+}
+SUMMARY_CACHE_ALIAS = 'summaries'
+TOKEN_CACHE_ALIAS = 'tokens'
+RESPONSE_CACHE_ALIAS = 'responses'
+# Seconds an auth token is valid after it is issued (0: forever); logging
+# in after that issues a new one
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', str(7 * 24 * 3600)))
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'Asia/Kolkata'
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Rows per chunk when streaming CSV uploads through the summary accumulator
+EQUIPMENT_CSV_CHUNKSIZE = int(os.environ.get('EQUIPMENT_CSV_CHUNKSIZE', '100000'))
+# Summarize CSV uploads while the request body arrives, with no temp file.
+# Off, the body is spooled and hashed on the way in and only parsed if its
+# hash is new, so a repeat upload of a hot file skips pandas entirely (and
+# big files can use AGGREGATION_WORKERS); on, every upload is parsed,
+# repeats included, which only pays off for slow clients sending new files
+UPLOAD_STREAMING = os.environ.get('UPLOAD_STREAMING', 'False') == 'True'
+# Rows per chunk when streaming Excel uploads (see iter_excel_chunks)
+EQUIPMENT_EXCEL_CHUNKSIZE = int(os.environ.get('EQUIPMENT_EXCEL_CHUNKSIZE', '50000'))
+# Bytes per record batch when pyarrow is installed and parses CSV uploads;
+# its reader buffers some 35 blocks ahead, so peak memory is about 35x this
+EQUIPMENT_CSV_BLOCK_SIZE = int(os.environ.get('EQUIPMENT_CSV_BLOCK_SIZE', str(4 * 1024 * 1024)))
+
+# Uploads posted with ?async=1 are saved here and summarized by a pool of
+# UPLOAD_JOB_WORKERS processes per web worker
+UPLOAD_JOB_DIR = Path(os.environ.get('UPLOAD_JOB_DIR', BASE_DIR / 'uploads'))
+UPLOAD_JOB_WORKERS = int(os.environ.get('UPLOAD_JOB_WORKERS', '2'))
+# Seconds without progress after which a job is taken to be lost with its
+# web worker: pending jobs are resubmitted, running ones failed
+UPLOAD_JOB_STALE_AFTER = int(os.environ.get('UPLOAD_JOB_STALE_AFTER', '600'))
+
+# Large CSVs on disk are split into byte ranges and aggregated by this many
+# processes (1 disables the parallel path)
+AGGREGATION_WORKERS = int(os.environ.get('AGGREGATION_WORKERS', os.cpu_count() or 1))
+AGGREGATION_MIN_BYTES = int(os.environ.get('AGGREGATION_MIN_BYTES', str(64 * 1024 * 1024)))
+AGGREGATION_PARTS_PER_WORKER = int(os.environ.get('AGGREGATION_PARTS_PER_WORKER', '2'))
+
+# Rendered PDF reports, one file per dataset id and summary hash
+REPORT_CACHE_DIR = Path(os.environ.get('REPORT_CACHE_DIR', BASE_DIR / 'reports'))
+# Upper bound on datasets in one /api/reports/ bulk export
+BULK_REPORT_MAX_DATASETS = int(os.environ.get('BULK_REPORT_MAX_DATASETS', '200'))
+# Render the report as soon as an async upload job finishes
+REPORT_PRERENDER = os.environ.get('REPORT_PRERENDER', 'False') == 'True'
+
+# Largest page /api/history/ will return
+HISTORY_MAX_LIMIT = int(os.environ.get('HISTORY_MAX_LIMIT', '100'))
+# Most buckets /api/trends/ will return in one response
+TRENDS_MAX_BUCKETS = int(os.environ.get('TRENDS_MAX_BUCKETS', '1000'))
+# Keep each upload's rows as memory-mappable columns for re-analysis
+DATASET_STORE_ROWS = os.environ.get('DATASET_STORE_ROWS', 'True') == 'True'
+# Where the stored rows live, one directory per dataset
+DATASET_STORE_DIR = Path(os.environ.get('DATASET_STORE_DIR', BASE_DIR / 'datasets'))
+# Also load stored rows into EquipmentRow for /api/datasets/<id>/equipment/
+# (needs DATASET_STORE_ROWS)
+EQUIPMENT_ROWS_IN_DB = os.environ.get('EQUIPMENT_ROWS_IN_DB', 'True') == 'True'
+# Rows per INSERT/COPY batch when loading EquipmentRow
+EQUIPMENT_ROW_BATCH_SIZE = int(os.environ.get('EQUIPMENT_ROW_BATCH_SIZE', '5000'))
+# Largest page /api/datasets/<id>/equipment/ will return
+EQUIPMENT_MAX_LIMIT = int(os.environ.get('EQUIPMENT_MAX_LIMIT', '1000'))
+# Flag equipment outside per-type robust bounds at upload (needs DATASET_STORE_ROWS)
+ANOMALY_DETECTION = os.environ.get('ANOMALY_DETECTION', 'True') == 'True'
+# 'iqr' (Tukey fences) or 'mad' (median absolute deviation)
+ANOMALY_METHOD = os.environ.get('ANOMALY_METHOD', 'iqr')
+# Rows the anomaly stage reads at a time; its memory is a few arrays of
+# this length plus a quantile sketch per type and column
+ANOMALY_BLOCK_ROWS = int(os.environ.get('ANOMALY_BLOCK_ROWS', str(256 * 1024)))
+# Rendered chart images (PNG/SVG), keyed by chart data and size
+CHART_CACHE_DIR = Path(os.environ.get('CHART_CACHE_DIR', BASE_DIR / 'charts'))
+# Largest width or height in pixels a chart may be requested at
+CHART_MAX_SIZE = int(os.environ.get('CHART_MAX_SIZE', '2000'))
+# Route upload, history and report to their async views (on by default
+# under core.asgi, where they free the worker while clients are slow)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+# Threads the async views run multipart parsing, pandas and file reads on
+ASYNC_VIEW_WORKERS = int(os.environ.get('ASYNC_VIEW_WORKERS', '4'))
+# Per-phase durations in a Server-Timing header on every response
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'True') == 'True'
+# Where ?profile=1 requests from staff users write their cProfile dumps
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', BASE_DIR / 'profiles'))
+
+# One JSON line per request on stderr; REQUEST_LOG_LEVEL=WARNING silences them
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'equipment_api.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
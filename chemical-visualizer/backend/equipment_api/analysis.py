@@ -0,0 +1,193 @@
+import numpy as np
+from django.conf import settings
+
+from .ingest import NUMERIC_COLUMNS
+from .sketches import KLLSketch
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def _round(value):
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+def describe_values(values, percentiles):
+    """count/mean/std/min/max and the requested percentiles of one column"""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {"count": 0, "mean": None, "std": None, "min": None, "max": None,
+                "percentiles": {f"p{p:g}": None for p in percentiles}}
+    quantiles = np.percentile(values, percentiles)
+    return {
+        "count": int(len(values)),
+        "mean": _round(values.mean()),
+        "std": _round(values.std()),
+        "min": _round(values.min()),
+        "max": _round(values.max()),
+        "percentiles": {f"p{p:g}": _round(q) for p, q in zip(percentiles, quantiles)},
+    }
+
+
+def describe_rows(store, percentiles=DEFAULT_PERCENTILES, eq_type=None):
+    """
+    Per-column statistics over a dataset's stored rows, optionally limited
+    to one equipment type. Columns are read straight from the memory-mapped
+    segments; only the filtered copy of one column is held at a time.
+    """
+    mask = None if eq_type is None else store.type_mask(eq_type)
+    columns = {}
+    for col in NUMERIC_COLUMNS:
+        values = store.column(col)
+        if mask is not None:
+            values = values[mask]
+        columns[col] = describe_values(np.asarray(values), percentiles)
+    return columns
+
+
+def group_rows(codes, groups):
+    """
+    Row order that puts each type code 0..groups-1 together, with every
+    group's (start, end) in that order. Blank types (-1) sort first and
+    fall outside every group.
+    """
+    # small integer keys let numpy use a radix sort
+    keys = codes.astype(np.int16) if groups < 2 ** 15 else codes
+    order = np.argsort(keys, kind='stable')
+    ordered = keys[order]
+    starts = np.searchsorted(ordered, np.arange(groups), side='left')
+    ends = np.searchsorted(ordered, np.arange(groups), side='right')
+    return order, starts, ends
+
+
+def type_sketches(store, types, block_rows, deviation_from=None):
+    """
+    One KLLSketch per column and type code over every stored row, read
+    block_rows at a time. With deviation_from (per column, a center per
+    type) the sketches hold each value's absolute distance from its type's
+    center instead.
+    """
+    sketches = {col: [KLLSketch() for _ in types] for col in NUMERIC_COLUMNS}
+    for codes, columns in store.iter_blocks(block_rows):
+        order, starts, ends = group_rows(codes, len(types))
+        for col in NUMERIC_COLUMNS:
+            values = np.asarray(columns[col])[order]
+            if deviation_from is not None:
+                # blank types (-1) fall outside every group; any center will do
+                values = np.abs(values - deviation_from[col][np.maximum(codes[order], 0)])
+            for i, (start, end) in enumerate(zip(starts, ends)):
+                if end > start:
+                    sketches[col][i].update(values[start:end])
+    return sketches
+
+
+def sketch_quantiles(sketch, fractions):
+    """Values at `fractions` of a sketch's rank, NaN if it is empty"""
+    if not sketch.n:
+        return np.full(len(fractions), np.nan)
+    if len(sketch.levels) == 1:
+        # never compacted, so it holds every value: exact, as np.quantile
+        return np.quantile(sketch.levels[0], fractions)
+    return np.array(sketch.quantiles(fractions))
+
+
+def robust_bounds(store, types, method, block_rows):
+    """
+    Per column, per-type (low, high) bounds outside which a value is an
+    anomaly.
+
+    iqr: Tukey fences, [Q1 - 1.5 IQR, Q3 + 1.5 IQR].
+    mad: median +/- 3.5 scaled MADs (Iglewicz & Hoaglin); types whose
+    MAD is zero get no bounds, since any deviation would be flagged.
+
+    Quantiles come from per-type KLL sketches built a block at a time
+    (two passes for mad), so memory does not grow with the row count.
+    They are exact for a type with up to a few hundred values and within
+    about 1% of rank beyond that.
+    """
+    sketches = type_sketches(store, types, block_rows)
+    bounds = {}
+    if method == 'mad':
+        medians = {col: np.array([sketch_quantiles(s, [0.5])[0] for s in sketches[col]]) for col in NUMERIC_COLUMNS}
+        deviations = type_sketches(store, types, block_rows, deviation_from=medians)
+        for col in NUMERIC_COLUMNS:
+            mad = 1.4826 * np.array([sketch_quantiles(s, [0.5])[0] for s in deviations[col]])
+            spread = np.where(mad > 0, 3.5 * mad, np.inf)
+            # a type without values keeps NaN bounds, which flag nothing
+            spread[np.isnan(mad)] = np.nan
+            bounds[col] = (medians[col] - spread, medians[col] + spread)
+    else:
+        for col in NUMERIC_COLUMNS:
+            quartiles = np.array([sketch_quantiles(s, [0.25, 0.75]) for s in sketches[col]]).reshape(-1, 2)
+            q1, q3 = quartiles[:, 0], quartiles[:, 1]
+            bounds[col] = (q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1))
+    return bounds
+
+
+def flag_outside(values, codes, low, high):
+    """Boolean mask of rows whose value lies outside their group's bounds"""
+    if not len(low):
+        return np.zeros(len(values), dtype=bool)
+    known = codes >= 0
+    # blank types have no bounds; index 0 is just a placeholder for them
+    safe = np.where(known, codes, 0)
+    return known & ((values < low[safe]) | (values > high[safe]))
+
+
+def _bound(value):
+    # None stands for "unbounded" (or no values to bound) in JSON
+    return float(value) if np.isfinite(value) else None
+
+
+def detect_anomalies(store, method='iqr', block_rows=None):
+    """
+    Flag rows outside per-type robust bounds in every numeric column.
+
+    Bounds come from robust_bounds(); a last pass over the rows, block by
+    block, compares each value against the bounds gathered by its type
+    code and counts the flags. Memory is a few arrays of block_rows
+    (ANOMALY_BLOCK_ROWS) values, however many rows are stored. Returns
+    the summary block stored under "anomalies" in the dataset summary.
+    """
+    block_rows = block_rows or settings.ANOMALY_BLOCK_ROWS
+    types = store.types
+    limits = robust_bounds(store, types, method, block_rows)
+    total = 0
+    by_column = dict.fromkeys(NUMERIC_COLUMNS, 0)
+    per_type_rows = np.zeros(len(types), dtype=np.int64)
+    per_type_column = {col: np.zeros(len(types), dtype=np.int64) for col in NUMERIC_COLUMNS}
+    for codes, columns in store.iter_blocks(block_rows):
+        any_flag = np.zeros(len(codes), dtype=bool)
+        for col in NUMERIC_COLUMNS:
+            flagged = flag_outside(np.asarray(columns[col]), codes, *limits[col])
+            any_flag |= flagged
+            by_column[col] += int(flagged.sum())
+            per_type_column[col] += np.bincount(codes[flagged], minlength=len(types))
+        total += int(any_flag.sum())
+        per_type_rows += np.bincount(codes[any_flag], minlength=len(types))
+
+    return {
+        "method": method,
+        "total": total,
+        "by_column": by_column,
+        "by_type": {
+            eq_type: {"rows": int(per_type_rows[i]), **{col: int(per_type_column[col][i]) for col in NUMERIC_COLUMNS}}
+            for i, eq_type in enumerate(types)
+        },
+        "bounds": {
+            eq_type: {col: [_bound(limits[col][0][i]), _bound(limits[col][1][i])] for col in NUMERIC_COLUMNS}
+            for i, eq_type in enumerate(types)
+        },
+    }
+
+
+def anomaly_mask(store, bounds):
+    """Recompute per-column flags for stored rows from saved bounds"""
+    types = store.types
+    codes = np.asarray(store.type_codes())
+    flags = {}
+    for col in NUMERIC_COLUMNS:
+        pairs = [bounds.get(t, {}).get(col) or [None, None] for t in types]
+        low = np.array([-np.inf if lo is None else lo for lo, _ in pairs], dtype=float)
+        high = np.array([np.inf if hi is None else hi for _, hi in pairs], dtype=float)
+        flags[col] = flag_outside(np.asarray(store.column(col)), codes, low, high)
+    return flags
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class EquipmentApiConfig(AppConfig):
+    name = 'equipment_api'
+
+    def ready(self):
+        # Connects the signal receivers (cached tokens dropped on logout and
+        # rotation, response cache versions bumped on dataset changes, query
+        # timing on new DB connections) in every process, job workers too
+        from . import authentication, response_cache, timing  # noqa: F401
@@ -0,0 +1,168 @@
+"""
+Async versions of the upload, history and report views, routed instead of
+the sync ones when ASYNC_VIEWS is on (the default under core.asgi).
+
+Under ASGI a request only holds a thread while it has work to do: waiting
+on a slow client or the database happens on the event loop. The blocking
+parts that are left (multipart parsing and pandas summarization, hashing,
+file reads) run on a pool of ASYNC_VIEW_WORKERS threads, so a burst of
+uploads queues there instead of starting a thread each; report rendering
+goes to the existing process pool (parallel.get_executor), which keeps
+ReportLab off this process's GIL.
+"""
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, parse_etags
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .cache import summary_cache, summary_cache_key
+from .models import Dataset
+from .parallel import get_executor as get_process_executor
+from .reports import render_report_file, report_etag, report_path
+from .timing import timed
+from .views import GeneratePDFView, HistoryView, UploadCSV, _owned_datasets
+
+_executor = None
+
+
+def get_executor():
+    """Threads the async views hand blocking work to, created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_VIEW_WORKERS, thread_name_prefix='async-view',
+        )
+    return _executor
+
+
+def _in_worker(func):
+    # Pool threads outlive requests, so they recycle their DB connections
+    # the way the request_started/finished signals do for request threads
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return run
+
+
+async def offload(func, *args, **kwargs):
+    """Run blocking `func` on the bounded pool, in the request's context (timed phases)"""
+    return await sync_to_async(_in_worker(func), thread_sensitive=False, executor=get_executor())(
+        *args, **kwargs
+    )
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines.
+
+    DRF's dispatch is synchronous, so this one awaits the handler and runs
+    authentication and permission checks, which may query the database,
+    in a thread. Finalizing the response renders it and, for cached views,
+    writes it to the response cache, so that runs on the pool too.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            # OPTIONS is answered by APIView's sync handler
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = await offload(self.finalize_response, request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncHistoryView(AsyncAPIView, HistoryView):
+    """HistoryView with the page fetched through the async ORM"""
+
+    async def get(self, request):
+        cached = await offload(self.cached_response, request)
+        if cached is not None:
+            return cached
+        page = self.page(request)
+        if isinstance(page, Response):
+            return page
+        queryset, fields, limit = page
+        rows = [row async for row in queryset]
+        return self.page_response(request, rows, fields, limit)
+
+
+class AsyncUploadCSV(AsyncAPIView, UploadCSV):
+    """UploadCSV with parsing and summarizing on the bounded pool"""
+
+    async def post(self, request):
+        file = await offload(self.receive, request)
+        if isinstance(file, Response):
+            return file
+        if request.query_params.get('append'):
+            return await offload(self.append, request, file)
+
+        content_hash = await offload(self.content_hash, file)
+        cache = summary_cache()
+        cache_key = summary_cache_key(content_hash, request.user.id)
+
+        with timed('cache'):
+            summary = await cache.aget(cache_key)
+        if summary is None:
+            summary = await self.stored_summaries(request, content_hash).afirst()
+        if summary is not None:
+            self.discard(file)
+        else:
+            summary = await offload(self.summarize, request, file, content_hash)
+            if isinstance(summary, Response):
+                return summary
+
+        await cache.aset(cache_key, summary)
+        return Response(summary)
+
+
+class AsyncGeneratePDFView(AsyncAPIView, GeneratePDFView):
+    """GeneratePDFView rendering on the process pool"""
+
+    async def get(self, request, dataset_id):
+        try:
+            dataset = await _owned_datasets(request).aget(id=dataset_id)
+        except Dataset.DoesNotExist:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        etag = report_etag(dataset)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        path = report_path(dataset)
+        if not path.exists():
+            await asyncio.wrap_future(get_process_executor().submit(
+                render_report_file, dataset.summary, dataset.id, str(path),
+            ))
+        # Read whole rather than as a FileResponse: under ASGI Django would
+        # buffer a sync file iterator anyway, and reports are small
+        pdf = await offload(path.read_bytes)
+        return HttpResponse(pdf, content_type='application/pdf', headers={
+            'Content-Disposition': content_disposition_header(True, f"equipment_report_{dataset_id}.pdf"),
+            'ETag': etag,
+        })
@@ -2,9 +2,12 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 
+from .authentication import issue_token
+
 
 class RegisterView(APIView):
     """User registration endpoint"""
@@ -31,7 +34,7 @@ class RegisterView(APIView):
             password=password,
             email=email
         )
-        token, _ = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         
         return Response({
             'message': 'User registered successfully',
@@ -62,7 +65,7 @@ class LoginView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
-        token, _ = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         
         return Response({
             'message': 'Login successful',
@@ -70,3 +73,13 @@ class LoginView(APIView):
             'user_id': user.id,
             'username': user.username
         })
+
+
+class LogoutView(APIView):
+    """Revoke the user's auth token; the next login issues a new one"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # Deleting through the ORM also drops the token from the auth cache
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,83 @@
+"""
+Token authentication that keeps recently used tokens in memory.
+
+DRF's TokenAuthentication joins Token and User on every request, and the
+clients send their token with every refresh, upload and download.
+CachedTokenAuthentication keeps token -> (token, user) in the "tokens"
+cache, a bounded LRUCache whose entries live TOKEN_CACHE_TTL seconds, and
+only queries the database on a miss.
+
+Deleting a token (logout, rotation of an expired token) or saving its user
+drops the entry in this process. Other workers with their own in-process
+cache still accept a revoked token for up to TOKEN_CACHE_TTL; point
+TOKEN_CACHE_BACKEND at a shared cache to close that window.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def token_cache():
+    return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def token_cache_key(key):
+    return f"token:{key}"
+
+
+def token_expired(token):
+    return bool(settings.TOKEN_TTL) and token.created + timedelta(seconds=settings.TOKEN_TTL) <= timezone.now()
+
+
+def issue_token(user):
+    """The user's token, replaced by a fresh one once it has expired"""
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and token_expired(token):
+        token.delete()
+        token = Token.objects.create(user=user)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication with expiry, backed by the "tokens" cache"""
+
+    def authenticate_credentials(self, key):
+        cache = token_cache()
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            if token.user.is_active and not token_expired(token):
+                # pickled with the user it was selected with
+                cache.set(cache_key, token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        if token_expired(token):
+            token.delete()
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        return (token.user, token)
+
+
+@receiver(post_delete, sender=Token)
+def _forget_token(sender, instance, **kwargs):
+    token_cache().delete(token_cache_key(instance.key))
+
+
+@receiver(post_save, sender=get_user_model())
+def _forget_user_tokens(sender, instance, created, **kwargs):
+    # cached tokens carry a copy of the user (is_active, is_staff, ...)
+    if not created:
+        keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+        token_cache().delete_many([token_cache_key(key) for key in keys])
@@ -0,0 +1,40 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class LRUCache(LocMemCache):
+    """
+    In-process cache that evicts one least recently used entry at a time.
+
+    LocMemCache already keeps entries in recency order but throws away a
+    whole 1/CULL_FREQUENCY slice when full; for a small hot set of summaries
+    that drops entries which are still being hit.
+
+    Eviction is O(1): expired entries are not searched for, they are
+    dropped when next read (as LocMemCache does) or reach the tail.
+    """
+
+    def _cull(self):
+        while len(self._cache) >= self._max_entries:
+            # get() moves a hit to the front, so the tail is least recent
+            key, _ = self._cache.popitem(last=True)
+            del self._expire_info[key]
+
+
+def summary_cache():
+    return caches[settings.SUMMARY_CACHE_ALIAS]
+
+
+def summary_cache_key(content_hash, owner_id):
+    # Per owner: a hit means "you already uploaded this", not just "seen"
+    return f"summary:{owner_id}:{content_hash}"
+
+
+def summary_hash(summary):
+    """Stable digest of a summary dict, used to key rendered artifacts"""
+    payload = json.dumps(summary, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
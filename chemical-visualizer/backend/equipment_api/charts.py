@@ -0,0 +1,119 @@
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .cache import summary_hash
+from .ingest import NUMERIC_COLUMNS, SUMMARY_KEYS
+
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+DPI = 100
+
+# Same palette as the desktop client
+COLUMN_COLORS = {'Flowrate': '#409eff', 'Pressure': '#67c23a', 'Temperature': '#f56c6c'}
+TYPE_COLORS = ['#409eff', '#67c23a', '#e6a23c', '#f56c6c', '#909399', '#9b59b6', '#1abc9c', '#34495e']
+
+
+def _plot_distribution(ax, summary):
+    types = summary.get('type_distribution', {})
+    ax.bar(list(types), list(types.values()), color=TYPE_COLORS[0])
+    ax.set_title("Equipment Type Distribution")
+    ax.set_ylabel("Count")
+    ax.tick_params(axis='x', labelrotation=30)
+
+
+def _plot_doughnut(ax, summary):
+    types = summary.get('type_distribution', {})
+    colors = [TYPE_COLORS[i % len(TYPE_COLORS)] for i in range(len(types))]
+    ax.pie(list(types.values()), labels=list(types), colors=colors, wedgeprops={'width': 0.4})
+    ax.set_title("Equipment Type Share")
+    ax.axis('equal')
+
+
+def _plot_averages(ax, summary):
+    values = [summary.get(key) or 0 for key in SUMMARY_KEYS.values()]
+    ax.bar(list(SUMMARY_KEYS), values, color=[COLUMN_COLORS[col] for col in SUMMARY_KEYS])
+    ax.set_title("Average Parameters")
+
+
+def _plot_percentiles(ax, summary):
+    percentiles = summary['percentiles']
+    labels = list(next(iter(percentiles.values())))
+    width = 0.8 / len(NUMERIC_COLUMNS)
+    for i, col in enumerate(NUMERIC_COLUMNS):
+        values = [percentiles[col][label] or 0 for label in labels]
+        positions = [x + (i - 1) * width for x in range(len(labels))]
+        ax.bar(positions, values, width, label=col, color=COLUMN_COLORS[col])
+    ax.set_xticks(range(len(labels)), labels)
+    ax.set_title("Parameter Percentiles")
+    ax.legend()
+
+
+def _plot_trends(ax, buckets):
+    labels = [str(b['bucket_start'])[:16] for b in buckets]
+    for col, key in SUMMARY_KEYS.items():
+        ax.plot(labels, [b.get(key) for b in buckets], marker='o', color=COLUMN_COLORS[col], label=col)
+    ax.set_title("Parameter Trends")
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend()
+
+
+# kind -> (plot function, whether a dataset summary has what it needs)
+DATASET_CHARTS = {
+    'distribution': (_plot_distribution, lambda s: bool(s.get('type_distribution'))),
+    'doughnut': (_plot_doughnut, lambda s: bool(s.get('type_distribution'))),
+    'averages': (_plot_averages, lambda s: True),
+    'percentiles': (_plot_percentiles, lambda s: bool(s.get('percentiles'))),
+}
+TRENDS_CHART = (_plot_trends, bool)
+
+
+def render_chart(plot, data, fmt, width, height):
+    """Draw a chart with the Agg backend and return the encoded image bytes"""
+    # Figure + Agg canvas, not pyplot: no global state, safe across threads
+    fig = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    FigureCanvasAgg(fig)
+    plot(fig.add_subplot(111), data)
+    fig.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def chart_key(prefix, kind, data, width, height):
+    """Identifies a render: who it is for, what was drawn, at which size"""
+    return f"{prefix}-{kind}-{width}x{height}-{summary_hash(data)}"
+
+
+def chart_etag(key, fmt):
+    return f'"{key}.{fmt}"'
+
+
+def get_or_render_chart(prefix, kind, plot, data, fmt, width, height):
+    """
+    Path of a cached chart image, rendering it on first request.
+
+    Files are named by chart_key(), so changed data gets a fresh render
+    and older renders of the same chart and size are removed.
+    """
+    key = chart_key(prefix, kind, data, width, height)
+    path = Path(settings.CHART_CACHE_DIR) / f"{key}.{fmt}"
+    if path.exists():
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image = render_chart(plot, data, fmt, width, height)
+    # Write then rename so concurrent readers never see a partial file
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(image)
+    os.replace(tmp_name, path)
+
+    for stale in path.parent.glob(f"{prefix}-{kind}-{width}x{height}-*.{fmt}"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return path
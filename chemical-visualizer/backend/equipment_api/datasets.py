@@ -0,0 +1,288 @@
+import io
+import os
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analysis import detect_anomalies
+from .cache import summary_cache, summary_cache_key
+from .ingest import (
+    NUMERIC_COLUMNS, ROW_COLUMNS, SUMMARY_COLUMNS, SummaryAccumulator, accumulate_frames, frame_reader,
+)
+from .models import Dataset, EquipmentRow, EquipmentTypeStats, TrendRollup
+from .parallel import aggregate_csv_parallel, should_parallelize
+from .rowstore import RowStore, SegmentWriter, append_rows, commit_rows, staging_area
+from .timing import timed
+
+
+def type_stats_rows(dataset, accumulator):
+    """Unsaved EquipmentTypeStats rows for an accumulator's per-type state"""
+    rows = []
+    for eq_type, stats in accumulator.type_stats.items():
+        fields = {}
+        for col in NUMERIC_COLUMNS:
+            prefix = col.lower()
+            fields[f'{prefix}_count'] = stats[col].count
+            fields[f'{prefix}_sum'] = stats[col].sum
+            fields[f'{prefix}_sumsq'] = stats[col].sumsq
+            fields[f'{prefix}_min'] = stats[col].min
+            fields[f'{prefix}_max'] = stats[col].max
+        rows.append(EquipmentTypeStats(
+            dataset=dataset,
+            equipment_type=str(eq_type),
+            count=accumulator.type_counts.get(eq_type, 0),
+            **fields,
+        ))
+    return rows
+
+
+def _copy_text(value):
+    # Escape a string for PostgreSQL's COPY text format
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+EQUIPMENT_ROW_COLUMNS = ('dataset_id', 'name', 'equipment_type', 'flowrate', 'pressure', 'temperature')
+
+
+def _copy_equipment_rows(cursor, table, dataset, store, batch_size, on_batch):
+    # COPY skips per-row INSERT parsing and planning entirely
+    sql = f"COPY {table} ({', '.join(EQUIPMENT_ROW_COLUMNS)}) FROM STDIN"
+    for names, types, columns in store.iter_batches(batch_size):
+        buf = io.StringIO()
+        numbers = zip(*(columns[col].tolist() for col in NUMERIC_COLUMNS))
+        for name, eq_type, values in zip(names, types, numbers):
+            fields = [str(dataset.id), _copy_text(name), '\\N' if eq_type is None else _copy_text(eq_type)]
+            fields.extend('\\N' if v != v else repr(v) for v in values)
+            buf.write('\t'.join(fields) + '\n')
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            buf.seek(0)
+            raw.copy_expert(sql, buf)
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buf.getvalue())
+        if on_batch is not None:
+            on_batch()
+
+
+def load_equipment_rows(dataset, store, on_batch=None):
+    """
+    Fill EquipmentRow for a dataset from its stored row segments, in
+    batches of EQUIPMENT_ROW_BATCH_SIZE. Uses COPY on PostgreSQL and a
+    parameterized executemany INSERT elsewhere. on_batch() is called after
+    each batch.
+    """
+    # Millions of rows: model instances and bulk_create's SQL compilation
+    # would cost several times the insert itself, so go below the ORM
+    table = connection.ops.quote_name(EquipmentRow._meta.db_table)
+    batch_size = settings.EQUIPMENT_ROW_BATCH_SIZE
+    with timed('rows'), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            _copy_equipment_rows(cursor, table, dataset, store, batch_size, on_batch)
+            return
+        sql = (
+            f"INSERT INTO {table} ({', '.join(EQUIPMENT_ROW_COLUMNS)}) "
+            f"VALUES ({', '.join(['%s'] * len(EQUIPMENT_ROW_COLUMNS))})"
+        )
+        for names, types, columns in store.iter_batches(batch_size):
+            # NaN becomes NULL
+            numbers = zip(*(
+                np.where(np.isnan(columns[col]), None, columns[col]).tolist() for col in NUMERIC_COLUMNS
+            ))
+            cursor.executemany(sql, [
+                (dataset.id, name, eq_type, *values)
+                for name, eq_type, values in zip(names, types, numbers)
+            ])
+            if on_batch is not None:
+                on_batch()
+
+
+def bucket_start(moment, granularity):
+    """Start of the hour, day or week (Monday) containing `moment`, local time"""
+    local = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if granularity == TrendRollup.HOUR:
+        return local
+    local = local.replace(hour=0)
+    if granularity == TrendRollup.WEEK:
+        local -= timedelta(days=local.weekday())
+    return local
+
+
+def add_to_trend_rollups(owner_id, uploaded_at, equipment, column_totals, datasets=1):
+    """
+    Add one upload to its owner's hour, day and week rollups.
+
+    column_totals maps each numeric column to its (count, sum). The
+    increments are F() expressions so concurrent uploads cannot lose updates.
+    Appends to an existing dataset pass datasets=0.
+    """
+    increments = {
+        'datasets': F('datasets') + datasets,
+        'equipment': F('equipment') + equipment,
+    }
+    for col, (count, total) in column_totals.items():
+        prefix = col.lower()
+        increments[f'{prefix}_count'] = F(f'{prefix}_count') + count
+        increments[f'{prefix}_sum'] = F(f'{prefix}_sum') + total
+
+    for granularity, _ in TrendRollup.GRANULARITY_CHOICES:
+        rollup, _ = TrendRollup.objects.get_or_create(
+            owner_id=owner_id,
+            granularity=granularity,
+            bucket_start=bucket_start(uploaded_at, granularity),
+        )
+        TrendRollup.objects.filter(pk=rollup.pk).update(**increments)
+
+
+def create_dataset(accumulator, content_hash=None, rows_dir=None, owner=None, on_step=None):
+    """
+    Persist a freshly summarized upload with its per-type stats and
+    rollups. rows_dir, if given, holds the staged row segments to keep.
+
+    on_step() is called after the anomaly stage and after each batch of
+    EquipmentRow rows, so a caller tracking a long upload can show it is
+    still alive.
+    """
+    # Outside the transaction: the anomaly stage only reads staged rows
+    summary = summarize(accumulator, rows_dir)
+    if on_step is not None:
+        on_step()
+    with transaction.atomic():
+        dataset = Dataset.objects.create(
+            owner=owner,
+            summary=summary,
+            summary_state=accumulator.to_state(),
+            content_hash=content_hash,
+        )
+        if rows_dir is not None:
+            dataset.rows_path = str(commit_rows(rows_dir, dataset.id))
+            dataset.save(update_fields=['rows_path'])
+            if settings.EQUIPMENT_ROWS_IN_DB:
+                load_equipment_rows(dataset, RowStore(dataset.rows_path), on_batch=on_step)
+        EquipmentTypeStats.objects.bulk_create(type_stats_rows(dataset, accumulator))
+        add_to_trend_rollups(dataset.owner_id, dataset.uploaded_at, accumulator.total, _column_totals(accumulator))
+    return dataset
+
+
+def summarize(accumulator, rows_dir=None):
+    """
+    The dataset summary, plus the anomaly stage (ANOMALY_DETECTION) when
+    the rows are stored in rows_dir to run it over.
+    """
+    summary = accumulator.to_summary()
+    if rows_dir is not None and settings.ANOMALY_DETECTION:
+        with timed('anomalies'):
+            summary['anomalies'] = detect_anomalies(RowStore(rows_dir), settings.ANOMALY_METHOD)
+    return summary
+
+
+def _column_totals(accumulator):
+    return {col: (accumulator.columns[col].count, accumulator.columns[col].sum) for col in NUMERIC_COLUMNS}
+
+
+@transaction.atomic
+def append_to_dataset(dataset_id, accumulator, rows_dir=None):
+    """
+    Merge a newly parsed slice into an existing dataset.
+
+    Only the stored accumulator state is read back, so the cost is the new
+    rows plus a few numbers per type, however large the dataset already is.
+    The anomaly stage needs every row, since per-type bounds move with each
+    slice: the previous result is kept, marked stale, until
+    refresh_anomalies reruns it in the background (see
+    jobs.refresh_anomalies_later).
+    """
+    dataset = Dataset.objects.select_for_update().get(id=dataset_id)
+    merged = SummaryAccumulator.from_state(dataset.summary_state)
+    merged.merge(accumulator)
+
+    # Rows are only kept if the whole dataset has them
+    rows_path = None
+    if rows_dir is not None and dataset.rows_path:
+        if settings.EQUIPMENT_ROWS_IN_DB:
+            load_equipment_rows(dataset, RowStore(rows_dir))
+        append_rows(rows_dir, dataset.rows_path)
+        rows_path = Path(dataset.rows_path)
+
+    old_hash = dataset.content_hash
+    anomalies = dataset.summary.get('anomalies')
+    dataset.summary = merged.to_summary()
+    if rows_path is not None and anomalies is not None:
+        dataset.summary['anomalies'] = {**anomalies, 'stale': True}
+    dataset.summary_state = merged.to_state()
+    # The dataset no longer matches any single uploaded file
+    dataset.content_hash = None
+    dataset.save(update_fields=['summary', 'summary_state', 'content_hash'])
+    if old_hash:
+        transaction.on_commit(lambda: summary_cache().delete(summary_cache_key(old_hash, dataset.owner_id)))
+
+    EquipmentTypeStats.objects.filter(dataset=dataset).delete()
+    EquipmentTypeStats.objects.bulk_create(type_stats_rows(dataset, merged))
+    add_to_trend_rollups(
+        dataset.owner_id, dataset.uploaded_at, accumulator.total, _column_totals(accumulator), datasets=0,
+    )
+    return dataset
+
+
+def refresh_anomalies(dataset_id):
+    """
+    Rerun the anomaly stage over all of a dataset's stored rows, as left
+    stale by append_to_dataset. Returns None without saving if the rows
+    changed again meanwhile; the refresh after that append covers them.
+    """
+    store = RowStore(Dataset.objects.only('rows_path').get(id=dataset_id).rows_path)
+    with timed('anomalies'):
+        anomalies = detect_anomalies(store, settings.ANOMALY_METHOD)
+    with transaction.atomic():
+        dataset = Dataset.objects.select_for_update().get(id=dataset_id)
+        if dataset.summary.get('total_equipment') != store.rows:
+            return None
+        dataset.summary['anomalies'] = anomalies
+        dataset.save(update_fields=['summary'])
+    return dataset
+
+
+def _accumulate_upload(file, filename, staging, path=None, workers=None, on_chunk=None, on_part=None):
+    columns = SUMMARY_COLUMNS if staging is None else ROW_COLUMNS
+    if path is not None and should_parallelize(filename, os.path.getsize(path)):
+        return aggregate_csv_parallel(
+            path, workers=workers, on_part=on_part, columns=columns, rows_dir=staging
+        )
+    writer = None if staging is None else SegmentWriter(staging / 'part-00000')
+    read_frames = frame_reader(filename, columns)
+    accumulator = accumulate_frames(read_frames(file), on_chunk=on_chunk, sink=writer)
+    if writer is not None:
+        writer.close()
+    return accumulator
+
+
+def ingest_upload(file, filename, content_hash=None, path=None, workers=None,
+                  on_chunk=None, on_part=None, on_step=None, owner=None):
+    """
+    Parse an upload, store its rows and persist the resulting Dataset.
+
+    path is where the upload lives on disk, if anywhere; large CSVs there
+    are aggregated by byte range in parallel (see aggregate_csv_parallel
+    for `workers` and on_part), everything else is streamed from `file`
+    with on_chunk progress callbacks. on_step follows the stages after
+    parsing (see create_dataset).
+    """
+    with staging_area() as staging:
+        with timed('parse'):
+            accumulator = _accumulate_upload(
+                file, filename, staging, path=path, workers=workers, on_chunk=on_chunk, on_part=on_part
+            )
+        return create_dataset(accumulator, content_hash, rows_dir=staging, owner=owner, on_step=on_step)
+
+
+def append_upload(dataset_id, file, filename, path=None):
+    """Parse an upload like ingest_upload() and append it to an existing dataset"""
+    with staging_area() as staging:
+        with timed('parse'):
+            accumulator = _accumulate_upload(file, filename, staging, path=path)
+        return append_to_dataset(dataset_id, accumulator, rows_dir=staging)
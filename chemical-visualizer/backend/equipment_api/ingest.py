@@ -0,0 +1,472 @@
+import csv
+import hashlib
+import zipfile
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .sketches import HyperLogLog, KLLSketch
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:  # pyarrow is optional; fall back to the pandas C parser
+    pa = None
+    pa_csv = None
+
+try:
+    import python_calamine
+except ImportError:  # python-calamine is optional; openpyxl streams .xlsx otherwise
+    python_calamine = None
+
+NUMERIC_COLUMNS = ("Flowrate", "Pressure", "Temperature")
+
+# Only the columns the summary needs, with their types declared up front so
+# the parser skips "Equipment Name" and never runs type inference.
+SUMMARY_COLUMNS = ("Type",) + NUMERIC_COLUMNS
+SUMMARY_DTYPES = {"Type": "category", **{col: "float64" for col in NUMERIC_COLUMNS}}
+
+# Everything kept when a dataset's rows are stored for later re-analysis
+ROW_COLUMNS = ("Equipment Name",) + SUMMARY_COLUMNS
+COLUMN_DTYPES = {"Equipment Name": "str", **SUMMARY_DTYPES}
+# Columns an upload may leave out; its rows are then stored with '' names
+OPTIONAL_COLUMNS = ("Equipment Name",)
+
+SUMMARY_KEYS = {
+    "Flowrate": "avg_flowrate",
+    "Pressure": "avg_pressure",
+    "Temperature": "avg_temperature",
+}
+
+# Percentiles reported from the quantile sketches
+SUMMARY_PERCENTILES = (50, 95, 99)
+
+
+class UploadFormatError(ValueError):
+    """An upload without the columns a summary needs"""
+
+
+# What the readers raise for an upload they cannot parse. pandas'
+# ParserError, pyarrow's ArrowInvalid and UnicodeDecodeError are ValueErrors
+UPLOAD_ERRORS = (ValueError, zipfile.BadZipFile) + (
+    (python_calamine.CalamineError,) if python_calamine is not None else ()
+)
+
+
+def present_columns(header, columns):
+    """The `columns` an upload's header has, or UploadFormatError if a required one is missing"""
+    missing = [col for col in columns if col not in header and col not in OPTIONAL_COLUMNS]
+    if missing:
+        raise UploadFormatError(f"Missing columns: {', '.join(missing)}")
+    return tuple(col for col in columns if col in header)
+
+
+class ColumnStats:
+    """
+    Mergeable count/sum/sum of squares/min/max of one numeric column.
+
+    m2 is the sum of squared deviations from the mean, combined with
+    Chan et al.'s parallel form of Welford's update so the variance stays
+    accurate however many chunks or appends are merged.
+    """
+
+    __slots__ = ("count", "sum", "sumsq", "min", "max", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = None
+        self.max = None
+        self.m2 = 0.0
+
+    def add(self, count, total, sumsq, low, high, m2=0.0):
+        if not count:
+            return
+        count = int(count)
+        if self.count:
+            delta = float(total) / count - self.sum / self.count
+            self.m2 += float(m2) + delta * delta * self.count * count / (self.count + count)
+        else:
+            self.m2 = float(m2)
+        self.count += count
+        self.sum += float(total)
+        self.sumsq += float(sumsq)
+        if self.min is None or low < self.min:
+            self.min = float(low)
+        if self.max is None or high > self.max:
+            self.max = float(high)
+
+    def merge(self, other):
+        self.add(other.count, other.sum, other.sumsq, other.min, other.max, other.m2)
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def variance(self):
+        """Population variance"""
+        return self.m2 / self.count if self.count else None
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        self.m2 = 0.0
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class SummaryAccumulator:
+    """
+    Running count/sum/min/max and type counts over equipment rows.
+
+    Frames are fed one chunk at a time so only the current chunk is ever
+    held in memory; the accumulated state is a handful of numbers per
+    column, overall and per equipment type, plus a quantile sketch per
+    column and a distinct-count sketch of equipment names.
+
+    A sketch is None when it does not cover every row: names are only
+    parsed when rows are stored, and states saved before sketches existed
+    have none.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.columns = {col: ColumnStats() for col in NUMERIC_COLUMNS}
+        self.type_counts = {}
+        self.type_stats = {}
+        self.quantiles = {col: KLLSketch() for col in NUMERIC_COLUMNS}
+        self.names = None
+
+    def update(self, df):
+        if not self.total and "Equipment Name" in df.columns:
+            self.names = HyperLogLog()
+        if self.names is not None:
+            if "Equipment Name" in df.columns:
+                self.names.update(df["Equipment Name"])
+            else:
+                self.names = None
+        self.total += int(len(df))
+
+        numeric = df[list(NUMERIC_COLUMNS)].apply(pd.to_numeric, errors="coerce")
+        squares = numeric ** 2
+        for col in NUMERIC_COLUMNS:
+            values = numeric[col]
+            count = values.count()
+            self.columns[col].add(
+                count, values.sum(), squares[col].sum(), values.min(), values.max(),
+                values.var(ddof=0) * count if count else 0.0,
+            )
+            if self.quantiles is not None:
+                self.quantiles[col].update(values.to_numpy())
+
+        # One grouped pass gives the per-type counts and column statistics
+        grouped = numeric.groupby(df["Type"], observed=True)
+        sizes = grouped.size()
+        aggregated = grouped.agg(["count", "sum", "min", "max"])
+        grouped_squares = squares.groupby(df["Type"], observed=True).sum()
+        grouped_m2 = (grouped.var(ddof=0) * aggregated.xs("count", axis=1, level=1)).fillna(0.0)
+        for eq_type, size in sizes.items():
+            if not size:
+                continue
+            self.type_counts[eq_type] = self.type_counts.get(eq_type, 0) + int(size)
+            stats = self.type_stats.setdefault(eq_type, {col: ColumnStats() for col in NUMERIC_COLUMNS})
+            row = aggregated.loc[eq_type]
+            for col in NUMERIC_COLUMNS:
+                stats[col].add(
+                    row[(col, "count")], row[(col, "sum")], grouped_squares.at[eq_type, col],
+                    row[(col, "min")], row[(col, "max")], grouped_m2.at[eq_type, col],
+                )
+
+    def merge(self, other):
+        """Fold another accumulator's state into this one"""
+        if not self.total:
+            self.quantiles, self.names = other.quantiles, other.names
+        elif other.total:
+            if self.quantiles is not None and other.quantiles is not None:
+                for col in NUMERIC_COLUMNS:
+                    self.quantiles[col].merge(other.quantiles[col])
+            else:
+                self.quantiles = None
+            if self.names is not None and other.names is not None:
+                self.names.merge(other.names)
+            else:
+                self.names = None
+        self.total += other.total
+        for col in NUMERIC_COLUMNS:
+            self.columns[col].merge(other.columns[col])
+        for eq_type, count in other.type_counts.items():
+            self.type_counts[eq_type] = self.type_counts.get(eq_type, 0) + count
+        for eq_type, other_stats in other.type_stats.items():
+            stats = self.type_stats.setdefault(eq_type, {col: ColumnStats() for col in NUMERIC_COLUMNS})
+            for col in NUMERIC_COLUMNS:
+                stats[col].merge(other_stats[col])
+
+    def to_state(self):
+        """JSON-serializable state, so the summary can be extended later"""
+        def column_state(stats):
+            return {col: stats[col].__getstate__() for col in NUMERIC_COLUMNS}
+
+        return {
+            "total": self.total,
+            "columns": column_state(self.columns),
+            "type_counts": {str(t): count for t, count in self.type_counts.items()},
+            "type_stats": {str(t): column_state(stats) for t, stats in self.type_stats.items()},
+            "quantiles": None if self.quantiles is None else {
+                col: sketch.to_state() for col, sketch in self.quantiles.items()
+            },
+            "names": None if self.names is None else self.names.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        def column_stats(data):
+            stats = {}
+            for col in NUMERIC_COLUMNS:
+                stats[col] = ColumnStats()
+                stats[col].__setstate__(data[col])
+            return stats
+
+        accumulator = cls()
+        accumulator.total = state["total"]
+        accumulator.columns = column_stats(state["columns"])
+        accumulator.type_counts = dict(state["type_counts"])
+        accumulator.type_stats = {t: column_stats(data) for t, data in state["type_stats"].items()}
+        quantiles = state.get("quantiles")
+        accumulator.quantiles = None if quantiles is None else {
+            col: KLLSketch.from_state(quantiles[col]) for col in NUMERIC_COLUMNS
+        }
+        names = state.get("names")
+        accumulator.names = None if names is None else HyperLogLog.from_state(names)
+        return accumulator
+
+    def percentiles(self):
+        """SUMMARY_PERCENTILES of every column from the sketches, or None"""
+        if self.quantiles is None:
+            return None
+        fractions = [p / 100 for p in SUMMARY_PERCENTILES]
+        result = {}
+        for col, sketch in self.quantiles.items():
+            values = sketch.quantiles(fractions)
+            result[col] = {
+                f"p{p}": None if v is None else round(v, 2) for p, v in zip(SUMMARY_PERCENTILES, values)
+            }
+        return result
+
+    def mean(self, col):
+        mean = self.columns[col].mean()
+        return None if mean is None else round(mean, 2)
+
+    def to_summary(self):
+        summary = {"total_equipment": self.total}
+        for col, key in SUMMARY_KEYS.items():
+            summary[key] = self.mean(col)
+        # Most frequent type first, ties by name: the same whichever CSV
+        # engine parsed the rows and in whatever order chunks were merged
+        summary["type_distribution"] = dict(
+            sorted(self.type_counts.items(), key=lambda item: (-item[1], str(item[0])))
+        )
+        percentiles = self.percentiles()
+        if percentiles is not None:
+            summary["percentiles"] = percentiles
+        if self.names is not None:
+            summary["distinct_equipment"] = self.names.estimate()
+        return summary
+
+
+def hash_upload(file):
+    """BLAKE2b hex digest of an uploaded file, leaving it rewound for parsing"""
+    digest = hashlib.blake2b(digest_size=32)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def iter_csv_chunks(file, chunksize=None, engine=None, names=None, block_size=None,
+                    columns=SUMMARY_COLUMNS):
+    """
+    Yield DataFrame chunks of an uploaded CSV without loading it whole.
+
+    Only `columns` (SUMMARY_COLUMNS by default) are parsed, with their
+    types from COLUMN_DTYPES; OPTIONAL_COLUMNS the file lacks are left
+    out of the chunks. The pyarrow streaming reader is used when pyarrow
+    is installed, otherwise (or with engine="c") the pandas C parser reads
+    the file in chunks. Pass names when the data has no header row of its
+    own.
+    """
+    if engine is None:
+        engine = "pyarrow" if pa_csv is not None else "c"
+    columns = present_columns(_csv_header(file) if names is None else names, columns)
+
+    if engine == "pyarrow":
+        yield from _iter_arrow_chunks(
+            file, names, block_size or settings.EQUIPMENT_CSV_BLOCK_SIZE, columns
+        )
+        return
+
+    with pd.read_csv(
+        file,
+        header=None if names else "infer",
+        names=names,
+        usecols=list(columns),
+        dtype={col: COLUMN_DTYPES[col] for col in columns},
+        chunksize=chunksize or settings.EQUIPMENT_CSV_CHUNKSIZE,
+        engine="c",
+    ) as reader:
+        yield from reader
+
+
+def _csv_header(file):
+    # Peek at the header line, leaving the file where it was
+    start = file.tell()
+    line = file.readline()
+    file.seek(start)
+    if isinstance(line, bytes):
+        line = line.decode("utf-8-sig")
+    return next(csv.reader([line.lstrip("\ufeff")]), [])
+
+
+def _iter_arrow_chunks(file, names, block_size, columns):
+    # pandas' engine="pyarrow" cannot chunk, so drive pyarrow's own
+    # streaming reader and hand each record batch over as a DataFrame.
+    column_types = {col: pa.float64() for col in NUMERIC_COLUMNS}
+    column_types["Type"] = pa.dictionary(pa.int32(), pa.string())
+    column_types["Equipment Name"] = pa.string()
+    reader = pa_csv.open_csv(
+        file,
+        read_options=pa_csv.ReadOptions(
+            block_size=block_size,
+            use_threads=False,
+            column_names=names,
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=list(columns),
+            column_types={col: column_types[col] for col in columns},
+            # blank cells are missing, as the C engine reads them
+            strings_can_be_null=True,
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def read_excel_frame(file, columns=SUMMARY_COLUMNS):
+    """Read an uploaded Excel sheet whole with pd.read_excel, limited to `columns`"""
+    df = pd.read_excel(
+        file, usecols=lambda col: col in columns, dtype={col: COLUMN_DTYPES[col] for col in columns}
+    )
+    return df[list(present_columns(df.columns, columns))]
+
+
+def iter_excel_chunks(file, chunksize=None, engine=None, columns=SUMMARY_COLUMNS):
+    """
+    Yield DataFrame chunks of the first sheet of an uploaded workbook.
+
+    Rows are streamed as plain tuples, by calamine when python-calamine is
+    installed, otherwise by openpyxl in read-only mode, and only `columns`
+    are picked out of them. Each chunk of `chunksize` rows becomes a small
+    DataFrame, so no DataFrame of the whole sheet is ever built. Blank
+    rows are skipped, as they are in CSV uploads.
+    """
+    if engine is None:
+        engine = "calamine" if python_calamine is not None else "openpyxl"
+    chunksize = chunksize or settings.EQUIPMENT_EXCEL_CHUNKSIZE
+    rows, close = _calamine_rows(file) if engine == "calamine" else _openpyxl_rows(file)
+    try:
+        header = next(rows, None)
+        if header is None:
+            return
+        positions = {name: i for i, name in reversed(list(enumerate(header))) if name is not None}
+        columns = present_columns(positions, columns)
+        indices = [positions[col] for col in columns]
+        width = max(indices) + 1
+        pick = itemgetter(*indices)
+
+        batch = []
+        for row in rows:
+            if row.count(None) + row.count("") == len(row):
+                continue
+            if len(row) < width:
+                # trailing empty cells may be left off a row
+                row = tuple(row) + (None,) * (width - len(row))
+            batch.append(pick(row))
+            if len(batch) == chunksize:
+                yield _excel_chunk(batch, columns)
+                batch = []
+        if batch:
+            yield _excel_chunk(batch, columns)
+    finally:
+        close()
+
+
+def _calamine_rows(file):
+    workbook = python_calamine.CalamineWorkbook.from_filelike(file)
+    return workbook.get_sheet_by_index(0).iter_rows(), workbook.close
+
+
+def _openpyxl_rows(file):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    return workbook.worksheets[0].iter_rows(values_only=True), workbook.close
+
+
+def _excel_chunk(batch, columns):
+    frame = {}
+    for col, values in zip(columns, zip(*batch)):
+        if col in NUMERIC_COLUMNS:
+            try:
+                # cells are floats or None (-> NaN) in a clean sheet
+                frame[col] = np.array(values, dtype="float64")
+            except (TypeError, ValueError):
+                frame[col] = pd.to_numeric(pd.Series(values, dtype=object).replace("", None), errors="coerce")
+        else:
+            text = [v if v.__class__ is str or v is None else _cell_text(v) for v in values]
+            frame[col] = pd.Series(text, dtype=COLUMN_DTYPES[col]).replace("", None)
+    return pd.DataFrame(frame, columns=list(columns))
+
+
+def _cell_text(value):
+    # calamine reads every number as a float; 42.0 in a name column means "42"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def frame_reader(filename, columns=SUMMARY_COLUMNS):
+    """Return the frame reader for an upload's file type, or None if unsupported"""
+    if filename.endswith('.csv'):
+        # Stream CSVs chunk by chunk so memory stays flat for huge exports
+        return lambda f: iter_csv_chunks(f, columns=columns)
+    if filename.endswith('.xlsx') or (filename.endswith('.xls') and python_calamine is not None):
+        return lambda f: iter_excel_chunks(f, columns=columns)
+    if filename.endswith('.xls'):
+        # openpyxl cannot read the legacy format; leave it to pandas
+        return lambda f: [read_excel_frame(f, columns)]
+    return None
+
+
+def accumulate_frames(frames, on_chunk=None, sink=None):
+    """
+    Fold an iterable of DataFrame chunks into a SummaryAccumulator.
+
+    on_chunk, if given, is called with the accumulator after every chunk
+    so long-running callers can report progress. sink, if given, has
+    write(df) called with every chunk (e.g. to store the rows).
+    """
+    accumulator = SummaryAccumulator()
+    for df in frames:
+        accumulator.update(df)
+        if sink is not None:
+            sink.write(df)
+        if on_chunk is not None:
+            on_chunk(accumulator)
+    return accumulator
+
+
+def summarize_frames(frames):
+    """Build the dataset summary from an iterable of DataFrame chunks"""
+    return accumulate_frames(frames).to_summary()
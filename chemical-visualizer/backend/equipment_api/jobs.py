@@ -0,0 +1,171 @@
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .datasets import ingest_upload, refresh_anomalies
+from .models import Dataset, UploadJob
+from .reports import get_or_render_report
+
+_executor = None
+
+
+def get_executor():
+    """Process pool shared by this web worker, created on first use"""
+    global _executor
+    if _executor is None:
+        # spawn, not fork: children must not share the parent's DB sockets
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.UPLOAD_JOB_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def save_upload(file):
+    """Write an uploaded file into UPLOAD_JOB_DIR and return its path"""
+    upload_dir = Path(settings.UPLOAD_JOB_DIR)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    path = upload_dir / f"{uuid.uuid4().hex}{Path(file.name).suffix}"
+    with open(path, 'wb') as out:
+        for chunk in file.chunks():
+            out.write(chunk)
+    return path
+
+
+def enqueue_upload(file, content_hash, owner):
+    """Save the upload and schedule its summary for `owner`; returns the UploadJob"""
+    path = save_upload(file)
+    job = UploadJob.objects.create(
+        owner=owner,
+        filename=file.name,
+        file_path=str(path),
+        content_hash=content_hash,
+    )
+    transaction.on_commit(lambda: submit_job(job.id))
+    return job
+
+
+def _submit(func, *args):
+    global _executor
+    try:
+        get_executor().submit(func, *args)
+    except BrokenProcessPool:
+        # A crashed child poisons the pool; start a fresh one and retry once
+        _executor = None
+        get_executor().submit(func, *args)
+
+
+def submit_job(job_id):
+    _submit(run_upload_job, job_id)
+
+
+def recover_stale_jobs(jobs):
+    """
+    Jobs in the `jobs` queryset that UPLOAD_JOB_STALE_AFTER seconds went by
+    without an update, presumably lost with the web worker whose in-memory
+    pool held them: pending ones are submitted again (run_upload_job only
+    claims a pending job once), running ones are failed. Returns the
+    number of each.
+    """
+    now = timezone.now()
+    stale = jobs.filter(updated_at__lt=now - timedelta(seconds=settings.UPLOAD_JOB_STALE_AFTER))
+    requeued = []
+    for job_id in stale.filter(status=UploadJob.PENDING).values_list('id', flat=True):
+        # stamped first, so it is not resubmitted again until it is stale again
+        if UploadJob.objects.filter(pk=job_id, status=UploadJob.PENDING).update(updated_at=now):
+            requeued.append(job_id)
+            submit_job(job_id)
+    failed = stale.filter(status=UploadJob.RUNNING).update(
+        status=UploadJob.FAILED, updated_at=now,
+        error="The worker processing this upload stopped; upload the file again",
+    )
+    return len(requeued), failed
+
+
+def refresh_anomalies_later(dataset):
+    """Rerun the anomaly stage of an appended-to dataset in the pool, once committed"""
+    if dataset.rows_path and settings.ANOMALY_DETECTION:
+        transaction.on_commit(lambda: _submit(run_anomaly_refresh, dataset.id))
+
+
+def run_anomaly_refresh(dataset_id):
+    """refresh_anomalies inside a pool worker process"""
+    try:
+        refresh_anomalies(dataset_id)
+    except Dataset.DoesNotExist:
+        pass  # deleted since the append
+
+
+def _update_job(job_id, **fields):
+    # queryset.update() skips auto_now, so stamp updated_at by hand. Only
+    # while running: a job recover_stale_jobs failed stays failed
+    UploadJob.objects.filter(pk=job_id, status=UploadJob.RUNNING).update(updated_at=timezone.now(), **fields)
+
+
+def run_upload_job(job_id):
+    """Summarize a saved upload; runs inside a pool worker process"""
+    # Claim the job: a recovered one may have been submitted twice
+    if not UploadJob.objects.filter(pk=job_id, status=UploadJob.PENDING).update(
+        status=UploadJob.RUNNING, updated_at=timezone.now(),
+    ):
+        return
+    job = UploadJob.objects.get(pk=job_id)
+
+    try:
+        dataset = Dataset.objects.filter(owner_id=job.owner_id, content_hash=job.content_hash).first()
+        if dataset is None:
+            def report_part(done, total, accumulator):
+                _update_job(
+                    job_id,
+                    progress=min(99, done * 100 // total),
+                    rows_processed=accumulator.total,
+                )
+
+            with open(job.file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size or 1
+
+                def report(accumulator):
+                    _update_job(
+                        job_id,
+                        progress=min(99, f.tell() * 100 // size),
+                        rows_processed=accumulator.total,
+                    )
+
+                # A pool living inside this pool worker would block its exit,
+                # so large CSVs get a dedicated one via `workers`
+                dataset = ingest_upload(
+                    f, job.filename, job.content_hash,
+                    path=job.file_path,
+                    workers=settings.AGGREGATION_WORKERS,
+                    on_chunk=report,
+                    on_part=report_part,
+                    # Stamped between the later stages too, or a long one
+                    # would look like a lost job to recover_stale_jobs
+                    on_step=lambda: _update_job(job_id),
+                    owner=job.owner,
+                )
+
+        if settings.REPORT_PRERENDER:
+            _update_job(job_id)
+            get_or_render_report(dataset)
+        _update_job(
+            job_id,
+            status=UploadJob.DONE,
+            progress=100,
+            rows_processed=dataset.summary.get('total_equipment', 0),
+            dataset=dataset,
+        )
+    except Exception as exc:
+        _update_job(job_id, status=UploadJob.FAILED, error=str(exc))
+    finally:
+        Path(job.file_path).unlink(missing_ok=True)
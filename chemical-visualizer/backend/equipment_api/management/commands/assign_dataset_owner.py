@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from equipment_api.models import Dataset, UploadJob
+from equipment_api.response_cache import bump_data_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Give datasets and upload jobs created before datasets had owners to "
+        "one user. Until then they are visible to nobody, since every dataset "
+        "endpoint only shows the requesting user's own datasets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            owner = User.objects.get(**{User.USERNAME_FIELD: options['username']})
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']}")
+
+        datasets = Dataset.objects.filter(owner__isnull=True).update(owner=owner)
+        UploadJob.objects.filter(owner__isnull=True).update(owner=owner)
+        # update() sends no post_save, so cached history would miss them
+        bump_data_version(owner.id)
+        if datasets:
+            # Their trend rollups are still counted under no owner
+            call_command('rebuild_trend_rollups', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Assigned {datasets} datasets to {options['username']}"))
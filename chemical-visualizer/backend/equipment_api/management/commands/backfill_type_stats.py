@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from equipment_api.models import Dataset, EquipmentTypeStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Create EquipmentTypeStats rows for datasets uploaded before the table "
+        "existed. Old summaries only kept type counts, so the per-type numeric "
+        "columns are left null."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        datasets = (
+            Dataset.objects.filter(type_stats__isnull=True)
+            .only('id', 'summary')
+            .order_by('id')
+        )
+
+        converted = 0
+        rows = []
+        for dataset in datasets.iterator(chunk_size=batch_size):
+            distribution = dataset.summary.get('type_distribution') or {}
+            for eq_type, count in distribution.items():
+                rows.append(EquipmentTypeStats(
+                    dataset_id=dataset.id,
+                    equipment_type=str(eq_type),
+                    count=count,
+                ))
+            converted += 1
+            if len(rows) >= batch_size:
+                EquipmentTypeStats.objects.bulk_create(rows, ignore_conflicts=True)
+                rows = []
+        EquipmentTypeStats.objects.bulk_create(rows, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled type statistics for {converted} datasets"))
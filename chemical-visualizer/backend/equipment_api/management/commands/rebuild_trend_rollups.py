@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from equipment_api.datasets import _column_totals, add_to_trend_rollups
+from equipment_api.ingest import SUMMARY_KEYS, SummaryAccumulator
+from equipment_api.models import Dataset, TrendRollup
+
+
+def summary_column_totals(summary):
+    """(count, sum) per column reconstructed from the rounded summary averages"""
+    total = summary.get('total_equipment') or 0
+    column_totals = {}
+    for col, key in SUMMARY_KEYS.items():
+        avg = summary.get(key)
+        column_totals[col] = (total, avg * total) if avg is not None else (0, 0.0)
+    return total, column_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild every user's trend rollups from the stored Datasets. Only "
+        "needed once for data uploaded before rollups existed or were kept "
+        "per user; uploads keep them current. "
+        "Counts and sums come from each dataset's accumulator state; datasets "
+        "stored before it existed fall back to the rounded summary averages."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TrendRollup.objects.all().delete()
+            rebuilt = legacy = 0
+            datasets = Dataset.objects.only('owner', 'uploaded_at', 'summary', 'summary_state').order_by('id')
+            for dataset in datasets.iterator(chunk_size=1000):
+                if dataset.summary_state is not None:
+                    accumulator = SummaryAccumulator.from_state(dataset.summary_state)
+                    total, column_totals = accumulator.total, _column_totals(accumulator)
+                else:
+                    total, column_totals = summary_column_totals(dataset.summary)
+                    legacy += 1
+                add_to_trend_rollups(dataset.owner_id, dataset.uploaded_at, total, column_totals)
+                rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt trend rollups from {rebuilt} datasets ({legacy} from summary averages)"
+        ))
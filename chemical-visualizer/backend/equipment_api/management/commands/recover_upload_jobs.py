@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from equipment_api.jobs import get_executor, recover_stale_jobs
+from equipment_api.models import UploadJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Recover upload jobs lost with the web worker that was running them, "
+        "e.g. after a restart: stale pending jobs are run here, stale running "
+        "ones are failed. Polling a job recovers it too."
+    )
+
+    def handle(self, *args, **options):
+        requeued, failed = recover_stale_jobs(UploadJob.objects.all())
+        if requeued:
+            # Wait for them: the pool goes away with this process
+            get_executor().shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(f"Ran {requeued} stale pending jobs, failed {failed} stale running jobs"))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment_api', '0004_dataset_dataset_uploaded_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentTypeStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('equipment_type', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField()),
+                ('flowrate_count', models.BigIntegerField(null=True)),
+                ('flowrate_sum', models.FloatField(null=True)),
+                ('flowrate_sumsq', models.FloatField(null=True)),
+                ('flowrate_min', models.FloatField(null=True)),
+                ('flowrate_max', models.FloatField(null=True)),
+                ('pressure_count', models.BigIntegerField(null=True)),
+                ('pressure_sum', models.FloatField(null=True)),
+                ('pressure_sumsq', models.FloatField(null=True)),
+                ('pressure_min', models.FloatField(null=True)),
+                ('pressure_max', models.FloatField(null=True)),
+                ('temperature_count', models.BigIntegerField(null=True)),
+                ('temperature_sum', models.FloatField(null=True)),
+                ('temperature_sumsq', models.FloatField(null=True)),
+                ('temperature_min', models.FloatField(null=True)),
+                ('temperature_max', models.FloatField(null=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='type_stats', to='equipment_api.dataset')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['equipment_type', 'dataset'], name='type_stats_type_dataset_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dataset', 'equipment_type'), name='type_stats_dataset_type_uniq')],
+            },
+        ),
+    ]
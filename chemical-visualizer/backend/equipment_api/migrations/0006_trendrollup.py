@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment_api', '0005_equipmenttypestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('week', 'Week')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('datasets', models.PositiveIntegerField(default=0)),
+                ('equipment', models.BigIntegerField(default=0)),
+                ('flowrate_count', models.BigIntegerField(default=0)),
+                ('flowrate_sum', models.FloatField(default=0.0)),
+                ('pressure_count', models.BigIntegerField(default=0)),
+                ('pressure_sum', models.FloatField(default=0.0)),
+                ('temperature_count', models.BigIntegerField(default=0)),
+                ('temperature_sum', models.FloatField(default=0.0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket_start'), name='trend_rollup_bucket_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment_api', '0006_trendrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='rows_path',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+    ]
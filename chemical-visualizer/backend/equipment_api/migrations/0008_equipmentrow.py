@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment_api', '0007_dataset_rows_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField()),
+                ('equipment_type', models.CharField(max_length=100, null=True)),
+                ('flowrate', models.FloatField(null=True)),
+                ('pressure', models.FloatField(null=True)),
+                ('temperature', models.FloatField(null=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='equipment', to='equipment_api.dataset')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dataset', 'equipment_type'], name='equipment_dataset_type_idx'), models.Index(fields=['dataset', 'flowrate'], name='equipment_dataset_flow_idx'), models.Index(fields=['dataset', 'pressure'], name='equipment_dataset_pressure_idx'), models.Index(fields=['dataset', 'temperature'], name='equipment_dataset_temp_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def delete_shared_rollups(apps, schema_editor):
+    # Existing rollups add up every user's uploads and cannot be split by
+    # owner; manage.py rebuild_trend_rollups recreates them per owner
+    apps.get_model('equipment_api', 'TrendRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment_api', '0010_dataset_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_shared_rollups, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='trendrollup',
+            name='trend_rollup_bucket_uniq',
+        ),
+        migrations.AddField(
+            model_name='trendrollup',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trend_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='trendrollup',
+            constraint=models.UniqueConstraint(fields=('owner', 'granularity', 'bucket_start'), name='trend_rollup_owner_bucket_uniq'),
+        ),
+    ]
@@ -1,8 +1,175 @@
+from django.conf import settings
 from django.db import models
 
 class Dataset(models.Model):
+    # Null only for datasets uploaded before ownership (see assign_dataset_owner)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, related_name='datasets',
+        on_delete=models.CASCADE, db_index=False,  # dataset_owner_id_idx leads with owner
+    )
     uploaded_at = models.DateTimeField(auto_now_add=True)
     summary = models.JSONField()
+    # BLAKE2b of the uploaded bytes, so repeat uploads can reuse the summary
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Directory of the stored row segments (see rowstore), empty if not kept
+    rows_path = models.CharField(max_length=500, blank=True, default='')
+    # SummaryAccumulator.to_state(), so appends merge without re-reading rows
+    summary_state = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # History filters on an upload time range and pages by id
+            models.Index(fields=['uploaded_at', 'id'], name='dataset_uploaded_id_idx'),
+            # A user's history, newest first, is a range scan of this index
+            models.Index(fields=['owner', '-id'], name='dataset_owner_id_idx'),
+        ]
 
     def __str__(self):
         return f"Dataset {self.id}"
+
+
+class EquipmentTypeStats(models.Model):
+    """
+    Per dataset, per equipment type statistics.
+
+    Stored as plain columns (count, sum, sum of squares, min, max) so
+    cross-dataset questions can be answered with SQL aggregates instead of
+    decoding every Dataset.summary. Numeric columns are null for datasets
+    backfilled from summaries that only kept type counts.
+    """
+
+    dataset = models.ForeignKey(Dataset, related_name='type_stats', on_delete=models.CASCADE)
+    equipment_type = models.CharField(max_length=100)
+    count = models.BigIntegerField()
+
+    flowrate_count = models.BigIntegerField(null=True)
+    flowrate_sum = models.FloatField(null=True)
+    flowrate_sumsq = models.FloatField(null=True)
+    flowrate_min = models.FloatField(null=True)
+    flowrate_max = models.FloatField(null=True)
+
+    pressure_count = models.BigIntegerField(null=True)
+    pressure_sum = models.FloatField(null=True)
+    pressure_sumsq = models.FloatField(null=True)
+    pressure_min = models.FloatField(null=True)
+    pressure_max = models.FloatField(null=True)
+
+    temperature_count = models.BigIntegerField(null=True)
+    temperature_sum = models.FloatField(null=True)
+    temperature_sumsq = models.FloatField(null=True)
+    temperature_min = models.FloatField(null=True)
+    temperature_max = models.FloatField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dataset', 'equipment_type'], name='type_stats_dataset_type_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['equipment_type', 'dataset'], name='type_stats_type_dataset_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.equipment_type} stats for dataset {self.dataset_id}"
+
+
+class EquipmentRow(models.Model):
+    """
+    One equipment row of a dataset, for drill-down queries.
+
+    Bulk loaded from the stored row segments when the dataset is created.
+    Each index leads with dataset because every query is scoped to one.
+    """
+
+    dataset = models.ForeignKey(Dataset, related_name='equipment', on_delete=models.CASCADE)
+    name = models.TextField()
+    equipment_type = models.CharField(max_length=100, null=True)
+    flowrate = models.FloatField(null=True)
+    pressure = models.FloatField(null=True)
+    temperature = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dataset', 'equipment_type'], name='equipment_dataset_type_idx'),
+            models.Index(fields=['dataset', 'flowrate'], name='equipment_dataset_flow_idx'),
+            models.Index(fields=['dataset', 'pressure'], name='equipment_dataset_pressure_idx'),
+            models.Index(fields=['dataset', 'temperature'], name='equipment_dataset_temp_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class TrendRollup(models.Model):
+    """
+    Running totals of one user's uploads that fall into one time bucket.
+
+    Updated incrementally as datasets are created, so /api/trends/ reads a
+    handful of rows instead of scanning history. Averages are weighted by
+    equipment rows, i.e. sum / count over every upload in the bucket.
+    """
+
+    HOUR = 'hour'
+    DAY = 'day'
+    WEEK = 'week'
+    GRANULARITY_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+        (WEEK, 'Week'),
+    ]
+
+    # Null for datasets uploaded before ownership, like Dataset.owner
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, related_name='trend_rollups',
+        on_delete=models.CASCADE, db_index=False,  # trend_rollup_bucket_uniq leads with owner
+    )
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    datasets = models.PositiveIntegerField(default=0)
+    equipment = models.BigIntegerField(default=0)
+
+    flowrate_count = models.BigIntegerField(default=0)
+    flowrate_sum = models.FloatField(default=0.0)
+    pressure_count = models.BigIntegerField(default=0)
+    pressure_sum = models.FloatField(default=0.0)
+    temperature_count = models.BigIntegerField(default=0)
+    temperature_sum = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner', 'granularity', 'bucket_start'], name='trend_rollup_owner_bucket_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} rollup at {self.bucket_start}"
+
+
+class UploadJob(models.Model):
+    """An upload saved to disk and summarized in the background"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    filename = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=500)
+    content_hash = models.CharField(max_length=64)
+    progress = models.PositiveSmallIntegerField(default=0)
+    rows_processed = models.BigIntegerField(default=0)
+    dataset = models.ForeignKey(Dataset, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"UploadJob {self.id} ({self.status})"
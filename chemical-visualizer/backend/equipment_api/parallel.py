@@ -0,0 +1,161 @@
+import csv
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+
+from .ingest import SUMMARY_COLUMNS, SummaryAccumulator, iter_csv_chunks, present_columns
+from .rowstore import SegmentWriter
+
+_executor = None
+
+
+def get_executor():
+    """Pool for CPU-bound work (aggregation, report rendering), created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = _process_pool(settings.AGGREGATION_WORKERS)
+    return _executor
+
+
+def _process_pool(workers):
+    # Set up like jobs.get_executor's workers, so code reading settings or
+    # models (timed(), report rendering) runs in them as in the web worker
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def should_parallelize(filename, size):
+    """Only large CSVs are worth the cost of splitting across processes"""
+    return (
+        filename.endswith('.csv')
+        and settings.AGGREGATION_WORKERS > 1
+        and size >= settings.AGGREGATION_MIN_BYTES
+    )
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file"""
+
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self._f = f
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        size = min(len(buf), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._f.read(size)
+        buf[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+def split_byte_ranges(path, parts):
+    """
+    Split a CSV into up to `parts` byte ranges that start and end on line
+    boundaries. Returns the parsed header and the list of (start, end).
+
+    Assumes no quoted field spans a newline, which holds for equipment
+    exports.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        data_start = f.tell()
+        header = next(csv.reader([header_line.decode('utf-8-sig')]))
+
+        bounds = [data_start]
+        step = max(1, (size - data_start) // max(1, parts))
+        for i in range(1, parts):
+            f.seek(data_start + i * step)
+            f.readline()  # finish the partial line so the range starts clean
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+        bounds.append(size)
+
+    ranges = [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+    return header, ranges
+
+
+def aggregate_range(path, start, end, header, chunksize, block_size,
+                    columns=SUMMARY_COLUMNS, segment_dir=None):
+    """
+    Partial summary state for one byte range; runs in a pool worker. With
+    segment_dir the range's rows are also stored there as a row segment.
+    """
+    accumulator = SummaryAccumulator()
+    writer = SegmentWriter(segment_dir) if segment_dir else None
+    with open(path, 'rb', buffering=0) as raw:
+        part = io.BufferedReader(_ByteRange(raw, start, end))
+        frames = iter_csv_chunks(
+            part, chunksize=chunksize, names=header, block_size=block_size, columns=columns
+        )
+        for df in frames:
+            accumulator.update(df)
+            if writer is not None:
+                writer.write(df)
+    if writer is not None:
+        writer.close()
+    return accumulator
+
+
+def aggregate_csv_parallel(path, workers=None, on_part=None, columns=SUMMARY_COLUMNS,
+                           rows_dir=None):
+    """
+    Aggregate a CSV on disk by byte ranges in parallel and return the
+    merged SummaryAccumulator. on_part(done, total, accumulator) is called
+    as each range finishes. Ranges are merged in file order whatever order
+    they finish in, so the sketches (and so the percentiles) come out the
+    same on every run. With rows_dir, every range also writes its rows
+    as a segment under it (`columns` must then include ROW_COLUMNS).
+
+    Without `workers` the shared pool is used; with it, a dedicated pool of
+    that size is created and shut down before returning.
+    """
+    parts = (workers or settings.AGGREGATION_WORKERS) * settings.AGGREGATION_PARTS_PER_WORKER
+    header, ranges = split_byte_ranges(path, parts)
+    columns = present_columns(header, columns)
+    if workers is None:
+        executor = get_executor()
+    else:
+        executor = _process_pool(workers)
+
+    futures = [
+        executor.submit(
+            aggregate_range, str(path), start, end, header,
+            settings.EQUIPMENT_CSV_CHUNKSIZE, settings.EQUIPMENT_CSV_BLOCK_SIZE,
+            columns, str(rows_dir / f'part-{index:05d}') if rows_dir else None,
+        )
+        for index, (start, end) in enumerate(ranges)
+    ]
+
+    merged = SummaryAccumulator()
+    merged_parts = 0
+    try:
+        for done, future in enumerate(as_completed(futures), start=1):
+            future.result()
+            # Fold in every finished range that follows the ones merged so far
+            while merged_parts < len(futures) and futures[merged_parts].done():
+                merged.merge(futures[merged_parts].result())
+                futures[merged_parts] = None
+                merged_parts += 1
+            if on_part is not None:
+                on_part(done, len(futures), merged)
+    finally:
+        if executor is not _executor:
+            executor.shutdown()
+    return merged
@@ -4,9 +4,78 @@ from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image
 from reportlab.lib.enums import TA_CENTER
 
+from .charts import DATASET_CHARTS, get_or_render_chart, render_chart
+from .timing import timed
+
+# Styles are immutable once built, so build them once per process
+STYLES = getSampleStyleSheet()
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=STYLES['Heading1'],
+    fontSize=24,
+    alignment=TA_CENTER,
+    spaceAfter=30
+)
+HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=STYLES['Heading2'],
+    fontSize=14,
+    spaceAfter=12
+)
+
+STATS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ecf0f1')),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
+    ('FONTSIZE', (0, 1), (-1, -1), 11),
+    ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+])
+
+DIST_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#27ae60')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#e8f8f0')),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#a3d9b1')),
+    ('FONTSIZE', (0, 1), (-1, -1), 11),
+    ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+])
+
+ANOMALY_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#c0392b')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#fdedec')),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e6b0aa')),
+    ('FONTSIZE', (0, 1), (-1, -1), 11),
+    ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+])
+
+# Pixel size of embedded charts; the same cached render the chart API serves
+PDF_CHART_SIZE = (800, 400)
+
+ANOMALY_METHODS = {
+    'iqr': 'outside Q1 - 1.5 IQR .. Q3 + 1.5 IQR of their type',
+    'mad': 'more than 3.5 scaled MADs from the median of their type',
+}
+
 
 def generate_equipment_report(summary_data, dataset_id=None):
     """
@@ -22,36 +91,63 @@ def generate_equipment_report(summary_data, dataset_id=None):
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
     
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        alignment=TA_CENTER,
-        spaceAfter=30
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12
-    )
+    # Build PDF
+    elements = build_report_elements(summary_data, dataset_id)
+    with timed('pdf'):
+        doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def generate_combined_report(datasets, output):
+    """
+    Generate one PDF with a section per dataset.
+    
+    Args:
+        datasets: iterable of (dataset_id, summary_data) pairs
+        output: filename or writable binary file for the PDF
+    """
+    doc = SimpleDocTemplate(output, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    
+    elements = []
+    for dataset_id, summary_data in datasets:
+        if elements:
+            elements.append(PageBreak())
+        elements.extend(build_report_elements(summary_data, dataset_id))
     
+    with timed('pdf'):
+        doc.build(elements)
+
+
+def chart_image(summary_data, kind, dataset_id=None):
+    """Flowable for a dataset chart, reusing the cached render when there is a dataset id"""
+    plot, _ = DATASET_CHARTS[kind]
+    width, height = PDF_CHART_SIZE
+    with timed('chart'):
+        if dataset_id:
+            source = str(get_or_render_chart(dataset_id, kind, plot, summary_data, 'png', width, height))
+        else:
+            source = BytesIO(render_chart(plot, summary_data, 'png', width, height))
+    return Image(source, width=6*inch, height=6*inch * height / width)
+
+
+def build_report_elements(summary_data, dataset_id=None):
+    """Flowables for one dataset's report section"""
     elements = []
     
     # Title
-    elements.append(Paragraph("Chemical Equipment Report", title_style))
+    elements.append(Paragraph("Chemical Equipment Report", TITLE_STYLE))
     elements.append(Spacer(1, 12))
     
     # Metadata
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     if dataset_id:
-        elements.append(Paragraph(f"<b>Dataset ID:</b> {dataset_id}", styles['Normal']))
-    elements.append(Paragraph(f"<b>Generated:</b> {timestamp}", styles['Normal']))
+        elements.append(Paragraph(f"<b>Dataset ID:</b> {dataset_id}", STYLES['Normal']))
+    elements.append(Paragraph(f"<b>Generated:</b> {timestamp}", STYLES['Normal']))
     elements.append(Spacer(1, 20))
     
     # Summary Statistics
-    elements.append(Paragraph("Summary Statistics", heading_style))
+    elements.append(Paragraph("Summary Statistics", HEADING_STYLE))
     
     stats_data = [
         ['Metric', 'Value'],
@@ -62,48 +158,50 @@ def generate_equipment_report(summary_data, dataset_id=None):
     ]
     
     stats_table = Table(stats_data, colWidths=[3*inch, 2*inch])
-    stats_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ecf0f1')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
-        ('FONTSIZE', (0, 1), (-1, -1), 11),
-        ('TOPPADDING', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-    ]))
+    stats_table.setStyle(STATS_TABLE_STYLE)
     elements.append(stats_table)
     elements.append(Spacer(1, 30))
     
     # Type Distribution
     type_dist = summary_data.get('type_distribution', {})
     if type_dist:
-        elements.append(Paragraph("Equipment Type Distribution", heading_style))
+        elements.append(Paragraph("Equipment Type Distribution", HEADING_STYLE))
         
         dist_data = [['Equipment Type', 'Count']]
         for eq_type, count in type_dist.items():
             dist_data.append([eq_type, str(count)])
         
         dist_table = Table(dist_data, colWidths=[3*inch, 2*inch])
-        dist_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#27ae60')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#e8f8f0')),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#a3d9b1')),
-            ('FONTSIZE', (0, 1), (-1, -1), 11),
-            ('TOPPADDING', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-        ]))
+        dist_table.setStyle(DIST_TABLE_STYLE)
         elements.append(dist_table)
+        elements.append(Spacer(1, 20))
+        elements.append(chart_image(summary_data, 'distribution', dataset_id))
     
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    # Anomalies
+    anomalies = summary_data.get('anomalies')
+    if anomalies:
+        elements.append(Spacer(1, 30))
+        elements.append(Paragraph("Anomalies", HEADING_STYLE))
+        rule = ANOMALY_METHODS.get(anomalies.get('method'), anomalies.get('method'))
+        elements.append(Paragraph(
+            f"<b>{anomalies.get('total', 0)}</b> equipment flagged with a parameter {rule}.",
+            STYLES['Normal'],
+        ))
+        if anomalies.get('stale'):
+            elements.append(Paragraph(
+                "Counted before the latest append; they are being recomputed.", STYLES['Normal'],
+            ))
+        elements.append(Spacer(1, 12))
+        
+        anomaly_data = [['Equipment Type', 'Flagged', 'Flowrate', 'Pressure', 'Temperature']]
+        for eq_type, counts in anomalies.get('by_type', {}).items():
+            anomaly_data.append([
+                eq_type, str(counts.get('rows', 0)), str(counts.get('Flowrate', 0)),
+                str(counts.get('Pressure', 0)), str(counts.get('Temperature', 0)),
+            ])
+        
+        anomaly_table = Table(anomaly_data, colWidths=[1.8*inch, 1*inch, 1*inch, 1*inch, 1.2*inch])
+        anomaly_table.setStyle(ANOMALY_TABLE_STYLE)
+        elements.append(anomaly_table)
+    
+    return elements
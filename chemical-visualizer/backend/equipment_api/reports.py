@@ -0,0 +1,133 @@
+import os
+import tempfile
+import zipfile
+from concurrent.futures import as_completed
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import summary_hash
+from .parallel import get_executor
+from .pdf_generator import generate_combined_report, generate_equipment_report
+from .timing import timed
+
+try:
+    from pypdf import PdfWriter
+except ImportError:  # pypdf is optional; combined reports are then built in one pass
+    PdfWriter = None
+
+
+def report_etag(dataset):
+    return f'"{dataset.id}-{summary_hash(dataset.summary)}"'
+
+
+def report_path(dataset):
+    return Path(settings.REPORT_CACHE_DIR) / f"{dataset.id}-{summary_hash(dataset.summary)}.pdf"
+
+
+def get_or_render_report(dataset):
+    """
+    Path of the stored PDF for a dataset, rendering it on first request.
+
+    Files are named by dataset id and summary hash, so a changed summary
+    gets a fresh report and the stale one is removed.
+    """
+    path = report_path(dataset)
+    if not path.exists():
+        render_report_file(dataset.summary, dataset.id, path)
+    return path
+
+
+def render_report_file(summary, dataset_id, path):
+    """Render a dataset report to `path`; safe to run in a worker process"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pdf_buffer = generate_equipment_report(summary, dataset_id)
+    # Write then rename so concurrent readers never see a partial file
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(pdf_buffer.getbuffer())
+    os.replace(tmp_name, path)
+
+    for stale in path.parent.glob(f"{dataset_id}-*.pdf"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+    return str(path)
+
+
+class _ZipStream:
+    """Write-only sink for ZipFile whose output is drained between entries"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_report_zip(datasets):
+    """
+    Yield a ZIP of the datasets' reports while it is being built.
+
+    Reports already on disk go in first; missing ones are rendered in the
+    shared process pool and added as they finish. Only one PDF is held in
+    memory at a time.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        pending = []
+        for dataset in datasets:
+            path = report_path(dataset)
+            if path.exists():
+                archive.write(path, f"equipment_report_{dataset.id}.pdf")
+                yield stream.drain()
+            else:
+                pending.append(dataset)
+
+        futures = {
+            get_executor().submit(render_report_file, dataset.summary, dataset.id, str(report_path(dataset))): dataset
+            for dataset in pending
+        }
+        for future in as_completed(futures):
+            archive.write(future.result(), f"equipment_report_{futures[future].id}.pdf")
+            yield stream.drain()
+    yield stream.drain()
+
+
+def write_combined_report(datasets, output):
+    """
+    Write one PDF with every dataset's report, in order, to `output` (a
+    filename or writable binary file).
+
+    The stored reports are reused and missing ones are rendered in the
+    shared process pool, all at once; their pages are then copied into the
+    combined file rather than laid out again, so no ReportLab flowables or
+    chart images are held here. Without pypdf the reports are built in one
+    ReportLab pass in this process instead.
+    """
+    if PdfWriter is None:
+        generate_combined_report(((d.id, d.summary) for d in datasets), output)
+        return
+
+    futures = {
+        dataset.id: get_executor().submit(
+            render_report_file, dataset.summary, dataset.id, str(report_path(dataset))
+        )
+        for dataset in datasets
+        if not report_path(dataset).exists()
+    }
+    writer = PdfWriter()
+    for dataset in datasets:
+        path = futures[dataset.id].result() if dataset.id in futures else report_path(dataset)
+        writer.append(str(path))
+    with timed('pdf'):
+        writer.write(output)
@@ -0,0 +1,105 @@
+"""
+Versioned response cache and strong ETags for read endpoints.
+
+Every user has a version of their data, replaced whenever one of their
+datasets is saved or deleted. A view using CachedResponseMixin stores its
+rendered response under (view, user, version, format, host, query), so a
+repeated request costs two cache reads and no query or serialization, and
+a client sending back the ETag gets 304 Not Modified. A new version makes
+the old entries unreachable; they expire after RESPONSE_CACHE_TTL.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from .models import Dataset
+from .timing import timed
+
+# Response headers kept with the cached body
+CACHED_HEADERS = ('Content-Type', 'Link', 'ETag', 'Cache-Control')
+# Per user, and to be revalidated on every use
+CACHE_CONTROL = 'private, no-cache'
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(owner_id):
+    return f"data-version:{owner_id}"
+
+
+def data_version(owner_id):
+    """Current version of a user's data, started on first use; None if the cache keeps nothing"""
+    cache = response_cache()
+    version = cache.get(_version_key(owner_id))
+    if version is None:
+        # A clock value, so a version evicted from the cache is not reused
+        cache.add(_version_key(owner_id), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(owner_id))
+    return version
+
+
+def bump_data_version(owner_id):
+    """Make every cached response of this user stale"""
+    response_cache().set(_version_key(owner_id), time.time_ns(), timeout=None)
+
+
+@receiver([post_save, post_delete], sender=Dataset)
+def _dataset_changed(sender, instance, **kwargs):
+    # After commit: a request that read the old version and then the new
+    # rows must not store them under the version that follows
+    owner_id = instance.owner_id
+    transaction.on_commit(lambda: bump_data_version(owner_id))
+
+
+class CachedResponseMixin:
+    """
+    Caches the GET responses of a read-only APIView whose output depends
+    only on the requesting user's datasets and the query string.
+
+    The handler asks cached_response() first and returns its response if
+    there is one; a 200 response built otherwise is rendered and stored
+    by finalize_response().
+    """
+
+    def cached_response(self, request):
+        """304 or the cached response for this request, else None (and note where to store it)"""
+        with timed('cache'):
+            version = data_version(request.user.id)
+            if version is None:
+                return None
+            query = sorted(request.query_params.lists())
+            digest = hashlib.blake2b(
+                repr((type(self).__name__, request.user.id, request.get_host(),
+                      request.accepted_renderer.format, query)).encode(),
+                digest_size=12,
+            ).hexdigest()
+            self.response_etag = f'"{version}-{digest}"'
+            self.response_cache_key = f"response:{version}:{digest}"
+            if self.response_etag in parse_etags(request.headers.get('If-None-Match', '')):
+                return HttpResponseNotModified(headers={'ETag': self.response_etag, 'Cache-Control': CACHE_CONTROL})
+            cached = response_cache().get(self.response_cache_key)
+        if cached is None:
+            return None
+        content, headers = cached
+        return HttpResponse(content, headers=headers)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, 'response_cache_key', None)
+        if key is not None and isinstance(response, Response) and response.status_code == 200:
+            response['ETag'] = self.response_etag
+            response['Cache-Control'] = CACHE_CONTROL
+            response.render()
+            headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+            response_cache().set(key, (response.content, headers))
+        return response
@@ -0,0 +1,242 @@
+"""
+Columnar on-disk copy of each dataset's equipment rows.
+
+A dataset directory holds one or more segments (one per parsed byte range
+or upload slice). Each segment stores every column as a flat little-endian
+file that can be memory-mapped with NumPy:
+
+    flowrate.f8 / pressure.f8 / temperature.f8   float64, NaN for blanks
+    type.i4                                       int32 codes into meta "types", -1 for blanks
+    name.offsets.i8 + name.utf8                   Equipment Name as UTF-8 bytes plus rows+1 offsets
+    meta.json                                     {"rows": n, "types": [...]}
+"""
+import json
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .ingest import NUMERIC_COLUMNS
+
+NAME_COLUMN = "Equipment Name"
+
+
+def _column_file(col):
+    return f"{col.lower()}.f8"
+
+
+class SegmentWriter:
+    """Append DataFrame chunks to one segment's column files"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.rows = 0
+        self._type_codes = {}
+        self._name_offset = 0
+        self._files = {col: open(self.path / _column_file(col), 'wb') for col in NUMERIC_COLUMNS}
+        self._types = open(self.path / 'type.i4', 'wb')
+        self._name_offsets = open(self.path / 'name.offsets.i8', 'wb')
+        self._names = open(self.path / 'name.utf8', 'wb')
+        self._name_offsets.write(np.zeros(1, dtype='<i8').tobytes())
+
+    def write(self, df):
+        for col in NUMERIC_COLUMNS:
+            values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype='<f8', na_value=np.nan)
+            self._files[col].write(values.tobytes())
+
+        types = df["Type"].astype(object)
+        for eq_type in types.dropna().unique():
+            self._type_codes.setdefault(eq_type, len(self._type_codes))
+        codes = types.map(self._type_codes).fillna(-1).to_numpy(dtype='<i4')
+        self._types.write(codes.tobytes())
+
+        if NAME_COLUMN in df.columns:
+            encoded = df[NAME_COLUMN].fillna("").astype(str).str.encode("utf-8").tolist()
+            lengths = np.fromiter(map(len, encoded), dtype='<i8', count=len(encoded))
+        else:
+            # an upload without names stores '' for every row
+            encoded, lengths = [], np.zeros(len(df), dtype='<i8')
+        offsets = self._name_offset + np.cumsum(lengths)
+        self._name_offsets.write(offsets.astype('<i8').tobytes())
+        self._names.write(b"".join(encoded))
+        if len(offsets):
+            self._name_offset = int(offsets[-1])
+
+        self.rows += len(df)
+
+    def close(self):
+        for f in (*self._files.values(), self._types, self._name_offsets, self._names):
+            f.close()
+        meta = {"rows": self.rows, "types": [str(t) for t in self._type_codes]}
+        (self.path / 'meta.json').write_text(json.dumps(meta))
+
+
+def _map(path, dtype, count):
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+class Segment:
+    """Read-only, memory-mapped view of one stored segment"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        meta = json.loads((self.path / 'meta.json').read_text())
+        self.rows = meta["rows"]
+        self.types = meta["types"]
+
+    def column(self, col):
+        return _map(self.path / _column_file(col), '<f8', self.rows)
+
+    def type_codes(self):
+        return _map(self.path / 'type.i4', '<i4', self.rows)
+
+    def read_block(self, start, stop):
+        """Type codes and numeric columns of rows [start, stop), read into memory"""
+        def read(name, dtype):
+            dtype = np.dtype(dtype)
+            return np.fromfile(self.path / name, dtype=dtype, count=stop - start, offset=start * dtype.itemsize)
+
+        return read('type.i4', '<i4'), {col: read(_column_file(col), '<f8') for col in NUMERIC_COLUMNS}
+
+    def type_mask(self, eq_type):
+        if eq_type not in self.types:
+            return np.zeros(self.rows, dtype=bool)
+        return self.type_codes() == self.types.index(eq_type)
+
+    def _name_data(self):
+        offsets = _map(self.path / 'name.offsets.i8', '<i8', self.rows + 1)
+        blob = _map(self.path / 'name.utf8', np.uint8, int(offsets[-1]) if self.rows else 0)
+        return offsets, blob
+
+    def names(self, indices):
+        offsets, blob = self._name_data()
+        return [bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in indices]
+
+    def batch(self, start, stop):
+        """Names, types (None for blanks) and numeric columns of rows [start, stop)"""
+        offsets, blob = self._name_data()
+        bounds = offsets[start:stop + 1].tolist()
+        data = bytes(blob[bounds[0]:bounds[-1]])
+        base = bounds[0]
+        names = [data[a - base:b - base].decode("utf-8") for a, b in zip(bounds, bounds[1:])]
+        # code -1 (blank Type) indexes the trailing None
+        lookup = np.array(self.types + [None], dtype=object)
+        types = lookup[self.type_codes()[start:stop]].tolist()
+        columns = {col: np.asarray(self.column(col)[start:stop]) for col in NUMERIC_COLUMNS}
+        return names, types, columns
+
+
+class RowStore:
+    """All segments of one dataset, exposed as whole columns"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.segments = [Segment(p) for p in sorted(self.path.iterdir()) if (p / 'meta.json').exists()]
+        self.rows = sum(s.rows for s in self.segments)
+
+    @property
+    def types(self):
+        seen = {}
+        for segment in self.segments:
+            seen.update(dict.fromkeys(segment.types))
+        return list(seen)
+
+    def _concat(self, arrays, dtype):
+        if not arrays:
+            return np.empty(0, dtype=dtype)
+        # a lone segment stays memory-mapped; several must be stitched
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+    def column(self, col):
+        return self._concat([s.column(col) for s in self.segments], '<f8')
+
+    def type_mask(self, eq_type):
+        return self._concat([s.type_mask(eq_type) for s in self.segments], bool)
+
+    def _code_maps(self):
+        # Per segment, its type codes -> codes into self.types; segment
+        # code -1 picks the trailing -1
+        index = {t: i for i, t in enumerate(self.types)}
+        return [np.array([index[t] for t in segment.types] + [-1], dtype='<i4') for segment in self.segments]
+
+    def type_codes(self):
+        """int32 codes into self.types for every row, -1 for blank types"""
+        codes = [remap[segment.type_codes()] for segment, remap in zip(self.segments, self._code_maps())]
+        return self._concat(codes, '<i4')
+
+    def iter_blocks(self, size):
+        """
+        Yield (type codes, {column: values}) for at most `size` rows at a
+        time, in row order, codes as in type_codes(). Blocks are read
+        rather than mapped, so a pass over every row does not leave the
+        whole dataset resident in this process.
+        """
+        for segment, remap in zip(self.segments, self._code_maps()):
+            for start in range(0, segment.rows, size):
+                codes, columns = segment.read_block(start, min(start + size, segment.rows))
+                yield remap[codes], columns
+
+    def iter_batches(self, size):
+        """Yield Segment.batch() tuples of at most `size` rows, in row order"""
+        for segment in self.segments:
+            for start in range(0, segment.rows, size):
+                yield segment.batch(start, min(start + size, segment.rows))
+
+    def names(self, indices):
+        """Equipment names for row positions across all segments"""
+        result = []
+        start = 0
+        indices = np.asarray(indices)
+        for segment in self.segments:
+            local = indices[(indices >= start) & (indices < start + segment.rows)] - start
+            result.extend(segment.names(local))
+            start += segment.rows
+        return result
+
+
+def open_rows(dataset):
+    """RowStore for a dataset, or None if its rows were not kept"""
+    if not dataset.rows_path or not Path(dataset.rows_path).exists():
+        return None
+    return RowStore(dataset.rows_path)
+
+
+@contextmanager
+def staging_area():
+    """
+    Yield a scratch directory for segments of an upload being parsed, or
+    None when row storage is disabled. Whatever is not committed with
+    commit_rows() is removed on exit.
+    """
+    if not settings.DATASET_STORE_ROWS:
+        yield None
+        return
+    path = Path(settings.DATASET_STORE_DIR) / '.staging' / uuid.uuid4().hex
+    path.mkdir(parents=True)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def commit_rows(staging, dataset_id):
+    """Move staged segments to the dataset's permanent directory"""
+    target = Path(settings.DATASET_STORE_DIR) / str(dataset_id)
+    shutil.rmtree(target, ignore_errors=True)
+    staging.rename(target)
+    return target
+
+
+def append_rows(staging, rows_path):
+    """Move staged segments after a dataset's existing ones, keeping row order"""
+    target = Path(rows_path)
+    start = sum(1 for p in target.iterdir() if p.name.startswith('part-'))
+    for offset, segment in enumerate(sorted(p for p in staging.iterdir() if p.name.startswith('part-'))):
+        segment.rename(target / f'part-{start + offset:05d}')
@@ -1,7 +1,23 @@
 from rest_framework import serializers
-from .models import Dataset
+from .models import Dataset, UploadJob
 
 class DatasetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Dataset
         fields = "__all__"
+
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    result = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadJob
+        fields = [
+            "id", "status", "filename", "progress", "rows_processed",
+            "dataset", "error", "created_at", "updated_at", "result",
+        ]
+
+    def get_result(self, job):
+        if job.status != UploadJob.DONE or job.dataset is None:
+            return None
+        return job.dataset.summary
@@ -0,0 +1,155 @@
+"""
+Mergeable streaming sketches kept alongside the exact summary statistics.
+
+KLLSketch answers quantile queries and HyperLogLog estimates distinct
+counts, each in kilobytes however many rows were fed in. Both take whole
+NumPy/pandas chunks at once, merge with another sketch of the same kind,
+and serialize to JSON-friendly state for Dataset.summary_state.
+"""
+import base64
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Level h holds items of weight 2**h; a full level is sorted and every
+    other item promoted, so rank error is about 1.7/k with high
+    probability. Which half survives is picked by a hash of the item count
+    and level rather than a random generator, so the same input always
+    yields the same sketch.
+    """
+
+    C = 2 / 3
+
+    def __init__(self, k=256):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return int(math.ceil(self.k * self.C ** depth)) + 1
+
+    def _compress(self):
+        while sum(len(items) for items in self.levels) >= sum(
+            self._capacity(h) for h in range(len(self.levels))
+        ):
+            for h, items in enumerate(self.levels):
+                if len(items) < self._capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays behind at this level
+                keep = items[len(items) - len(items) % 2:]
+                promoted = items[self._coin(h, len(items)):len(items) - len(items) % 2:2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                break
+
+    def _coin(self, level, size):
+        # splitmix64 finalizer over (n, level, size): a fair, reproducible bit
+        x = (self.n * 0x9E3779B97F4A7C15 + level * 0xBF58476D1CE4E5B9 + size) & 0xFFFFFFFFFFFFFFFF
+        x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        return (x ^ (x >> 31)) & 1
+
+    def update(self, values):
+        """Add an array of values; NaNs are ignored"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._compress()
+
+    def quantiles(self, fractions):
+        """Approximate values at each fraction (0..1) of the rank, or None if empty"""
+        if not self.n:
+            return [None] * len(fractions)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+        ranks = np.asarray(fractions, dtype=float) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, ranks, side="left"), len(items) - 1)
+        return [float(v) for v in items[positions]]
+
+    def to_state(self):
+        return {
+            "k": self.k,
+            "n": self.n,
+            "levels": [level.tolist() for level in self.levels],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state["k"])
+        sketch.n = state["n"]
+        sketch.levels = [np.asarray(level, dtype=float) for level in state["levels"]]
+        return sketch
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count estimator (Flajolet et al., 2007).
+
+    2**p one-byte registers; standard error is about 1.04 / sqrt(2**p),
+    1.6% at the default p=12. Values are hashed with pandas' fixed-key
+    hash, so sketches built in different processes can be merged.
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values):
+        """Add a Series or array of values; missing values are ignored"""
+        values = pd.Series(values).dropna()
+        if not len(values):
+            return
+        # categorize=False: names are mostly unique, so factorizing first only costs time
+        hashes = pd.util.hash_array(values.astype(str).to_numpy(dtype=object), categorize=False)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # rest < 2**52 converts to float exactly, so frexp gives its bit length
+        _, bits = np.frexp(rest.astype(float))
+        rank = (64 - self.p - bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_state(self):
+        return {"p": self.p, "registers": base64.b64encode(self.registers.tobytes()).decode("ascii")}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state["p"])
+        sketch.registers = np.frombuffer(base64.b64decode(state["registers"]), dtype=np.uint8).copy()
+        return sketch
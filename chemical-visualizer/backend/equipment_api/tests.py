@@ -0,0 +1,1135 @@
+import asyncio
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from equipment_api.analysis import detect_anomalies
+from equipment_api.async_views import AsyncGeneratePDFView, AsyncHistoryView, AsyncUploadCSV
+from equipment_api.authentication import issue_token, token_cache, token_cache_key
+from equipment_api.cache import LRUCache
+from equipment_api.datasets import ingest_upload, refresh_anomalies
+from equipment_api.ingest import (
+    ROW_COLUMNS, SummaryAccumulator, UploadFormatError, accumulate_frames, iter_csv_chunks, iter_excel_chunks,
+)
+from equipment_api.jobs import _update_job, run_upload_job
+from equipment_api.models import Dataset, EquipmentRow, EquipmentTypeStats, TrendRollup, UploadJob
+from equipment_api.parallel import aggregate_csv_parallel, aggregate_range, split_byte_ranges
+from equipment_api.reports import get_or_render_report
+from equipment_api.response_cache import CachedResponseMixin
+from equipment_api.rowstore import RowStore, SegmentWriter, open_rows
+from equipment_api.sketches import HyperLogLog, KLLSketch
+from equipment_api.uploads import StreamedCSVUpload
+
+CSV_HEADER = "Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+
+
+class ScratchStorageMixin:
+    """Logged-in API clients, with every file the backend writes in a scratch directory"""
+
+    def setUp(self):
+        self.scratch = scratch = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch, ignore_errors=True)
+        settings = override_settings(
+            DATASET_STORE_DIR=f"{scratch}/datasets",
+            UPLOAD_JOB_DIR=f"{scratch}/uploads",
+            REPORT_CACHE_DIR=f"{scratch}/reports",
+            CHART_CACHE_DIR=f"{scratch}/charts",
+            PROFILE_DIR=f"{scratch}/profiles",
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'summaries': {'BACKEND': 'equipment_api.cache.LRUCache', 'LOCATION': 'test-summaries'},
+                'tokens': {'BACKEND': 'equipment_api.cache.LRUCache', 'LOCATION': 'test-tokens'},
+                'responses': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # user ids are reused from test to test, so cached entries would be too
+        for cache in caches.all():
+            cache.clear()
+
+    def client_for(self, username):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username))
+        return client
+
+    def upload(self, client, body, name="equipment.csv"):
+        return client.post("/api/upload/", {"file": SimpleUploadedFile(name, body.encode())})
+
+
+class APITestCase(ScratchStorageMixin, TestCase):
+    pass
+
+
+class AsyncAPITestCase(ScratchStorageMixin, TransactionTestCase):
+    """For the async views, whose pool threads open their own database connections"""
+
+    def call(self, view, request, **kwargs):
+        return async_to_sync(view.as_view())(request, **kwargs)
+
+
+class TrendIsolationTests(APITestCase):
+    def test_trends_only_cover_own_uploads(self):
+        alice = self.client_for("alice")
+        bob = self.client_for("bob")
+        self.assertEqual(self.upload(alice, CSV_HEADER + "P-1,Pump,100,5,110\nP-2,Pump,200,7,130\n").status_code, 200)
+        self.assertEqual(self.upload(bob, CSV_HEADER + "V-1,Valve,10,1,20\n").status_code, 200)
+
+        for client, equipment, avg_flowrate in ((alice, 2, 150.0), (bob, 1, 10.0)):
+            for bucket in ("hour", "day", "week"):
+                trends = client.get("/api/trends/", {"bucket": bucket}).json()
+                self.assertEqual(len(trends), 1)
+                self.assertEqual(trends[0]["datasets"], 1)
+                self.assertEqual(trends[0]["total_equipment"], equipment)
+                self.assertEqual(trends[0]["avg_flowrate"], avg_flowrate)
+
+        carol = self.client_for("carol")
+        self.assertEqual(carol.get("/api/trends/").json(), [])
+
+
+class HistoryPaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.client_for("alice")
+        for i in range(5):
+            self.upload(self.alice, CSV_HEADER + f"P-{i},Pump,{100 + i},5,110\n")
+        self.ids = list(Dataset.objects.order_by("-id").values_list("id", flat=True))
+
+    def next_link(self, response):
+        link = response.get("Link")
+        return link[1:link.index(">")] if link else None
+
+    def test_pages_follow_the_cursor_in_the_link_header(self):
+        pages, url, params = [], "/api/history/", {"limit": 2}
+        while url:
+            response = self.alice.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row["id"] for row in response.json()])
+            url, params = self.next_link(response), None
+        self.assertEqual(pages, [self.ids[:2], self.ids[2:4], self.ids[4:]])
+
+        after_cursor = self.alice.get("/api/history/", {"cursor": self.ids[1], "limit": 5}).json()
+        self.assertEqual([row["id"] for row in after_cursor], self.ids[2:])
+        self.assertEqual(self.alice.get("/api/history/").json()[0]["id"], self.ids[0])
+
+    def test_fields_projects_the_summary(self):
+        rows = self.alice.get("/api/history/", {"fields": "id,avg_flowrate", "limit": 1}).json()
+        self.assertEqual(rows, [{"id": self.ids[0], "avg_flowrate": 104.0}])
+        full = self.alice.get("/api/history/", {"limit": 1}).json()[0]
+        self.assertEqual(full["type_distribution"], {"Pump": 1})
+        self.assertEqual(full["total_equipment"], 1)
+
+    def test_upload_time_filters(self):
+        old = timezone.now() - timedelta(days=10)
+        Dataset.objects.filter(id__in=self.ids[3:]).update(uploaded_at=old)
+        since = (timezone.now() - timedelta(days=5)).date().isoformat()
+
+        recent = self.alice.get("/api/history/", {"uploaded_after": since, "fields": "id"}).json()
+        self.assertEqual([row["id"] for row in recent], self.ids[:3])
+        earlier = self.alice.get("/api/history/", {"uploaded_before": since, "fields": "id"}).json()
+        self.assertEqual([row["id"] for row in earlier], self.ids[3:])
+
+        paged = self.alice.get("/api/history/", {"uploaded_after": since, "limit": 2})
+        self.assertIn("uploaded_after=", self.next_link(paged))
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({"limit": 0}, {"limit": "many"}, {"cursor": "x"},
+                       {"uploaded_after": "yesterday"}, {"fields": "id,owner"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.alice.get("/api/history/", params).status_code, 400)
+
+
+class TypeStatsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.client_for("alice")
+        self.upload(self.alice, CSV_HEADER + "P-1,Pump,100,5,110\nP-2,Pump,200,7,130\nV-1,Valve,10,1,20\n")
+        self.upload(self.alice, CSV_HEADER + "P-3,Pump,300,,150\n")
+        self.upload(self.client_for("bob"), CSV_HEADER + "P-9,Pump,1000,50,500\n")
+
+    def test_rows_are_stored_per_dataset_and_type(self):
+        first = Dataset.objects.filter(owner__username="alice").order_by("id").first()
+        pump = EquipmentTypeStats.objects.get(dataset=first, equipment_type="Pump")
+        self.assertEqual(pump.count, 2)
+        self.assertEqual((pump.flowrate_count, pump.flowrate_sum, pump.flowrate_sumsq), (2, 300.0, 50_000.0))
+        self.assertEqual((pump.pressure_min, pump.pressure_max), (5.0, 7.0))
+        self.assertEqual(first.type_stats.count(), 2)
+
+    def test_statistics_are_aggregated_across_own_datasets(self):
+        stats = {row["equipment_type"]: row for row in self.alice.get("/api/stats/types/").json()}
+        self.assertEqual(sorted(stats), ["Pump", "Valve"])
+        pump = stats["Pump"]
+        self.assertEqual((pump["datasets"], pump["count"]), (2, 3))
+        self.assertEqual(pump["flowrate"], {"count": 3, "avg": 200.0, "std": 81.65, "min": 100.0, "max": 300.0})
+        # the blank pressure cell is left out
+        self.assertEqual(pump["pressure"], {"count": 2, "avg": 6.0, "std": 1.0, "min": 5.0, "max": 7.0})
+
+        valve = self.alice.get("/api/stats/types/", {"type": "Valve"}).json()
+        self.assertEqual([row["equipment_type"] for row in valve], ["Valve"])
+        self.assertEqual(valve[0]["temperature"]["avg"], 20.0)
+
+    def test_upload_time_filters(self):
+        first = Dataset.objects.filter(owner__username="alice").order_by("id").first()
+        Dataset.objects.filter(id=first.id).update(uploaded_at=timezone.now() - timedelta(days=10))
+        since = (timezone.now() - timedelta(days=5)).date().isoformat()
+
+        recent = self.alice.get("/api/stats/types/", {"uploaded_after": since}).json()
+        self.assertEqual([(row["equipment_type"], row["count"]) for row in recent], [("Pump", 1)])
+        earlier = self.alice.get("/api/stats/types/", {"uploaded_before": since}).json()
+        self.assertEqual([(row["equipment_type"], row["count"]) for row in earlier], [("Pump", 2), ("Valve", 1)])
+        self.assertEqual(self.alice.get("/api/stats/types/", {"uploaded_after": "soon"}).status_code, 400)
+
+
+class EquipmentRowTests(APITestCase):
+    ROWS = (
+        "A,Pump,100,5,110\n"
+        "B,Pump,150,,120\n"
+        "C,Valve,50,3,90\n"
+        "D,Valve,150,3,95\n"
+        "E,Pump,200,9,130\n"
+        "F,Valve,75,7,100\n"
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.client_for("alice")
+        self.upload(self.alice, CSV_HEADER + self.ROWS)
+        self.url = f"/api/datasets/{Dataset.objects.get().id}/equipment/"
+
+    def names(self, params):
+        """Names on every page, following the Link header"""
+        names, url = [], self.url
+        while url:
+            response = self.alice.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            names += [row["name"] for row in response.json()]
+            link = response.get("Link")
+            url, params = (link[1:link.index(">")] if link else None), None
+        return names
+
+    def test_filters_are_inclusive_ranges(self):
+        self.assertEqual(self.names({"flowrate_min": 75, "flowrate_max": 150}), ["A", "B", "D", "F"])
+        self.assertEqual(self.names({"type": "Pump", "flowrate_min": 150}), ["B", "E"])
+        self.assertEqual(self.names({"pressure_max": 3}), ["C", "D"])
+        row = self.alice.get(self.url, {"type": "Pump", "limit": 2}).json()[1]
+        self.assertEqual({k: v for k, v in row.items() if k != "id"},
+                         {"name": "B", "type": "Pump", "flowrate": 150.0, "pressure": None, "temperature": 120.0})
+
+    def test_keyset_pages_match_the_ordering(self):
+        orderings = {
+            "id": ["A", "B", "C", "D", "E", "F"],
+            "-id": ["F", "E", "D", "C", "B", "A"],
+            # ties broken by id, missing values last either way
+            "pressure": ["C", "D", "A", "F", "E", "B"],
+            "-pressure": ["E", "F", "A", "D", "C", "B"],
+            "-name": ["F", "E", "D", "C", "B", "A"],
+        }
+        for ordering, expected in orderings.items():
+            with self.subTest(ordering=ordering):
+                self.assertEqual(self.names({"ordering": ordering, "limit": 2}), expected)
+
+    def test_other_users_and_bad_parameters(self):
+        self.assertEqual(self.client_for("bob").get(self.url).status_code, 404)
+        for params in ({"ordering": "owner"}, {"flowrate_min": "low"}, {"limit": 0}, {"cursor": "x"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.alice.get(self.url, params).status_code, 400)
+
+
+class UploadColumnTests(APITestCase):
+    NAMELESS_CSV = "Type,Flowrate,Pressure,Temperature\nPump,100,5,110\nValve,50,3,90\n"
+
+    def assert_nameless_upload(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["total_equipment"], 2)
+        self.assertEqual(response.json()["avg_flowrate"], 75.0)
+
+    def test_csv_without_names(self):
+        client = self.client_for("alice")
+        for streaming in (True, False):
+            with self.subTest(streaming=streaming), override_settings(UPLOAD_STREAMING=streaming):
+                # distinct content, so the second upload is not a repeat
+                body = self.NAMELESS_CSV + ("" if streaming else "\n")
+                self.assert_nameless_upload(self.upload(client, body))
+
+        dataset_id = client.get("/api/history/", {"limit": 1, "fields": "id"}).json()[0]["id"]
+        rows = client.get(f"/api/datasets/{dataset_id}/equipment/").json()
+        self.assertEqual([(row["name"], row["type"]) for row in rows], [("", "Pump"), ("", "Valve")])
+
+    def test_xlsx_without_names(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        header, *rows = self.NAMELESS_CSV.splitlines()
+        workbook.active.append(header.split(","))
+        for row in rows:
+            eq_type, *numbers = row.split(",")
+            workbook.active.append([eq_type, *map(float, numbers)])
+        body = io.BytesIO()
+        workbook.save(body)
+        client = self.client_for("alice")
+        response = client.post("/api/upload/", {"file": SimpleUploadedFile("equipment.xlsx", body.getvalue())})
+        self.assert_nameless_upload(response)
+
+    def test_missing_and_malformed_columns_are_rejected(self):
+        client = self.client_for("alice")
+        uploads = {
+            "equipment.csv": b"Equipment Name,Flowrate,Pressure,Temperature\nP-1,100,5,110\n",
+            "equipment.xlsx": b"not a workbook",
+        }
+        for streaming in (True, False):
+            for name, body in uploads.items():
+                with self.subTest(streaming=streaming, name=name), override_settings(UPLOAD_STREAMING=streaming):
+                    response = client.post("/api/upload/", {"file": SimpleUploadedFile(name, body)})
+                    self.assertEqual(response.status_code, 400)
+        self.assertIn("Missing columns: Type", self.upload(client, "Flowrate,Pressure\n1,2\n").json()["error"])
+
+
+class CSVEngineParityTests(TestCase):
+    CSV = (
+        "Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+        "P-1,Pump,100,5,110\n"
+        ",,80,,\n"
+        "V-1,Valve,,3,90\n"
+        "P-2,Pump,120,6,\n"
+    )
+
+    def read(self, engine):
+        frames = iter_csv_chunks(io.BytesIO(self.CSV.encode()), engine=engine, columns=ROW_COLUMNS)
+        return accumulate_frames(frames)
+
+    def test_blank_cells_are_missing_in_both_engines(self):
+        c_engine, arrow = self.read("c"), self.read("pyarrow")
+        self.assertEqual(arrow.to_summary(), c_engine.to_summary())
+        self.assertEqual(arrow.type_counts, {"Pump": 2, "Valve": 1})
+        self.assertEqual(arrow.to_state()["type_stats"], c_engine.to_state()["type_stats"])
+
+    def test_type_ties_are_ordered_by_name(self):
+        body = CSV_HEADER + "V-1,Valve,1,1,1\nR-1,Reactor,1,1,1\nP-1,Pump,1,1,1\nP-2,Pump,1,1,1\n"
+        for engine in ("c", "pyarrow"):
+            with self.subTest(engine=engine):
+                frames = iter_csv_chunks(io.BytesIO(body.encode()), engine=engine, columns=ROW_COLUMNS)
+                distribution = accumulate_frames(frames).to_summary()["type_distribution"]
+                self.assertEqual(list(distribution.items()), [("Pump", 2), ("Reactor", 1), ("Valve", 1)])
+
+
+class ExcelReaderTests(TestCase):
+    ENGINES = ("calamine", "openpyxl")
+    # the same rows as a CSV, for comparison
+    CSV = CSV_HEADER + "P-1,Pump,100,5,110\n42,Valve,50,,90\n,,80,3,\nP-2,Pump,,6,130\nV-3,Valve,60,2,95\n"
+
+    def workbook(self, rows):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        body = io.BytesIO()
+        workbook.save(body)
+        body.seek(0)
+        return body
+
+    def sheet(self):
+        # columns in another order, an extra column, a blank row, a number
+        # as a name, text in a number column and a short row
+        return self.workbook([
+            ["Temperature", "Notes", "Type", "Equipment Name", "Flowrate", "Pressure"],
+            [110, "ok", "Pump", "P-1", 100, 5],
+            [90, None, "Valve", 42, 50, None],
+            [None, None, None, None, 80, 3],
+            [None, None, None, None, None, None],
+            [130, None, "Pump", "P-2", "n/a", 6],
+            [95, None, "Valve", "V-3", 60, 2],
+        ])
+
+    def read(self, engine, chunksize=2):
+        return list(iter_excel_chunks(self.sheet(), chunksize=chunksize, engine=engine, columns=ROW_COLUMNS))
+
+    def test_engines_agree_with_the_csv_reader(self):
+        csv = accumulate_frames(iter_csv_chunks(io.BytesIO(self.CSV.encode()), engine="c", columns=ROW_COLUMNS))
+        frames = {}
+        for engine in self.ENGINES:
+            with self.subTest(engine=engine):
+                chunks = self.read(engine)
+                self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+                self.assertEqual(list(chunks[0].columns), list(ROW_COLUMNS))
+                frames[engine] = pd.concat(chunks, ignore_index=True)
+                excel = accumulate_frames(iter(chunks))
+                self.assertEqual(excel.to_summary(), csv.to_summary())
+                self.assertEqual(excel.to_state()["type_stats"], csv.to_state()["type_stats"])
+        pd.testing.assert_frame_equal(frames["calamine"], frames["openpyxl"])
+        self.assertEqual(frames["calamine"]["Equipment Name"].tolist()[:2], ["P-1", "42"])
+
+    def test_header_only_and_missing_columns(self):
+        for engine in self.ENGINES:
+            with self.subTest(engine=engine):
+                header = self.workbook([["Equipment Name", "Type", "Flowrate", "Pressure", "Temperature"]])
+                self.assertEqual(list(iter_excel_chunks(header, engine=engine)), [])
+                no_type = self.workbook([["Flowrate", "Pressure", "Temperature"], [1, 2, 3]])
+                with self.assertRaisesMessage(UploadFormatError, "Missing columns: Type"):
+                    list(iter_excel_chunks(no_type, engine=engine))
+
+
+class RepeatUploadTests(APITestCase):
+    CSV = CSV_HEADER + "P-1,Pump,100,5,110\nV-1,Valve,50,3,90\n"
+
+    def test_repeat_upload_is_answered_by_hash_without_parsing(self):
+        client = self.client_for("alice")
+        with mock.patch("equipment_api.views.ingest_upload", wraps=ingest_upload) as ingest, \
+                mock.patch("equipment_api.views.hash_upload") as rehash:
+            first = self.upload(client, self.CSV)
+            second = self.upload(client, self.CSV)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(ingest.call_count, 1)
+        # hashed as the body arrived, not read a second time
+        rehash.assert_not_called()
+        self.assertEqual(
+            Dataset.objects.get().content_hash, hashlib.blake2b(self.CSV.encode(), digest_size=32).hexdigest()
+        )
+
+    @override_settings(UPLOAD_STREAMING=True)
+    def test_streamed_repeat_drops_its_staged_rows(self):
+        client = self.client_for("alice")
+        with mock.patch("equipment_api.views.StreamedCSVUpload.close", autospec=True,
+                        side_effect=StreamedCSVUpload.close) as close:
+            first = self.upload(client, self.CSV)
+            second = self.upload(client, self.CSV)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Dataset.objects.count(), 1)
+        # the repeat is closed once by the view, then again by Django
+        self.assertEqual(close.call_count, 3)
+
+
+class AppendUploadTests(APITestCase):
+    FIRST = "P-1,Pump,100,5,110\nV-1,Valve,50,3,90\n"
+    SECOND = "P-2,Pump,200,,130\nC-1,Compressor,80,9,150\n"
+
+    def append(self, client, dataset_id, body, **params):
+        query = "&".join(f"{k}={v}" for k, v in {"append": dataset_id, **params}.items())
+        return client.post(f"/api/upload/?{query}", {"file": SimpleUploadedFile("more.csv", body.encode())})
+
+    def without_anomalies(self, summary):
+        # left to the background refresh after an append
+        return {k: v for k, v in summary.items() if k != "anomalies"}
+
+    def type_stats(self, dataset):
+        return sorted(
+            tuple(v for k, v in row.items() if k not in ("id", "dataset_id"))
+            for row in dataset.type_stats.values()
+        )
+
+    def test_append_matches_one_upload_of_both_files(self):
+        alice = self.client_for("alice")
+        self.upload(alice, CSV_HEADER + self.FIRST)
+        dataset = Dataset.objects.get()
+        with mock.patch("equipment_api.views.refresh_anomalies_later"):
+            response = self.append(alice, dataset.id, CSV_HEADER + self.SECOND)
+        self.assertEqual(response.status_code, 200, response.content)
+
+        self.upload(self.client_for("bob"), CSV_HEADER + self.FIRST + self.SECOND)
+        appended, whole = Dataset.objects.order_by("id")
+        self.assertEqual(self.without_anomalies(response.json()), self.without_anomalies(whole.summary))
+        self.assertEqual(self.without_anomalies(appended.summary), self.without_anomalies(whole.summary))
+        self.assertEqual(self.type_stats(appended), self.type_stats(whole))
+        self.assertEqual(EquipmentRow.objects.filter(dataset=appended).count(), 4)
+        self.assertEqual(len(open_rows(appended).column("Flowrate")), 4)
+        # no longer the same as the first file, so that file is new again
+        self.assertIsNone(appended.content_hash)
+        self.assertEqual(len(alice.get("/api/history/").json()), 1)
+
+    def test_appends_that_cannot_be_merged_are_rejected(self):
+        alice = self.client_for("alice")
+        self.upload(alice, CSV_HEADER + self.FIRST)
+        dataset = Dataset.objects.get()
+        body = CSV_HEADER + self.SECOND
+
+        self.assertEqual(self.append(alice, "first", body).status_code, 400)
+        self.assertEqual(self.append(alice, dataset.id, body, **{"async": 1}).status_code, 400)
+        self.assertEqual(self.append(self.client_for("bob"), dataset.id, body).status_code, 404)
+        Dataset.objects.update(summary_state=None)
+        self.assertEqual(self.append(alice, dataset.id, body).status_code, 409)
+        self.assertEqual(Dataset.objects.get().summary["total_equipment"], 2)
+
+
+class AppendAnomalyTests(APITestCase):
+    def test_append_leaves_anomalies_to_the_background_refresh(self):
+        client = self.client_for("alice")
+        rows = "".join(f"P-{i},Pump,{100 + i % 5},5,110\n" for i in range(20))
+        self.upload(client, CSV_HEADER + rows)
+        dataset = Dataset.objects.get()
+
+        with mock.patch("equipment_api.datasets.detect_anomalies", wraps=detect_anomalies) as detect, \
+                mock.patch("equipment_api.views.refresh_anomalies_later") as refresh_later:
+            response = client.post(
+                f"/api/upload/?append={dataset.id}",
+                {"file": SimpleUploadedFile("more.csv", (CSV_HEADER + "P-99,Pump,900,5,110\n").encode())},
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        detect.assert_not_called()
+        refresh_later.assert_called_once()
+        stale = response.json()["anomalies"]
+        self.assertTrue(stale["stale"])
+        self.assertEqual(stale["total"], 0)
+
+        refreshed = refresh_anomalies(dataset.id).summary["anomalies"]
+        self.assertNotIn("stale", refreshed)
+        self.assertEqual(refreshed["by_column"]["Flowrate"], 1)
+        self.assertEqual(refreshed, detect_anomalies(open_rows(Dataset.objects.get()), "iqr"))
+
+
+class StaleJobTests(APITestCase):
+    def stale_job(self, client_user, status):
+        job = UploadJob.objects.create(
+            owner=client_user, status=status, filename="a.csv", file_path="/nonexistent.csv", content_hash="x",
+        )
+        UploadJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        return job
+
+    def test_polling_recovers_stale_jobs(self):
+        client = self.client_for("alice")
+        user = User.objects.get(username="alice")
+        pending = self.stale_job(user, UploadJob.PENDING)
+        running = self.stale_job(user, UploadJob.RUNNING)
+
+        with mock.patch("equipment_api.jobs.submit_job") as submit:
+            self.assertEqual(client.get(f"/api/jobs/{pending.id}/").json()["status"], "pending")
+            client.get(f"/api/jobs/{pending.id}/")
+            body = client.get(f"/api/jobs/{running.id}/").json()
+        # resubmitted once; the second poll found it freshly stamped
+        submit.assert_called_once_with(pending.id)
+        self.assertEqual(body["status"], "failed")
+        self.assertIn("upload the file again", body["error"])
+
+    def saved_job(self, user):
+        path = Path(self.scratch) / "job.csv"
+        path.write_text(CSV_HEADER + "".join(f"P-{i},Pump,{100 + i},5,110\n" for i in range(6)))
+        return UploadJob.objects.create(owner=user, filename="job.csv", file_path=str(path), content_hash="x")
+
+    @override_settings(EQUIPMENT_ROW_BATCH_SIZE=2)
+    def test_stages_after_parsing_stamp_the_job(self):
+        job = self.saved_job(User.objects.create_user("alice"))
+        with mock.patch("equipment_api.jobs._update_job", wraps=_update_job) as update:
+            run_upload_job(job.id)
+        stamps = [c for c in update.call_args_list if c == mock.call(job.id)]
+        # after the anomaly stage, then once per batch of two rows
+        self.assertEqual(len(stamps), 4)
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.DONE)
+
+    @override_settings(REPORT_PRERENDER=True)
+    def test_a_job_failed_by_recovery_stays_failed(self):
+        job = self.saved_job(User.objects.create_user("alice"))
+
+        def recovered_meanwhile(dataset):
+            UploadJob.objects.filter(pk=job.pk).update(status=UploadJob.FAILED, error="stopped")
+
+        with mock.patch("equipment_api.jobs.get_or_render_report", side_effect=recovered_meanwhile):
+            run_upload_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (UploadJob.FAILED, "stopped"))
+
+    def test_a_job_is_only_run_once(self):
+        job = self.stale_job(User.objects.create_user("alice"), UploadJob.RUNNING)
+        with mock.patch("equipment_api.jobs.ingest_upload") as ingest:
+            run_upload_job(job.id)
+        ingest.assert_not_called()
+        self.assertEqual(UploadJob.objects.get().status, UploadJob.RUNNING)
+
+
+class CombinedReportTests(APITestCase):
+    def test_combined_pdf_concatenates_the_stored_reports(self):
+        from pypdf import PdfReader
+
+        client = self.client_for("alice")
+        for rows in ("P-1,Pump,100,5,110\n", "V-1,Valve,50,3,90\n"):
+            self.upload(client, CSV_HEADER + rows)
+        datasets = list(Dataset.objects.order_by("id"))
+        # rendered here rather than in the process pool, which would not see these settings
+        pages = [len(PdfReader(get_or_render_report(d)).pages) for d in datasets]
+
+        response = client.get("/api/reports/", {"ids": ",".join(str(d.id) for d in datasets), "output": "pdf"})
+        self.assertEqual(response.status_code, 200)
+        combined = PdfReader(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(len(combined.pages), sum(pages))
+        self.assertIn(f"Dataset ID: {datasets[1].id}", combined.pages[pages[0]].extract_text())
+
+
+class StoredReportTests(APITestCase):
+    def stored_reports(self, dataset_id):
+        return sorted(p.name for p in Path(self.scratch, "reports").glob(f"{dataset_id}-*.pdf"))
+
+    def test_report_is_rendered_once_and_revalidated_by_etag(self):
+        client = self.client_for("alice")
+        self.upload(client, CSV_HEADER + "P-1,Pump,100,5,110\n")
+        dataset = Dataset.objects.get()
+        url = f"/api/report/{dataset.id}/"
+
+        first = client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["Content-Type"], "application/pdf")
+        body = b"".join(first.streaming_content)
+        self.assertEqual(len(self.stored_reports(dataset.id)), 1)
+
+        with mock.patch("equipment_api.reports.generate_equipment_report") as render:
+            again = client.get(url)
+            self.assertEqual(b"".join(again.streaming_content), body)
+            not_modified = client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        render.assert_not_called()
+        self.assertEqual(again["ETag"], first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.assertEqual(self.client_for("bob").get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 404)
+
+    def test_changed_summary_replaces_the_stored_report(self):
+        client = self.client_for("alice")
+        self.upload(client, CSV_HEADER + "P-1,Pump,100,5,110\n")
+        dataset = Dataset.objects.get()
+        url = f"/api/report/{dataset.id}/"
+        before = client.get(url)
+        before.close()
+        old_reports = self.stored_reports(dataset.id)
+
+        Dataset.objects.filter(id=dataset.id).update(summary={**dataset.summary, "avg_flowrate": 101.0})
+        after = client.get(url, HTTP_IF_NONE_MATCH=before["ETag"])
+        after.close()
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after["ETag"], before["ETag"])
+        new_reports = self.stored_reports(dataset.id)
+        self.assertEqual(len(new_reports), 1)
+        self.assertNotEqual(new_reports, old_reports)
+
+
+class ChartCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.client_for("alice")
+        self.upload(self.alice, CSV_HEADER + "P-1,Pump,100,5,110\nV-1,Valve,50,3,90\n")
+        self.dataset = Dataset.objects.get()
+
+    def get(self, kind, fmt, etag=None, **params):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        response = self.alice.get(f"/api/datasets/{self.dataset.id}/charts/{kind}.{fmt}", params, **headers)
+        if hasattr(response, "streaming_content"):
+            response.body = b"".join(response.streaming_content)
+        return response
+
+    def renders(self):
+        return sorted(p.name for p in Path(self.scratch, "charts").iterdir())
+
+    def test_chart_is_rendered_once_per_summary_and_size(self):
+        first = self.get("distribution", "png")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["Content-Type"], "image/png")
+        self.assertTrue(first.body.startswith(b"\x89PNG"))
+        self.assertEqual(len(self.renders()), 1)
+
+        with mock.patch("equipment_api.charts.render_chart") as render:
+            again = self.get("distribution", "png")
+            not_modified = self.get("distribution", "png", etag=first["ETag"])
+        render.assert_not_called()
+        self.assertEqual(again.body, first.body)
+        self.assertEqual(not_modified.status_code, 304)
+
+        svg = self.get("distribution", "svg", width=400, height=300)
+        self.assertEqual(svg["Content-Type"], "image/svg+xml")
+        self.assertIn(b"<svg", svg.body)
+        self.assertNotEqual(svg["ETag"], first["ETag"])
+        self.assertEqual(len(self.renders()), 2)
+
+    def test_changed_summary_replaces_the_render(self):
+        before = self.get("averages", "png")
+        Dataset.objects.filter(id=self.dataset.id).update(summary={**self.dataset.summary, "avg_flowrate": 80.0})
+        after = self.get("averages", "png", etag=before["ETag"])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after["ETag"], before["ETag"])
+        self.assertEqual(len(self.renders()), 1)
+
+    def test_trend_chart_and_bad_requests(self):
+        trends = self.alice.get("/api/trends/chart.svg", {"bucket": "hour"})
+        self.assertEqual(trends.status_code, 200)
+        self.assertIn(b"<svg", b"".join(trends.streaming_content))
+
+        self.assertEqual(self.get("pareto", "png").status_code, 404)
+        self.assertEqual(self.get("averages", "gif").status_code, 404)
+        self.assertEqual(self.get("averages", "png", width=50).status_code, 400)
+        other = self.client_for("bob").get(f"/api/datasets/{self.dataset.id}/charts/averages.png")
+        self.assertEqual(other.status_code, 404)
+
+
+class TokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="secret")
+        self.token = issue_token(self.user)
+        self.client = APIClient(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def history_status(self):
+        return self.client.get("/api/history/").status_code
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.history_status(), 200)
+        return [q["sql"] for q in queries if "authtoken_token" in q["sql"]]
+
+    def test_repeat_requests_are_authenticated_from_the_cache(self):
+        self.assertEqual(len(self.token_queries()), 1)
+        self.assertEqual(self.token_queries(), [])
+        self.assertIsNotNone(token_cache().get(token_cache_key(self.token.key)))
+
+    @override_settings(TOKEN_TTL=3600)
+    def test_expired_token_is_rejected_and_replaced_on_login(self):
+        self.assertEqual(self.history_status(), 200)
+        later = timezone.now() + timedelta(seconds=3600)
+        with mock.patch("equipment_api.authentication.timezone.now", return_value=later):
+            # cached, but still checked
+            self.assertEqual(self.history_status(), 401)
+            self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+            login = APIClient().post("/api/login/", {"username": "alice", "password": "secret"})
+        fresh = login.json()["token"]
+        self.assertNotEqual(fresh, self.token.key)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {fresh}")
+        self.assertEqual(self.history_status(), 200)
+
+    def test_logout_and_deactivation_drop_the_cached_token(self):
+        self.assertEqual(self.history_status(), 200)
+        self.assertEqual(self.client.post("/api/logout/").status_code, 204)
+        self.assertIsNone(token_cache().get(token_cache_key(self.token.key)))
+        self.assertEqual(self.history_status(), 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {issue_token(self.user).key}")
+        self.assertEqual(self.history_status(), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.history_status(), 401)
+
+
+class ProfileAccessTests(APITestCase):
+    def profile_header(self, client):
+        return client.get("/api/history/", {"profile": "1"}).get("X-Profile")
+
+    def test_staff_can_profile_with_a_session_or_a_token(self):
+        staff = User.objects.create_user("admin", is_staff=True)
+        session = Client()
+        session.force_login(staff)
+        self.assertIsNotNone(self.profile_header(session))
+
+        token = Client(HTTP_AUTHORIZATION=f"Token {issue_token(staff).key}")
+        self.assertIsNotNone(self.profile_header(token))
+
+    def test_other_users_cannot(self):
+        session = Client()
+        session.force_login(User.objects.create_user("alice"))
+        self.assertIsNone(self.profile_header(session))
+        self.assertIsNone(self.profile_header(Client()))
+
+
+class TrendRebuildTests(APITestCase):
+    def rollups(self):
+        return list(TrendRollup.objects.order_by("granularity").values())
+
+    def test_rebuild_uses_exact_state_and_falls_back_for_legacy_rows(self):
+        client = self.client_for("alice")
+        self.upload(client, CSV_HEADER + "P-1,Pump,100.123,5,110\nP-2,Pump,,7,130\n")
+        uploaded = self.rollups()
+
+        call_command("rebuild_trend_rollups", stdout=io.StringIO())
+        rebuilt = self.rollups()
+        for rollup in (*uploaded, *rebuilt):
+            del rollup["id"]
+        self.assertEqual(rebuilt, uploaded)
+        self.assertEqual(rebuilt[0]["flowrate_count"], 1)
+
+        Dataset.objects.update(summary_state=None)
+        call_command("rebuild_trend_rollups", stdout=io.StringIO())
+        legacy = TrendRollup.objects.first()
+        # every row counted at the rounded average
+        self.assertEqual(legacy.flowrate_count, 2)
+        self.assertAlmostEqual(legacy.flowrate_sum, 2 * Dataset.objects.get().summary["avg_flowrate"])
+
+
+class SketchTests(TestCase):
+    FRACTIONS = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+    def round_trip(self, sketch):
+        # through JSON, as Dataset.summary_state stores it
+        return type(sketch).from_state(json.loads(json.dumps(sketch.to_state())))
+
+    def test_merged_kll_quantiles_are_within_the_rank_error(self):
+        values = np.random.default_rng(0).lognormal(4, 1, 200_000)
+        merged = KLLSketch()
+        for part in np.array_split(values, 8):
+            sketch = KLLSketch()
+            for chunk in np.array_split(part, 10):
+                sketch.update(chunk)
+            merged.merge(self.round_trip(sketch))
+
+        self.assertEqual(merged.n, len(values))
+        self.assertLess(sum(len(level) for level in merged.levels), 1_000)
+        ordered = np.sort(values)
+        for fraction, value in zip(self.FRACTIONS, merged.quantiles(self.FRACTIONS)):
+            rank = np.searchsorted(ordered, value) / len(values)
+            # about 1.7/k for k=256
+            self.assertLess(abs(rank - fraction), 0.015, (fraction, rank))
+
+    def test_kll_state_round_trip(self):
+        sketch = KLLSketch(k=64)
+        sketch.update(np.random.default_rng(1).normal(size=5_000))
+        restored = self.round_trip(sketch)
+        self.assertEqual(restored.quantiles(self.FRACTIONS), sketch.quantiles(self.FRACTIONS))
+        more = np.random.default_rng(2).normal(size=5_000)
+        sketch.update(more)
+        restored.update(more)
+        self.assertEqual(restored.to_state(), sketch.to_state())
+
+    def test_kll_is_exact_until_it_compacts(self):
+        sketch = KLLSketch()
+        sketch.update([3.0, np.nan, 1.0, 2.0, 4.0])
+        self.assertEqual(sketch.n, 4)
+        self.assertEqual(sketch.quantiles([0, 0.5, 1]), [1.0, 2.0, 4.0])
+        self.assertEqual(KLLSketch().quantiles([0.5]), [None])
+
+    def test_merged_hll_estimate_is_within_the_standard_error(self):
+        names = np.array([f"EQ-{i}" for i in range(100_000)], dtype=object)
+        whole, merged = HyperLogLog(), HyperLogLog()
+        whole.update(names)
+        # overlapping parts: names seen by two parts are counted once
+        for start in range(0, 100_000, 20_000):
+            part = HyperLogLog()
+            part.update(names[start:start + 30_000])
+            merged.merge(self.round_trip(part))
+
+        np.testing.assert_array_equal(merged.registers, whole.registers)
+        # three standard errors of 1.6% at p=12
+        self.assertLess(abs(merged.estimate() - 100_000), 5_000)
+
+    def test_hll_counts_small_sets_exactly(self):
+        sketch = HyperLogLog()
+        sketch.update(pd.Series(["P-1", "P-2", None, "P-1", "V-1"]))
+        self.assertEqual(sketch.estimate(), 3)
+        restored = self.round_trip(sketch)
+        np.testing.assert_array_equal(restored.registers, sketch.registers)
+        self.assertEqual(HyperLogLog().estimate(), 0)
+
+    def test_accumulator_summary_survives_its_state(self):
+        csv = CSV_HEADER + "".join(f"P-{i % 700},Pump,{i % 97},{i % 13},{i % 31}\n" for i in range(3_000))
+        frames = iter_csv_chunks(io.BytesIO(csv.encode()), engine="c", chunksize=500, columns=ROW_COLUMNS)
+        accumulator = accumulate_frames(frames)
+        restored = SummaryAccumulator.from_state(json.loads(json.dumps(accumulator.to_state())))
+        self.assertEqual(restored.to_summary(), accumulator.to_summary())
+        self.assertAlmostEqual(accumulator.to_summary()["distinct_equipment"], 700, delta=35)
+        self.assertIn("percentiles", accumulator.to_summary())
+
+
+class LRUCacheTests(TestCase):
+    def setUp(self):
+        self.cache = LRUCache("test-lru", {"OPTIONS": {"MAX_ENTRIES": 3}})
+        self.addCleanup(self.cache.clear)
+
+    def test_full_cache_evicts_the_least_recently_used_entry(self):
+        for key in "abc":
+            self.cache.set(key, key)
+        self.cache.get("a")
+        self.cache.set("d", "d")
+        self.assertEqual([self.cache.get(key) for key in "abcd"], ["a", None, "c", "d"])
+
+    def test_expired_entries_are_dropped_when_read(self):
+        self.cache.set("a", "a", timeout=60)
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=time.time() + 120):
+            self.assertIsNone(self.cache.get("a"))
+        self.assertNotIn(self.cache.make_key("a"), self.cache._expire_info)
+
+
+def write_equipment_csv(path, rows, seed=0):
+    """A CSV of `rows` random equipment rows, shaped like sample_equipment_data.csv"""
+    rng = np.random.default_rng(seed)
+    types = np.array(["Pump", "Valve", "Compressor", "Reactor", "Heat Exchanger"])[rng.integers(0, 5, rows)]
+    pd.DataFrame({
+        "Equipment Name": [f"EQ-{i}" for i in range(rows)],
+        "Type": types,
+        "Flowrate": rng.normal(120, 30, rows).round(1),
+        "Pressure": rng.normal(6, 1.5, rows).round(2),
+        "Temperature": rng.normal(115, 15, rows).round(1),
+    }).to_csv(path, index=False)
+    return path
+
+
+class ParallelAggregationTests(TestCase):
+    def test_ranges_are_merged_in_file_order(self):
+        scratch = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, scratch, ignore_errors=True)
+        path = write_equipment_csv(scratch / "equipment.csv", 60_000)
+
+        header, ranges = split_byte_ranges(path, 4)
+        expected = SummaryAccumulator()
+        for start, end in ranges:
+            expected.merge(aggregate_range(str(path), start, end, header, 10_000, 1 << 20))
+
+        with override_settings(AGGREGATION_PARTS_PER_WORKER=2, EQUIPMENT_CSV_CHUNKSIZE=10_000,
+                               EQUIPMENT_CSV_BLOCK_SIZE=1 << 20), \
+                mock.patch("equipment_api.parallel.as_completed", side_effect=lambda fs: reversed(list(fs))):
+            merged = aggregate_csv_parallel(path, workers=2)
+        self.assertEqual(merged.to_summary(), expected.to_summary())
+
+
+RESPONSE_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'summaries': {'BACKEND': 'equipment_api.cache.LRUCache', 'LOCATION': 'test-summaries'},
+    'tokens': {'BACKEND': 'equipment_api.cache.LRUCache', 'LOCATION': 'test-tokens'},
+    'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-responses'},
+}
+
+
+class AsyncViewTests(AsyncAPITestCase):
+    def history_request(self, user, **headers):
+        request = APIRequestFactory().get("/api/history/", **headers)
+        force_authenticate(request, user)
+        return request
+
+    @override_settings(CACHES=RESPONSE_CACHES)
+    def test_history_is_finalized_and_cached_off_the_event_loop(self):
+        self.upload(self.client_for("alice"), CSV_HEADER + "P-1,Pump,100,5,110\n")
+        user = User.objects.get()
+        on_loop = []
+        finalize = CachedResponseMixin.finalize_response
+
+        def record(view, *args, **kwargs):
+            try:
+                on_loop.append(asyncio.get_running_loop() is not None)
+            except RuntimeError:
+                on_loop.append(False)
+            return finalize(view, *args, **kwargs)
+
+        with mock.patch.object(CachedResponseMixin, "finalize_response", record):
+            response = self.call(AsyncHistoryView, self.history_request(user))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), 1)
+            repeat = self.call(AsyncHistoryView, self.history_request(user, HTTP_IF_NONE_MATCH=response["ETag"]))
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(on_loop, [False, False])
+
+    def test_upload_is_summarized_on_the_view_pool_once(self):
+        user = User.objects.create_user("alice")
+        threads = []
+        summarize = AsyncUploadCSV.summarize
+
+        def record(view, *args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return summarize(view, *args, **kwargs)
+
+        body = CSV_HEADER + "P-1,Pump,100,5,110\nV-1,Valve,50,3,90\n"
+        with mock.patch.object(AsyncUploadCSV, "summarize", record):
+            for _ in range(2):
+                request = APIRequestFactory().post(
+                    "/api/upload/", {"file": SimpleUploadedFile("equipment.csv", body.encode())}, format="multipart",
+                )
+                force_authenticate(request, user)
+                response = self.call(AsyncUploadCSV, request)
+                self.assertEqual(response.status_code, 200, response.data)
+                self.assertEqual(response.data["total_equipment"], 2)
+        # the repeat is answered by its hash
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("async-view"), threads)
+        self.assertEqual(Dataset.objects.count(), 1)
+
+    def test_report_is_rendered_by_the_process_pool_and_revalidated(self):
+        self.upload(self.client_for("alice"), CSV_HEADER + "P-1,Pump,100,5,110\n")
+        user = User.objects.get()
+        dataset = Dataset.objects.get()
+
+        def report(user, **headers):
+            request = APIRequestFactory().get(f"/api/report/{dataset.id}/", **headers)
+            force_authenticate(request, user)
+            return self.call(AsyncGeneratePDFView, request, dataset_id=dataset.id)
+
+        response = report(user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(response.content.startswith(b"%PDF"))
+        self.assertEqual(len(list(Path(self.scratch, "reports").glob(f"{dataset.id}-*.pdf"))), 1)
+        self.assertEqual(report(user, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(report(User.objects.create_user("bob")).status_code, 404)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        cached = override_settings(CACHES=RESPONSE_CACHES)
+        cached.enable()
+        self.addCleanup(cached.disable)
+        for cache in caches.all():
+            cache.clear()
+
+    def upload(self, client, body, name="equipment.csv"):
+        # The data version moves on commit, which TestCase never reaches
+        with self.captureOnCommitCallbacks(execute=True):
+            return super().upload(client, body, name)
+
+    def test_matching_etag_is_not_modified(self):
+        alice = self.client_for("alice")
+        self.upload(alice, CSV_HEADER + "P-1,Pump,100,5,110\n")
+        first = alice.get("/api/history/")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["Cache-Control"], "private, no-cache")
+
+        with self.assertNumQueries(0):
+            repeat = alice.get("/api/history/")
+            not_modified = alice.get("/api/history/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(repeat.content, first.content)
+        self.assertEqual(repeat["ETag"], first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], first["ETag"])
+        # another query is another entry
+        self.assertNotEqual(alice.get("/api/history/", {"limit": 1})["ETag"], first["ETag"])
+
+    def test_upload_and_delete_change_the_etag(self):
+        alice = self.client_for("alice")
+        self.upload(alice, CSV_HEADER + "P-1,Pump,100,5,110\n")
+        before = alice.get("/api/history/")
+
+        self.upload(alice, CSV_HEADER + "V-1,Valve,10,1,20\n")
+        after_upload = alice.get("/api/history/", HTTP_IF_NONE_MATCH=before["ETag"])
+        self.assertEqual(after_upload.status_code, 200)
+        self.assertNotEqual(after_upload["ETag"], before["ETag"])
+        self.assertEqual(len(after_upload.json()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Dataset.objects.get(id=after_upload.json()[0]["id"]).delete()
+        after_delete = alice.get("/api/history/", HTTP_IF_NONE_MATCH=after_upload["ETag"])
+        self.assertEqual(after_delete.status_code, 200)
+        self.assertNotIn(after_delete["ETag"], (before["ETag"], after_upload["ETag"]))
+        self.assertEqual([d["id"] for d in after_delete.json()], [before.json()[0]["id"]])
+
+    def test_responses_are_not_shared_between_users(self):
+        alice = self.client_for("alice")
+        bob = self.client_for("bob")
+        self.upload(alice, CSV_HEADER + "P-1,Pump,100,5,110\n")
+        alices = alice.get("/api/history/")
+        self.assertEqual(len(alices.json()), 1)
+
+        bobs = bob.get("/api/history/", HTTP_IF_NONE_MATCH=alices["ETag"])
+        self.assertEqual(bobs.status_code, 200)
+        self.assertEqual(bobs.json(), [])
+        self.assertNotEqual(bobs["ETag"], alices["ETag"])
+        # and bob's upload leaves alice's entry valid
+        self.upload(bob, CSV_HEADER + "V-1,Valve,10,1,20\n")
+        self.assertEqual(alice.get("/api/history/", HTTP_IF_NONE_MATCH=alices["ETag"]).status_code, 304)
+
+
+class AnomalyDetectionTests(TestCase):
+    def store(self, rows, seed=0):
+        scratch = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, scratch, ignore_errors=True)
+        rng = np.random.default_rng(seed)
+        writer = SegmentWriter(scratch / "part-00000")
+        writer.write(pd.DataFrame({
+            "Type": np.array(["Pump", "Valve", None], dtype=object)[rng.integers(0, 3, rows)],
+            "Flowrate": rng.standard_t(3, rows) * 30 + 120,
+            "Pressure": np.where(rng.random(rows) < 0.1, np.nan, rng.normal(6, 1.5, rows)),
+            "Temperature": rng.lognormal(4, 0.5, rows),
+        }))
+        writer.close()
+        return RowStore(scratch)
+
+    def test_small_types_get_exact_bounds_whatever_the_block_size(self):
+        store = self.store(300)
+        for method in ("iqr", "mad"):
+            with self.subTest(method=method):
+                whole = detect_anomalies(store, method)
+                self.assertEqual(detect_anomalies(store, method, block_rows=7), whole)
+
+        codes = np.asarray(store.type_codes())
+        flowrate = np.asarray(store.column("Flowrate"))[codes == store.types.index("Pump")]
+        q1, q3 = np.quantile(flowrate, [0.25, 0.75])
+        self.assertEqual(
+            detect_anomalies(store)["bounds"]["Pump"]["Flowrate"], [q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)]
+        )
+
+    def test_memory_does_not_grow_with_rows(self):
+        peaks = []
+        for rows in (100_000, 800_000):
+            store = self.store(rows)
+            tracemalloc.start()
+            try:
+                detect_anomalies(store, "mad", block_rows=10_000)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        # a single column of the larger store alone is 6.4 MB
+        self.assertLess(peaks[1], 3 * 2 ** 20)
+        self.assertLess(peaks[1], peaks[0] * 1.5)
+
+
+@override_settings(EQUIPMENT_CSV_CHUNKSIZE=5_000, EQUIPMENT_CSV_BLOCK_SIZE=32 * 1024, ANOMALY_BLOCK_ROWS=5_000,
+                   EQUIPMENT_ROW_BATCH_SIZE=5_000, FILE_UPLOAD_MAX_MEMORY_SIZE=64 * 1024)
+class UploadMemoryTests(APITestCase):
+    """
+    Peak memory of a whole upload through the view: receiving the body,
+    parsing, row staging, EquipmentRow loading and the anomaly stage.
+    Chunks, blocks, pyarrow's read-ahead (some 35 blocks) and the part of
+    an upload Django keeps in memory are all scaled down below the size of
+    either file, so a 4x larger upload may only need a fraction of one
+    float column more.
+    """
+
+    def post_file(self, client, path):
+        # Streamed from disk as wsgi.input, as a server would: the test
+        # client's own encoder holds the whole body in memory
+        boundary = "UploadMemoryBoundary"
+        body = tempfile.TemporaryFile()
+        self.addCleanup(body.close)
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{path.name}"\r\n'
+                   "Content-Type: text/csv\r\n\r\n".encode())
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, body)
+        body.write(f"\r\n--{boundary}--\r\n".encode())
+        length = body.tell()
+        body.seek(0)
+        return client.generic(
+            "POST", "/api/upload/", content_type=f"multipart/form-data; boundary={boundary}",
+            **{"wsgi.input": body, "CONTENT_LENGTH": str(length)},
+        )
+
+    def peak_upload_memory(self, rows, seed):
+        path = write_equipment_csv(Path(self.scratch) / f"equipment_{rows}.csv", rows, seed=seed)
+        client = self.client_for(f"user{rows}-{seed}")
+        tracemalloc.start()
+        try:
+            response = self.post_file(client, path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(response.status_code, 200, response.content[:200])
+        self.assertEqual(response.json()["total_equipment"], rows)
+        self.assertIn("anomalies", response.json())
+        return peak
+
+    def test_peak_memory_does_not_grow_with_the_upload(self):
+        for streaming in (False, True):
+            with self.subTest(streaming=streaming), override_settings(UPLOAD_STREAMING=streaming):
+                # a first upload, so imports and first-use caches are not counted
+                self.peak_upload_memory(1_000, seed=streaming)
+                small = self.peak_upload_memory(40_000, seed=streaming)
+                large = self.peak_upload_memory(160_000, seed=streaming)
+                # The extra 120,000 rows are 3.7 MB of CSV and 0.96 MB per
+                # float column; the sketches grow a little with the count
+                self.assertLess(large - small, 120_000 * 8 / 2, (small, large))
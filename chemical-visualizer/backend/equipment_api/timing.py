@@ -0,0 +1,256 @@
+"""
+Per-request phase timings, profiling and Prometheus metrics.
+
+Hot paths wrap their work in timed("phase"); RequestTimingMiddleware
+collects the phases of the request in flight (plus total ORM query time
+as "db") and reports them as a Server-Timing header, one JSON log line on
+the "equipment_api.requests" logger and latency histograms served by
+/api/metrics/. Everything is kept in process: each worker exposes its own
+metrics, which is what Prometheus expects when scraping workers directly.
+"""
+import copy
+import cProfile
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from importlib import import_module
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger('equipment_api.requests')
+
+# Phases of the request being handled in this context, None outside one
+_phases = ContextVar('request_phases', default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to `phase` of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = _phases.get()
+        if phases is not None:
+            phases[phase] = phases.get(phase, 0.0) + time.perf_counter() - start
+
+
+def _time_query(execute, sql, params, many, context):
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_query_timer(sender, connection, **kwargs):
+    # On every connection rather than around each request: async views run
+    # their queries in other threads, on those threads' connections
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+class Histogram:
+    """Thread-safe Prometheus histogram with a fixed label set"""
+
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # one count per bucket, then the sum and the total count
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def exposition(self):
+        """Lines of the Prometheus text format for every observed series"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+            bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, values[:len(self.buckets)] + [values[-1]]):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(pairs + [le])} {count}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {values[-1]}")
+        return lines
+
+
+def _labels(pairs):
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', "Request latency by route.", ('method', 'route', 'status'),
+)
+PHASE_SECONDS = Histogram(
+    'request_phase_duration_seconds', "Time spent per request in each timed phase.", ('phase',),
+)
+
+
+def metrics_text():
+    """Every metric in the Prometheus text exposition format"""
+    return "\n".join(REQUEST_SECONDS.exposition() + PHASE_SECONDS.exposition()) + "\n"
+
+
+def server_timing(phases, total):
+    entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in phases.items()]
+    return ", ".join(entries + [f"total;dur={total * 1000:.1f}"])
+
+
+def _session_request(request):
+    """
+    A copy of the request carrying the session and user that
+    SessionMiddleware and AuthenticationMiddleware, further down the
+    chain, will attach; SessionAuthentication reads that user.
+    """
+    probe = copy.copy(request)
+    engine = import_module(settings.SESSION_ENGINE)
+    probe.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    probe.user = SimpleLazyObject(lambda: get_user(probe))
+    return probe
+
+
+def _is_staff(request):
+    # DRF authenticates inside the view, too late to start a profiler, so
+    # run the configured authenticators up front for ?profile=1 requests
+    if not hasattr(request, 'user'):
+        request = _session_request(request)
+    drf_request = Request(
+        request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    try:
+        return drf_request.user.is_staff
+    except APIException:
+        return False
+
+
+class RequestTimingMiddleware:
+    """
+    Times every request and its phases; ?profile=1 from a staff user also
+    writes a cProfile dump to PROFILE_DIR, named in the X-Profile header.
+
+    Works under WSGI and ASGI. An async request's profile covers only the
+    event loop thread, including whatever other requests ran on it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    # cProfile cannot run in two threads at once
+    _profile_lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profiler = None
+        if request.GET.get('profile') == '1' and _is_staff(request):
+            profiler = self.start_profile(request)
+        phases = {}
+        token = _phases.set(phases)
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                response = self.get_response(request)
+            else:
+                try:
+                    response = profiler.runcall(self.get_response, request)
+                finally:
+                    self._profile_lock.release()
+        finally:
+            _phases.reset(token)
+        return self.finish(request, response, phases, time.perf_counter() - start, profiler)
+
+    async def __acall__(self, request):
+        profiler = None
+        if request.GET.get('profile') == '1' and await sync_to_async(_is_staff)(request):
+            profiler = self.start_profile(request)
+        phases = {}
+        token = _phases.set(phases)
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                response = await self.get_response(request)
+            else:
+                profiler.enable()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    profiler.disable()
+                    self._profile_lock.release()
+        finally:
+            _phases.reset(token)
+        return self.finish(request, response, phases, time.perf_counter() - start, profiler)
+
+    def start_profile(self, request):
+        """A profiler holding the profile lock, or None if another request has it"""
+        if self._profile_lock.acquire(blocking=False):
+            return cProfile.Profile()
+        logger.warning("profile skipped for %s: another request is being profiled", request.path)
+        return None
+
+    def finish(self, request, response, phases, total, profiler):
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        REQUEST_SECONDS.observe((request.method, route, str(response.status_code)), total)
+        for phase, seconds in phases.items():
+            PHASE_SECONDS.observe((phase,), seconds)
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(phases, total)
+        if profiler is not None:
+            response['X-Profile'] = self.dump_profile(profiler, request)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 1),
+            'phases_ms': {phase: round(seconds * 1000, 1) for phase, seconds in phases.items()},
+        }))
+        return response
+
+    def dump_profile(self, profiler, request):
+        """Write the profile to PROFILE_DIR and return its file name"""
+        profile_dir = Path(settings.PROFILE_DIR)
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{request.method}-{slug}-{time.time_ns() % 10**9}.prof"
+        profiler.dump_stats(profile_dir / name)
+        logger.info("profile for %s %s written to %s", request.method, request.path, name)
+        return name
@@ -0,0 +1,169 @@
+"""
+Upload handlers that do work while the request body is still arriving.
+
+UploadHashHandler hashes the "file" field as it passes through to Django's
+own handlers, so a repeat upload is answered from the summary cache with
+no second read of the file and nothing parsed. StreamingCSVUploadHandler
+(UPLOAD_STREAMING) goes further and summarizes a CSV as it arrives, with
+no temp file at all. Only the hash is known once the body is in, so it
+pays the full parse even for content already summarized: it suits slow
+clients sending mostly new files, not repeat uploads of hot ones.
+"""
+import csv
+import hashlib
+import io
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from .ingest import ROW_COLUMNS, SUMMARY_COLUMNS, SummaryAccumulator, iter_csv_chunks, present_columns
+from .rowstore import SegmentWriter, staging_area
+from .timing import timed
+
+
+class UploadHashHandler(FileUploadHandler):
+    """
+    BLAKE2b of the "file" field, computed as the chunks go by. Leaves the
+    file itself to the next handler; content_hash is set once it is
+    complete.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digest = None
+        self.content_hash = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.digest = hashlib.blake2b(digest_size=32) if field_name == 'file' else None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.digest is not None:
+            self.digest.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.digest is not None:
+            self.content_hash = self.digest.hexdigest()
+            self.digest = None
+        return None
+
+
+class StreamedCSVUpload(UploadedFile):
+    """
+    The "file" of a CSV upload parsed by StreamingCSVUploadHandler: its
+    SummaryAccumulator and staged row segments (rows_dir, None when rows
+    are not stored) instead of the bytes. Closing it, which
+    Django does at the end of the request, drops rows that were not
+    committed.
+    """
+
+    def __init__(self, name, size, content_type, charset, accumulator, rows_dir, cleanup):
+        super().__init__(None, name, content_type, size, charset)
+        self.accumulator = accumulator
+        self.rows_dir = rows_dir
+        self._cleanup = cleanup
+
+    def close(self):
+        self._cleanup.close()
+
+
+class StreamingCSVUploadHandler(FileUploadHandler):
+    """
+    Feeds the "file" field of a CSV upload to the summary accumulator as it
+    comes off the socket.
+
+    Bytes are buffered as they arrive until a block of
+    EQUIPMENT_CSV_BLOCK_SIZE has built up; the complete lines in it are
+    parsed like a headerless byte range of the file (see parallel.py, and
+    the same assumption that no quoted field spans a newline) and the rest
+    is carried into the next block. Other fields and non-CSV files are left
+    to the next handler.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.active = False
+        self.cleanup = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None,
+                 content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        # an earlier file's staged rows now belong to its StreamedCSVUpload
+        self.cleanup = None
+        self.active = field_name == 'file' and file_name.endswith('.csv')
+        if not self.active:
+            return
+        self.cleanup = ExitStack()
+        self.rows_dir = self.cleanup.enter_context(staging_area())
+        self.columns = SUMMARY_COLUMNS if self.rows_dir is None else ROW_COLUMNS
+        self.writer = None if self.rows_dir is None else SegmentWriter(self.rows_dir / 'part-00000')
+        # before the staging directory is removed
+        self.cleanup.callback(self.close_writer)
+        self.accumulator = SummaryAccumulator()
+        self.buffer = bytearray()
+        self.header = None
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        self.buffer += raw_data
+        if len(self.buffer) >= settings.EQUIPMENT_CSV_BLOCK_SIZE:
+            self.parse_buffer(final=False)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+        self.parse_buffer(final=True)
+        self.close_writer()
+        return StreamedCSVUpload(
+            self.file_name, file_size, self.content_type, self.charset,
+            self.accumulator, self.rows_dir, self.cleanup,
+        )
+
+    def parse_buffer(self, final):
+        """Parse the complete lines buffered so far, or everything if final"""
+        try:
+            if self.header is None:
+                end = self.buffer.find(b'\n')
+                if end < 0 and not final:
+                    return
+                end = len(self.buffer) if end < 0 else end + 1
+                self.header = next(csv.reader([self.buffer[:end].decode('utf-8-sig')]), [])
+                del self.buffer[:end]
+                # fail before the rest of the body is read
+                self.columns = present_columns(self.header, self.columns)
+            cut = len(self.buffer) if final else self.buffer.rfind(b'\n') + 1
+            if not cut:
+                return
+            block = bytes(self.buffer[:cut])
+            del self.buffer[:cut]
+            if not block.strip():
+                return
+            with timed('parse'):
+                for df in iter_csv_chunks(io.BytesIO(block), names=self.header, columns=self.columns):
+                    self.accumulator.update(df)
+                    if self.writer is not None:
+                        self.writer.write(df)
+        except BaseException:
+            self.discard()
+            raise
+
+    def close_writer(self):
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.close()
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def discard(self):
+        """Drop the staged rows of an upload that will not be completed"""
+        self.active = False
+        if self.cleanup is not None:
+            self.cleanup.close()
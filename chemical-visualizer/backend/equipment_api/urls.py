@@ -1,12 +1,36 @@
+from django.conf import settings
 from django.urls import path
-from .views import UploadCSV, HistoryView, GeneratePDFView
-from .auth_views import RegisterView, LoginView
+from .views import (
+    UploadCSV, HistoryView, GeneratePDFView, UploadJobView, BulkReportView, TypeStatsView,
+    PercentileStatsView, TrendsView, DatasetAnalysisView, DatasetEquipmentView,
+    DatasetAnomaliesView, DatasetChartView, TrendChartView, MetricsView,
+)
+from .auth_views import RegisterView, LoginView, LogoutView
+
+if settings.ASYNC_VIEWS:
+    from .async_views import (
+        AsyncGeneratePDFView as GeneratePDFView,
+        AsyncHistoryView as HistoryView,
+        AsyncUploadCSV as UploadCSV,
+    )
 
 urlpatterns = [
     path('upload/', UploadCSV.as_view(), name='upload-csv'),
     path('history/', HistoryView.as_view(), name='history'),
     path('report/<int:dataset_id>/', GeneratePDFView.as_view(), name='generate-pdf'),
+    path('reports/', BulkReportView.as_view(), name='bulk-report'),
+    path('stats/types/', TypeStatsView.as_view(), name='type-stats'),
+    path('stats/percentiles/', PercentileStatsView.as_view(), name='percentile-stats'),
+    path('trends/', TrendsView.as_view(), name='trends'),
+    path('trends/chart.<str:fmt>', TrendChartView.as_view(), name='trends-chart'),
+    path('datasets/<int:dataset_id>/analysis/', DatasetAnalysisView.as_view(), name='dataset-analysis'),
+    path('datasets/<int:dataset_id>/equipment/', DatasetEquipmentView.as_view(), name='dataset-equipment'),
+    path('datasets/<int:dataset_id>/anomalies/', DatasetAnomaliesView.as_view(), name='dataset-anomalies'),
+    path('datasets/<int:dataset_id>/charts/<slug:kind>.<str:fmt>', DatasetChartView.as_view(), name='dataset-chart'),
+    path('jobs/<int:job_id>/', UploadJobView.as_view(), name='upload-job'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
 ]
 
@@ -1,50 +1,266 @@
-import pandas as pd
+import tempfile
+from datetime import datetime, time
+import numpy as np
 # from rest_framework.views import APIView
 # from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 # from .models import Dataset
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.http import HttpResponse
-from .models import Dataset
-from .pdf_generator import generate_equipment_report
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
+from .models import Dataset, EquipmentRow, EquipmentTypeStats, TrendRollup, UploadJob
+from .reports import get_or_render_report, iter_report_zip, report_etag, write_combined_report
+from .datasets import append_upload, create_dataset, ingest_upload
+from .ingest import (
+    NUMERIC_COLUMNS, SUMMARY_KEYS, SUMMARY_PERCENTILES, UPLOAD_ERRORS, SummaryAccumulator, frame_reader,
+    hash_upload,
+)
+from .cache import summary_cache, summary_cache_key
+from .jobs import enqueue_upload, recover_stale_jobs, refresh_anomalies_later
+from .serializers import UploadJobSerializer
+from .charts import CHART_FORMATS, DATASET_CHARTS, TRENDS_CHART, chart_etag, chart_key, get_or_render_chart
+from .analysis import DEFAULT_PERCENTILES, anomaly_mask, describe_rows
+from .response_cache import CachedResponseMixin
+from .rowstore import open_rows
+from .timing import metrics_text, timed
+from .uploads import StreamedCSVUpload, StreamingCSVUploadHandler, UploadHashHandler
 
-class HistoryView(APIView):
+HISTORY_FIELDS = (
+    'id', 'uploaded_at', 'total_equipment', 'avg_flowrate',
+    'avg_pressure', 'avg_temperature', 'type_distribution',
+)
+
+
+def _owned_datasets(request):
+    """Datasets the requesting user uploaded; every dataset lookup goes through this"""
+    return Dataset.objects.filter(owner=request.user)
+
+
+def _unreadable(exc):
+    return Response({"error": f"Could not read the upload: {exc}"}, status=400)
+
+
+def _parse_upload_time(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class HistoryView(CachedResponseMixin, APIView):
     permission_classes = [IsAuthenticated]
+    """
+    The user's dataset summaries, newest first, with keyset pagination on
+    id (a range scan of dataset_owner_id_idx).
+
+    Query params: limit, cursor (ids below it), uploaded_after /
+    uploaded_before (ISO date or datetime) and fields (comma separated
+    projection). The next page is advertised in a Link header. Pages are
+    cached until the user's datasets change, with an ETag for 304s.
+    """
+
     def get(self, request):
-        data = Dataset.objects.all().order_by('-id')[:5]
-        return Response([d.summary for d in data])
+        cached = self.cached_response(request)
+        if cached is not None:
+            return cached
+        page = self.page(request)
+        if isinstance(page, Response):
+            return page
+        queryset, fields, limit = page
+        return self.page_response(request, list(queryset), fields, limit)
+
+    def page(self, request):
+        """The page's values() queryset (one row past the limit), fields and limit, or an error Response"""
+        params = request.query_params
+        try:
+            limit = int(params.get('limit', 5))
+            cursor = int(params['cursor']) if params.get('cursor') else None
+            uploaded_after = _parse_upload_time(params['uploaded_after']) if params.get('uploaded_after') else None
+            uploaded_before = _parse_upload_time(params['uploaded_before']) if params.get('uploaded_before') else None
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        if not 1 <= limit <= settings.HISTORY_MAX_LIMIT:
+            return Response({"error": f"limit must be between 1 and {settings.HISTORY_MAX_LIMIT}"}, status=400)
+
+        fields = [f for f in params.get('fields', '').split(',') if f] or list(HISTORY_FIELDS)
+        unknown = set(fields) - set(HISTORY_FIELDS)
+        if unknown:
+            return Response({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}, status=400)
+
+        queryset = _owned_datasets(request).order_by('-id')
+        if cursor is not None:
+            queryset = queryset.filter(id__lt=cursor)
+        if uploaded_after is not None:
+            queryset = queryset.filter(uploaded_at__gte=uploaded_after)
+        if uploaded_before is not None:
+            queryset = queryset.filter(uploaded_at__lt=uploaded_before)
+
+        summary_keys = [f for f in fields if f not in ('id', 'uploaded_at')]
+        if len(summary_keys) == len(HISTORY_FIELDS) - 2:
+            queryset = queryset.values('id', 'uploaded_at', 'summary')
+        else:
+            # Extract just the requested keys in SQL so large blobs such as
+            # type_distribution are never loaded or decoded
+            queryset = queryset.values(
+                'id', 'uploaded_at', **{key: F(f'summary__{key}') for key in summary_keys}
+            )
+        return queryset[:limit + 1], fields, limit
+
+    def page_response(self, request, rows, fields, limit):
+        if rows and 'summary' in rows[0]:
+            rows = [{'id': row['id'], 'uploaded_at': row['uploaded_at'], **row['summary']} for row in rows]
+        response = Response([{f: row.get(f) for f in fields} for row in rows[:limit]])
+        if len(rows) > limit:
+            next_params = request.query_params.copy()
+            next_params['cursor'] = rows[limit - 1]['id']
+            next_url = request.build_absolute_uri(f"{request.path}?{next_params.urlencode()}")
+            response['Link'] = f'<{next_url}>; rel="next"'
+        return response
+
 
 class UploadCSV(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)  # 🔴 THIS IS CRITICAL
 
     def post(self, request):
-        file = request.FILES.get("file")
+        file = self.receive(request)
+        if isinstance(file, Response):
+            return file
+        if request.query_params.get('append'):
+            return self.append(request, file)
+
+        # Identical bytes were already summarized: answer from the cache,
+        # then the DB, and only run pandas for content we have never seen.
+        content_hash = self.content_hash(file)
+        cache = summary_cache()
+        cache_key = summary_cache_key(content_hash, request.user.id)
+
+        with timed('cache'):
+            summary = cache.get(cache_key)
+        if summary is None:
+            summary = self.stored_summaries(request, content_hash).first()
+        if summary is not None:
+            self.discard(file)
+        else:
+            summary = self.summarize(request, file, content_hash)
+            if isinstance(summary, Response):
+                return summary
+
+        cache.set(cache_key, summary)
+        return Response(summary)
+
+    def receive(self, request):
+        """The uploaded file, parsed off the request body, or an error Response"""
+        params = request.query_params
+        handler = None
+        if settings.UPLOAD_STREAMING and not params.get('append') and params.get('async') != '1':
+            # Summarize CSVs while the body arrives (append and async uploads
+            # need the file's bytes, so they are spooled as usual)
+            handler = StreamingCSVUploadHandler(request)
+            request.upload_handlers.insert(0, handler)
+        # Ahead of the others, so the body is hashed on its way to them
+        hasher = UploadHashHandler(request)
+        request.upload_handlers.insert(0, hasher)
+        with timed('multipart'):
+            try:
+                file = request.FILES.get("file")
+            except UPLOAD_ERRORS as exc:
+                # a streamed CSV without the summary columns, or unparseable
+                if handler is not None:
+                    handler.discard()
+                return _unreadable(exc)
+            except Exception:
+                if handler is not None:
+                    handler.discard()
+                raise
 
         if not file:
             return Response({"error": "No file uploaded"}, status=400)
 
-        filename = file.name
-
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif filename.endswith('.xls') or filename.endswith('.xlsx'):
-            df = pd.read_excel(file)
-        else:
+        if frame_reader(file.name) is None:
             return Response({"error": "Only CSV or Excel files allowed"}, status=400)
+        file.content_hash = hasher.content_hash
+        return file
 
-        summary = {
-            "total_equipment": int(len(df)),
-            "avg_flowrate": round(df["Flowrate"].mean(), 2),
-            "avg_pressure": round(df["Pressure"].mean(), 2),
-            "avg_temperature": round(df["Temperature"].mean(), 2),
-            "type_distribution": df["Type"].value_counts().to_dict()
-        }
+    def content_hash(self, file):
+        if getattr(file, 'content_hash', None):
+            return file.content_hash
+        with timed('hash'):
+            return hash_upload(file)
+
+    def discard(self, file):
+        """Drop the work done on an upload whose summary was found by its hash"""
+        if isinstance(file, StreamedCSVUpload):
+            # its staged rows, now rather than when the request ends
+            file.close()
+
+    def stored_summaries(self, request, content_hash):
+        return _owned_datasets(request).filter(content_hash=content_hash).values_list('summary', flat=True)
+
+    def summarize(self, request, file, content_hash):
+        """Summary of content not seen before, or a 202 Response for ?async=1"""
+        if request.query_params.get('async') == '1':
+            # Hand big files to the worker pool instead of tying up this worker
+            job = enqueue_upload(file, content_hash, request.user)
+            return Response(UploadJobSerializer(job).data, status=202)
+        if isinstance(file, StreamedCSVUpload):
+            return create_dataset(
+                file.accumulator, content_hash, rows_dir=file.rows_dir, owner=request.user
+            ).summary
+        path = file.temporary_file_path() if hasattr(file, 'temporary_file_path') else None
+        try:
+            return ingest_upload(file, file.name, content_hash, path=path, owner=request.user).summary
+        except UPLOAD_ERRORS as exc:
+            return _unreadable(exc)
+
+    def append(self, request, file):
+        """Merge the upload into dataset ?append=<id> and return its new summary"""
+        try:
+            dataset_id = int(request.query_params['append'])
+        except ValueError:
+            return Response({"error": "append must be a dataset id"}, status=400)
+        if request.query_params.get('async') == '1':
+            return Response({"error": "append uploads cannot be async"}, status=400)
+
+        dataset = _owned_datasets(request).filter(id=dataset_id).only('summary_state').first()
+        if dataset is None:
+            return Response({"error": "Dataset not found"}, status=404)
+        if dataset.summary_state is None:
+            return Response({"error": "Dataset predates appends and cannot be extended"}, status=409)
+
+        path = file.temporary_file_path() if hasattr(file, 'temporary_file_path') else None
+        try:
+            dataset = append_upload(dataset_id, file, file.name, path=path)
+        except UPLOAD_ERRORS as exc:
+            return _unreadable(exc)
+        refresh_anomalies_later(dataset)
+        return Response(dataset.summary)
 
-        Dataset.objects.create(summary=summary)
-        return Response(summary)
+
+class UploadJobView(APIView):
+    permission_classes = [IsAuthenticated]
+    """Progress and result of an asynchronous upload, recovering it first if it went stale"""
+
+    def get(self, request, job_id):
+        jobs = UploadJob.objects.filter(id=job_id, owner=request.user)
+        recover_stale_jobs(jobs)
+        try:
+            job = jobs.select_related('dataset').get()
+        except UploadJob.DoesNotExist:
+            return Response({"error": "Job not found"}, status=404)
+
+        return Response(UploadJobSerializer(job).data)
 
 
 class GeneratePDFView(APIView):
@@ -53,13 +269,491 @@ class GeneratePDFView(APIView):
     
     def get(self, request, dataset_id):
         try:
-            dataset = Dataset.objects.get(id=dataset_id)
+            dataset = _owned_datasets(request).get(id=dataset_id)
         except Dataset.DoesNotExist:
             return Response({"error": "Dataset not found"}, status=404)
         
-        pdf_buffer = generate_equipment_report(dataset.summary, dataset_id)
-        
-        response = HttpResponse(pdf_buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="equipment_report_{dataset_id}.pdf"'
+        etag = report_etag(dataset)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        # Rendered once per dataset summary, then streamed from disk
+        response = FileResponse(
+            open(get_or_render_report(dataset), 'rb'),
+            as_attachment=True,
+            filename=f"equipment_report_{dataset_id}.pdf",
+            content_type='application/pdf',
+        )
+        response['ETag'] = etag
+        return response
+
+
+
+class BulkReportView(APIView):
+    permission_classes = [IsAuthenticated]
+    """Reports for many datasets as one streamed ZIP or a combined PDF"""
+
+    def get(self, request):
+        ids = request.query_params.get('ids')
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        # not "format": DRF reserves that for renderer selection
+        output = request.query_params.get('output', 'zip')
+
+        try:
+            if ids:
+                datasets = _owned_datasets(request).filter(id__in=[int(i) for i in ids.split(',')])
+            elif start and end:
+                datasets = _owned_datasets(request).filter(id__gte=int(start), id__lte=int(end))
+            else:
+                return Response({"error": "Pass ids=1,2,3 or start and end"}, status=400)
+        except ValueError:
+            return Response({"error": "Dataset ids must be integers"}, status=400)
+        if output not in ('zip', 'pdf'):
+            return Response({"error": "output must be zip or pdf"}, status=400)
+
+        datasets = list(datasets.order_by('id')[:settings.BULK_REPORT_MAX_DATASETS])
+        if not datasets:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        if output == 'pdf':
+            # Built on disk rather than in memory, then streamed back
+            pdf_file = tempfile.TemporaryFile()
+            write_combined_report(datasets, pdf_file)
+            pdf_file.seek(0)
+            return FileResponse(
+                pdf_file,
+                as_attachment=True,
+                filename="equipment_reports.pdf",
+                content_type='application/pdf',
+            )
+
+        response = StreamingHttpResponse(iter_report_zip(datasets), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="equipment_reports.zip"'
+        return response
+
+
+class TypeStatsView(APIView):
+    permission_classes = [IsAuthenticated]
+    """
+    Per equipment type statistics across the user's datasets, aggregated in SQL.
+
+    Optional filters: type, uploaded_after, uploaded_before.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        queryset = EquipmentTypeStats.objects.filter(dataset__owner=request.user)
+        try:
+            if params.get('uploaded_after'):
+                queryset = queryset.filter(dataset__uploaded_at__gte=_parse_upload_time(params['uploaded_after']))
+            if params.get('uploaded_before'):
+                queryset = queryset.filter(dataset__uploaded_at__lt=_parse_upload_time(params['uploaded_before']))
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        if params.get('type'):
+            queryset = queryset.filter(equipment_type=params['type'])
+
+        aggregates = {'datasets': Count('dataset'), 'count': Sum('count')}
+        for col in NUMERIC_COLUMNS:
+            prefix = col.lower()
+            aggregates[f'{prefix}_count'] = Sum(f'{prefix}_count')
+            aggregates[f'{prefix}_sum'] = Sum(f'{prefix}_sum')
+            aggregates[f'{prefix}_sumsq'] = Sum(f'{prefix}_sumsq')
+            aggregates[f'{prefix}_min'] = Min(f'{prefix}_min')
+            aggregates[f'{prefix}_max'] = Max(f'{prefix}_max')
+        rows = queryset.values('equipment_type').annotate(**aggregates).order_by('equipment_type')
+
+        results = []
+        for row in rows:
+            item = {
+                'equipment_type': row['equipment_type'],
+                'datasets': row['datasets'],
+                'count': row['count'],
+            }
+            for col in NUMERIC_COLUMNS:
+                prefix = col.lower()
+                n = row[f'{prefix}_count']
+                if not n:
+                    item[prefix] = None
+                    continue
+                mean = row[f'{prefix}_sum'] / n
+                variance = max(row[f'{prefix}_sumsq'] / n - mean * mean, 0.0)
+                item[prefix] = {
+                    'count': n,
+                    'avg': round(mean, 2),
+                    'std': round(variance ** 0.5, 2),
+                    'min': row[f'{prefix}_min'],
+                    'max': row[f'{prefix}_max'],
+                }
+            results.append(item)
+        return Response(results)
+
+
+class PercentileStatsView(APIView):
+    permission_classes = [IsAuthenticated]
+    """
+    Approximate percentiles and distinct equipment across the user's datasets.
+
+    Merges the sketches kept in each dataset's summary state, so memory
+    stays constant however many datasets or rows are covered. Query
+    params: ids (comma separated), uploaded_after, uploaded_before and
+    percentiles (default 50,95,99). Datasets without sketches are left out
+    and counted in datasets_skipped.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        queryset = _owned_datasets(request)
+        try:
+            if params.get('ids'):
+                queryset = queryset.filter(id__in=[int(i) for i in params['ids'].split(',')])
+            if params.get('uploaded_after'):
+                queryset = queryset.filter(uploaded_at__gte=_parse_upload_time(params['uploaded_after']))
+            if params.get('uploaded_before'):
+                queryset = queryset.filter(uploaded_at__lt=_parse_upload_time(params['uploaded_before']))
+            raw = params.get('percentiles')
+            percentiles = [float(p) for p in raw.split(',')] if raw else list(SUMMARY_PERCENTILES)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        if not percentiles or not all(0 <= p <= 100 for p in percentiles):
+            return Response({"error": "percentiles must be between 0 and 100"}, status=400)
+
+        merged = SummaryAccumulator()
+        datasets = skipped = 0
+        for state in queryset.values_list('summary_state', flat=True).iterator():
+            if not state or not state.get('quantiles'):
+                skipped += 1
+                continue
+            merged.merge(SummaryAccumulator.from_state(state))
+            datasets += 1
+
+        result = {}
+        for col in NUMERIC_COLUMNS:
+            values = merged.quantiles[col].quantiles([p / 100 for p in percentiles])
+            result[col] = {f"p{p:g}": None if v is None else round(v, 2) for p, v in zip(percentiles, values)}
+        return Response({
+            'datasets': datasets,
+            'datasets_skipped': skipped,
+            'total_equipment': merged.total,
+            'percentiles': result,
+            'distinct_equipment': None if merged.names is None else merged.names.estimate(),
+        })
+
+
+def _chart_response(request, prefix, kind, plot, data, fmt):
+    """Serve a cached chart image with ETag / If-None-Match support"""
+    try:
+        width = int(request.query_params.get('width', 800))
+        height = int(request.query_params.get('height', 500))
+    except ValueError:
+        return Response({"error": "width and height must be integers"}, status=400)
+    if not (100 <= width <= settings.CHART_MAX_SIZE and 100 <= height <= settings.CHART_MAX_SIZE):
+        return Response({"error": f"width and height must be between 100 and {settings.CHART_MAX_SIZE}"}, status=400)
+
+    etag = chart_etag(chart_key(prefix, kind, data, width, height), fmt)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return HttpResponseNotModified(headers={'ETag': etag})
+
+    response = FileResponse(
+        open(get_or_render_chart(prefix, kind, plot, data, fmt, width, height), 'rb'),
+        content_type=CHART_FORMATS[fmt],
+    )
+    response['ETag'] = etag
+    return response
+
+
+class DatasetChartView(APIView):
+    permission_classes = [IsAuthenticated]
+    """
+    A dataset chart rendered server-side as PNG or SVG.
+
+    kind is one of DATASET_CHARTS; width and height are in pixels
+    (default 800x500). Renders are cached by summary hash and size.
+    """
+
+    def get(self, request, dataset_id, kind, fmt):
+        if kind not in DATASET_CHARTS or fmt not in CHART_FORMATS:
+            return Response({"error": "Unknown chart"}, status=404)
+        try:
+            dataset = _owned_datasets(request).get(id=dataset_id)
+        except Dataset.DoesNotExist:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        plot, available = DATASET_CHARTS[kind]
+        if not available(dataset.summary):
+            return Response({"error": f"Dataset has no data for a {kind} chart"}, status=404)
+        return _chart_response(request, dataset.id, kind, plot, dataset.summary, fmt)
+
+
+class TrendsView(APIView):
+    permission_classes = [IsAuthenticated]
+    """
+    Flow, pressure and temperature averages of the user's uploads per hour,
+    day or week.
+
+    Served from TrendRollup rows maintained at upload time. Query params:
+    bucket (hour/day/week, default day), start, end and limit (most recent
+    buckets, default 30).
+    """
+
+    def get(self, request):
+        params = request.query_params
+        granularity = params.get('bucket', TrendRollup.DAY)
+        if granularity not in dict(TrendRollup.GRANULARITY_CHOICES):
+            return Response({"error": "bucket must be hour, day or week"}, status=400)
+        try:
+            limit = int(params.get('limit', 30))
+            start = _parse_upload_time(params['start']) if params.get('start') else None
+            end = _parse_upload_time(params['end']) if params.get('end') else None
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        if not 1 <= limit <= settings.TRENDS_MAX_BUCKETS:
+            return Response({"error": f"limit must be between 1 and {settings.TRENDS_MAX_BUCKETS}"}, status=400)
+
+        queryset = TrendRollup.objects.filter(owner=request.user, granularity=granularity)
+        if start is not None:
+            queryset = queryset.filter(bucket_start__gte=start)
+        if end is not None:
+            queryset = queryset.filter(bucket_start__lt=end)
+        rollups = reversed(queryset.order_by('-bucket_start')[:limit])
+
+        results = []
+        for rollup in rollups:
+            item = {
+                'bucket_start': rollup.bucket_start,
+                'datasets': rollup.datasets,
+                'total_equipment': rollup.equipment,
+            }
+            for col, key in SUMMARY_KEYS.items():
+                prefix = col.lower()
+                count = getattr(rollup, f'{prefix}_count')
+                item[key] = round(getattr(rollup, f'{prefix}_sum') / count, 2) if count else None
+            results.append(item)
+        return Response(results)
+
+
+class DatasetAnalysisView(APIView):
+    permission_classes = [IsAuthenticated]
+    """
+    Re-analyze a dataset's stored rows without re-uploading it.
+
+    Query params: percentiles (comma-separated, default 5,25,50,75,95) and
+    type (limit to one equipment type). Returns per-column count, mean,
+    std, min, max and percentiles, plus the same broken down by type.
+    """
+
+    def get(self, request, dataset_id):
+        try:
+            dataset = _owned_datasets(request).get(id=dataset_id)
+        except Dataset.DoesNotExist:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        store = open_rows(dataset)
+        if store is None:
+            return Response({"error": "Rows were not stored for this dataset"}, status=409)
+
+        try:
+            raw = request.query_params.get('percentiles')
+            percentiles = [float(p) for p in raw.split(',')] if raw else list(DEFAULT_PERCENTILES)
+        except ValueError:
+            return Response({"error": "percentiles must be comma-separated numbers"}, status=400)
+        if not percentiles or not all(0 <= p <= 100 for p in percentiles):
+            return Response({"error": "percentiles must be between 0 and 100"}, status=400)
+
+        eq_type = request.query_params.get('type')
+        types = [eq_type] if eq_type else store.types
+        return Response({
+            'dataset': dataset.id,
+            'rows': store.rows,
+            'columns': describe_rows(store, percentiles, eq_type),
+            'by_type': {t: describe_rows(store, percentiles, t) for t in types},
+        })
+
+
+EQUIPMENT_ORDERING = ('id', 'name', 'equipment_type', 'flowrate', 'pressure', 'temperature')
+
+
+def _equipment_after(field, descending, value, last_id):
+    """Rows after (value, last_id) in ORDER BY field NULLS LAST, id"""
+    id_after = Q(id__lt=last_id) if descending else Q(id__gt=last_id)
+    if value is None:
+        return Q(**{f'{field}__isnull': True}) & id_after
+    beyond = Q(**{f'{field}__lt' if descending else f'{field}__gt': value})
+    return beyond | (Q(**{field: value}) & id_after) | Q(**{f'{field}__isnull': True})
+
+
+class DatasetEquipmentView(APIView):
+    permission_classes = [IsAuthenticated]
+    """
+    Individual equipment rows of a dataset, filtered and sorted in SQL.
+
+    Query params: type, {flowrate,pressure,temperature}_{min,max}
+    (inclusive ranges), ordering (one of EQUIPMENT_ORDERING, '-' for
+    descending, default id), limit and cursor. Pages are keyset-paginated;
+    the next page is advertised in a Link header.
+    """
+
+    def get(self, request, dataset_id):
+        if not _owned_datasets(request).filter(id=dataset_id).exists():
+            return Response({"error": "Dataset not found"}, status=404)
+
+        params = request.query_params
+        ordering = params.get('ordering', 'id')
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        if field not in EQUIPMENT_ORDERING:
+            return Response({"error": f"ordering must be one of {', '.join(EQUIPMENT_ORDERING)}"}, status=400)
+
+        queryset = EquipmentRow.objects.filter(dataset_id=dataset_id)
+        if params.get('type'):
+            queryset = queryset.filter(equipment_type=params['type'])
+        try:
+            limit = int(params.get('limit', 50))
+            for col in NUMERIC_COLUMNS:
+                prefix = col.lower()
+                if params.get(f'{prefix}_min'):
+                    queryset = queryset.filter(**{f'{prefix}__gte': float(params[f'{prefix}_min'])})
+                if params.get(f'{prefix}_max'):
+                    queryset = queryset.filter(**{f'{prefix}__lte': float(params[f'{prefix}_max'])})
+            if params.get('cursor'):
+                # "<last id>" when ordering by id, else "<last value>,<last id>"
+                if field == 'id':
+                    last_value, last_id = None, int(params['cursor'])
+                else:
+                    last_value, last_id = params['cursor'].rsplit(',', 1)
+                    last_id = int(last_id)
+                    if last_value == '':
+                        last_value = None
+                    elif field not in ('name', 'equipment_type'):
+                        last_value = float(last_value)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        if not 1 <= limit <= settings.EQUIPMENT_MAX_LIMIT:
+            return Response({"error": f"limit must be between 1 and {settings.EQUIPMENT_MAX_LIMIT}"}, status=400)
+
+        if field == 'id':
+            queryset = queryset.order_by('-id' if descending else 'id')
+            if params.get('cursor'):
+                queryset = queryset.filter(id__lt=last_id) if descending else queryset.filter(id__gt=last_id)
+        else:
+            order = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+            queryset = queryset.order_by(order, '-id' if descending else 'id')
+            if params.get('cursor'):
+                queryset = queryset.filter(_equipment_after(field, descending, last_value, last_id))
+
+        rows = list(queryset.values(
+            'id', 'name', 'equipment_type', 'flowrate', 'pressure', 'temperature'
+        )[:limit + 1])
+        results = [
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'type': row['equipment_type'],
+                'flowrate': row['flowrate'],
+                'pressure': row['pressure'],
+                'temperature': row['temperature'],
+            }
+            for row in rows[:limit]
+        ]
+
+        response = Response(results)
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_params = params.copy()
+            if field == 'id':
+                next_params['cursor'] = last['id']
+            else:
+                value = last[field]
+                next_params['cursor'] = f"{'' if value is None else value},{last['id']}"
+            next_url = request.build_absolute_uri(f"{request.path}?{next_params.urlencode()}")
+            response['Link'] = f'<{next_url}>; rel="next"'
+        return response
+
+
+class DatasetAnomaliesView(APIView):
+    permission_classes = [IsAuthenticated]
+    """
+    Equipment flagged by the anomaly stage, in row order.
+
+    Flags are recomputed from the per-type bounds saved in the summary
+    over the memory-mapped rows (the bounds from before the latest append
+    while its background refresh runs, with the summary marked stale). Query params: column (only rows flagged
+    in that column), type, limit and cursor (row number to continue
+    after); the next page is advertised in a Link header.
+    """
+
+    def get(self, request, dataset_id):
+        try:
+            dataset = _owned_datasets(request).get(id=dataset_id)
+        except Dataset.DoesNotExist:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        store = open_rows(dataset)
+        anomalies = dataset.summary.get('anomalies')
+        if store is None or anomalies is None:
+            return Response({"error": "Anomaly detection did not run for this dataset"}, status=409)
+
+        params = request.query_params
+        column = params.get('column')
+        if column and column not in NUMERIC_COLUMNS:
+            return Response({"error": f"column must be one of {', '.join(NUMERIC_COLUMNS)}"}, status=400)
+        try:
+            limit = int(params.get('limit', 50))
+            cursor = int(params['cursor']) if params.get('cursor') else -1
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        if not 1 <= limit <= settings.EQUIPMENT_MAX_LIMIT:
+            return Response({"error": f"limit must be between 1 and {settings.EQUIPMENT_MAX_LIMIT}"}, status=400)
+
+        flags = anomaly_mask(store, anomalies['bounds'])
+        mask = flags[column] if column else np.logical_or.reduce(list(flags.values()))
+        if params.get('type'):
+            mask &= store.type_mask(params['type'])
+        positions = np.flatnonzero(mask)
+        positions = positions[positions > cursor][:limit + 1]
+        page = positions[:limit]
+
+        types = store.types
+        codes = np.asarray(store.type_codes())[page]
+        values = {col: np.asarray(store.column(col))[page] for col in NUMERIC_COLUMNS}
+        results = []
+        for i, (row, name) in enumerate(zip(page.tolist(), store.names(page))):
+            item = {'row': row, 'name': name, 'type': types[codes[i]] if codes[i] >= 0 else None}
+            for col in NUMERIC_COLUMNS:
+                value = values[col][i]
+                item[col.lower()] = None if np.isnan(value) else float(value)
+            item['flagged'] = [col for col in NUMERIC_COLUMNS if flags[col][row]]
+            results.append(item)
+
+        response = Response(results)
+        if len(positions) > limit:
+            next_params = params.copy()
+            next_params['cursor'] = int(page[-1])
+            next_url = request.build_absolute_uri(f"{request.path}?{next_params.urlencode()}")
+            response['Link'] = f'<{next_url}>; rel="next"'
         return response
 
+
+class TrendChartView(TrendsView):
+    """The /api/trends/ series rendered as a PNG or SVG line chart (same query params)"""
+
+    def get(self, request, fmt):
+        if fmt not in CHART_FORMATS:
+            return Response({"error": "Unknown chart"}, status=404)
+        response = super().get(request)
+        if response.status_code != 200:
+            return response
+        buckets = [
+            {**bucket, 'bucket_start': bucket['bucket_start'].isoformat()} for bucket in response.data
+        ]
+        plot, _ = TRENDS_CHART
+        return _chart_response(request, 'trends', request.query_params.get('bucket', 'day'), plot, buckets, fmt)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+    """Request latency histograms of this worker in the Prometheus text format"""
+
+    def get(self, request):
+        return HttpResponse(metrics_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,5 +1,6 @@
 import sys
 import os
+import time
 import requests
 import json
 import pandas as pd
@@ -9,13 +10,17 @@ from PyQt5.QtWidgets import (
     QHeaderView, QMessageBox, QFrame, QScrollArea, QStackedWidget,
     QLineEdit, QGridLayout, QSizePolicy
 )
-from PyQt5.QtCore import Qt, QSize, pyqtSignal
+from PyQt5.QtCore import Qt, QSize, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QIcon, QColor, QPalette, QLinearGradient, QBrush
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
 API_BASE_URL = "https://chem-backend-2.onrender.com/api"
+# Upload job polling: first delay and cap in ms, and seconds before giving up
+JOB_POLL_DELAY_MS = 1000
+JOB_POLL_MAX_DELAY_MS = 10000
+JOB_POLL_DEADLINE = 30 * 60
 
 class ChartCanvas(FigureCanvas):
     def __init__(self, parent=None, width=5, height=4, dpi=100):
@@ -182,6 +187,7 @@ class DesktopApp(QMainWindow):
         super().__init__()
         self.token = None
         self.username = None
+        self.history_etag = None
         
         self.setWindowTitle("Chemical Visualizer Dashboard")
         self.setMinimumSize(1200, 800)
@@ -323,7 +329,7 @@ class DesktopApp(QMainWindow):
         self.canvas_trends = ChartCanvas(self)
         
         charts_layout.addWidget(self.wrap_canvas(self.canvas_types, "Equipment Type Distribution"), 0, 0)
-        charts_layout.addWidget(self.wrap_canvas(self.canvas_trends, "Parameter Trends (Latest)"), 0, 1)
+        charts_layout.addWidget(self.wrap_canvas(self.canvas_trends, "Parameter Trends (Daily)"), 0, 1)
 
         charts_scroll.setWidget(charts_content)
         layout.addWidget(charts_scroll)
@@ -413,38 +419,85 @@ class DesktopApp(QMainWindow):
             
         try:
             self.status_label.setText("🚀 Uploading...")
+            self.upload_btn.setEnabled(False)
             with open(file_path, 'rb') as f:
                 files = {'file': f}
-                response = requests.post(f"{API_BASE_URL}/upload/", files=files, headers=self.get_headers())
+                # Ask for a background job so large files don't block the UI
+                response = requests.post(f"{API_BASE_URL}/upload/?async=1", files=files, headers=self.get_headers())
             
+            if response.status_code == 202:
+                self.status_label.setText("⏳ Processing...")
+                job_id = response.json()['id']
+                deadline = time.monotonic() + JOB_POLL_DEADLINE
+                QTimer.singleShot(JOB_POLL_DELAY_MS, lambda: self.poll_upload_job(job_id, deadline, JOB_POLL_DELAY_MS))
+                return
             if response.status_code == 200:
-                QMessageBox.information(self, "Success", "File analyzed successfully!")
-                self.refresh_data()
-                self.switch_page(0)
+                self.upload_finished()
             else:
                 QMessageBox.warning(self, "Error", f"Upload failed: {response.text}")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Request failed: {str(e)}")
-        finally:
-            self.status_label.setText("")
+        self.status_label.setText("")
+        self.upload_btn.setEnabled(True)
+
+    def poll_upload_job(self, job_id, deadline, delay):
+        try:
+            response = requests.get(f"{API_BASE_URL}/jobs/{job_id}/", headers=self.get_headers(), timeout=10)
+            job = response.json() if response.status_code == 200 else {'status': 'failed', 'error': response.text}
+        except Exception as e:
+            job = {'status': 'failed', 'error': str(e)}
+
+        status = job.get('status')
+        if status in ('pending', 'running') and time.monotonic() >= deadline:
+            status = 'failed'
+            job['error'] = (
+                f"still {job['status']} after {JOB_POLL_DEADLINE // 60} minutes. "
+                "It may finish later and appear in the history; otherwise upload the file again."
+            )
+        if status in ('pending', 'running'):
+            self.status_label.setText(f"⏳ Processing... {job.get('progress', 0)}% ({job.get('rows_processed', 0):,} rows)")
+            # Back off, so a long job is not polled every second
+            delay = min(delay * 2, JOB_POLL_MAX_DELAY_MS)
+            QTimer.singleShot(delay, lambda: self.poll_upload_job(job_id, deadline, delay))
+            return
+
+        self.status_label.setText("")
+        self.upload_btn.setEnabled(True)
+        if status == 'done':
+            self.upload_finished()
+        else:
+            QMessageBox.warning(self, "Error", f"Upload failed: {job.get('error')}")
+
+    def upload_finished(self):
+        QMessageBox.information(self, "Success", "File analyzed successfully!")
+        self.refresh_data()
+        self.switch_page(0)
 
     def refresh_data(self):
         if not self.token: return
         try:
-            response = requests.get(f"{API_BASE_URL}/history/", headers=self.get_headers())
+            headers = self.get_headers()
+            if self.history_etag:
+                headers["If-None-Match"] = self.history_etag
+            response = requests.get(f"{API_BASE_URL}/history/", headers=headers)
+            # 304: nothing uploaded or removed since the table was filled
             if response.status_code == 200:
+                self.history_etag = response.headers.get("ETag")
                 data = response.json()
                 self.update_table(data)
                 if data:
                     self.update_dashboard(data[0])
+            response = requests.get(f"{API_BASE_URL}/trends/", params={"bucket": "day", "limit": 30}, headers=self.get_headers())
+            if response.status_code == 200:
+                self.update_trends(response.json())
         except Exception as e:
             print(f"Failed to fetch history: {e}")
 
     def update_table(self, data):
         self.table.setRowCount(len(data))
         for row, item in enumerate(data):
-            real_id = len(data) - row # Simplified ID for display
-            self.table.setItem(row, 0, QTableWidgetItem(f"D-{real_id}"))
+            ds_id = item['id']
+            self.table.setItem(row, 0, QTableWidgetItem(f"D-{ds_id}"))
             self.table.setItem(row, 1, QTableWidgetItem(str(item.get('total_equipment', '0'))))
             self.table.setItem(row, 2, QTableWidgetItem(str(item.get('avg_flowrate', '0'))))
             self.table.setItem(row, 3, QTableWidgetItem(str(item.get('avg_pressure', '0'))))
@@ -453,8 +506,6 @@ class DesktopApp(QMainWindow):
             # Action button for PDF
             btn = QPushButton("📥 PDF")
             btn.setStyleSheet("background: #67c23a; color: white; padding: 4px; border-radius: 4px;")
-            # Capture actual dataset ID if available, otherwise use display ID
-            ds_id = item.get('id', real_id) 
             btn.clicked.connect(lambda checked, i=ds_id: self.download_pdf(i))
             self.table.setCellWidget(row, 5, btn)
 
@@ -491,20 +542,30 @@ class DesktopApp(QMainWindow):
             self.canvas_types.axes.set_ylabel("Count")
             self.canvas_types.draw()
 
-        # Update Trends Chart (Mock trends or real comparisons if available)
+    def update_trends(self, buckets):
+        # Daily averages across all uploads, served from server-side rollups
         self.canvas_trends.axes.clear()
-        metrics = ["Flow", "Press", "Temp"]
-        values = [
-            latest_data.get('avg_flowrate', 0),
-            latest_data.get('avg_pressure', 0),
-            latest_data.get('avg_temperature', 0)
-        ]
-        self.canvas_trends.axes.plot(metrics, values, marker='o', linestyle='-', color='#409eff', linewidth=2)
-        self.canvas_trends.axes.fill_between(metrics, values, color='#409eff', alpha=0.1)
+        if buckets:
+            labels = [b['bucket_start'][:10] for b in buckets]
+            series = [
+                ("Flow", 'avg_flowrate', '#409eff'),
+                ("Press", 'avg_pressure', '#67c23a'),
+                ("Temp", 'avg_temperature', '#f56c6c'),
+            ]
+            for name, key, color in series:
+                values = [b.get(key) for b in buckets]
+                self.canvas_trends.axes.plot(labels, values, marker='o', linestyle='-', color=color, linewidth=2, label=name)
+            self.canvas_trends.axes.legend()
+            self.canvas_trends.axes.tick_params(axis='x', labelrotation=45)
         self.canvas_trends.draw()
 
     def handle_logout(self):
+        try:
+            requests.post(f"{API_BASE_URL}/logout/", headers=self.get_headers(), timeout=5)
+        except requests.RequestException:
+            pass  # the token expires on its own
         self.token = None
+        self.history_etag = None
         self.hide()
         self.login_dialog.show()
 
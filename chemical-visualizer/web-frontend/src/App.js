@@ -7,6 +7,7 @@ import Upload from "./Upload";
 import Charts from "./Charts";
 import Table from "./Table";
 import Auth from "./Auth";
+import { logoutUser } from "./api";
 import "./App.css";
 
 function AppContent() {
@@ -23,6 +24,8 @@ function AppContent() {
   };
 
   const handleLogout = () => {
+    // Best effort: the token also expires on its own
+    logoutUser(user.token).catch(() => {});
     localStorage.removeItem('token');
     localStorage.removeItem('username');
     setUser(null);
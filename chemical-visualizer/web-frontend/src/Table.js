@@ -24,10 +24,7 @@ export default function Table() {
     };
 
     const handleDownloadPDF = async (datasetIndex) => {
-        // In the current backend, dataset IDs are auto-incremented
-        // We need to calculate the ID based on history position
-        // The most recent upload has the highest ID
-        const datasetId = historyData.length - datasetIndex;
+        const datasetId = historyData[datasetIndex].id;
 
         setDownloading(datasetIndex);
         try {
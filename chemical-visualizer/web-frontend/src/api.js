@@ -71,4 +71,9 @@ export const loginUser = async (username, password) => {
     return response.data;
 };
 
+// Logout user, revoking their token (passed in: it may already be cleared from storage)
+export const logoutUser = async (token) => {
+    await api.post('/logout/', null, { headers: { Authorization: `Token ${token}` } });
+};
+
 export default api;